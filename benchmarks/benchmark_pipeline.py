@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+    Benchmarks for the heart_rate signal pipeline.
+
+    Synthetic videos with a known pulse frequency are generated for a range of resolutions, lengths and fps.
+    For each of them, every stage of the pipeline is timed (video loading, signal creation, FFT, filtering
+    and the end to end measure), reporting throughput (frames per second), peak RSS and accuracy.
+    Each case runs in a fresh process, so peak RSS values are not polluted by previous cases.
+
+    Usage:
+        $ python benchmarks/benchmark_pipeline.py
+        $ python benchmarks/benchmark_pipeline.py --quick --json bench_output.json
+"""
+from __future__ import print_function, absolute_import, division
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import timeit
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from heart_rate import fft, heart_rate_utils, video_utils  # noqa: E402
+
+RESOLUTIONS = [(160, 120), (640, 480), (1280, 720)]
+LENGTHS = [256, 1000, 4096]
+FPS = [30.0, 60.0]
+QUICK_RESOLUTIONS = [(160, 120), (640, 480)]
+QUICK_LENGTHS = [256, 1000]
+QUICK_FPS = [30.0]
+
+PULSE_BPM = 72.0
+MIN_FREQ = 0.4
+MAX_FREQ = 7.0
+REPEATS = 5
+
+
+def parse_args(args):
+    """Parse command line parameters
+
+    Args:
+      args ([str]): command line parameters as list of strings
+
+    Returns:
+      :obj:`argparse.Namespace`: command line parameters namespace
+    """
+    parser = argparse.ArgumentParser(description="Heart Rate pipeline benchmarks")
+    parser.add_argument(
+        '--quick',
+        dest="quick",
+        help="Run a reduced set of cases.",
+        action='store_true')
+    parser.add_argument(
+        '--json',
+        dest="json_path",
+        help="Dump the results as JSON to the given path.",
+        action='store',
+        type=str)
+    parser.add_argument(
+        '--pulse',
+        dest="pulse",
+        help="Set the pulse (in beats per minute) of the synthetic videos.",
+        action='store',
+        type=float)
+    parser.set_defaults(pulse=PULSE_BPM)
+    return parser.parse_args(args)
+
+
+def generate_video(path, width, height, length, fps, pulse):
+    """ Writes a synthetic video, in which the ROI brightness oscillates at the given pulse, plus noise.
+
+    Args:
+        path (str): The path of the video to write.
+        width (int): The video width.
+        height (int): The video height.
+        length (int): The amount of frames.
+        fps (float): The amount of frames per second.
+        pulse (float): The pulse, in beats per minute.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    random_state = np.random.RandomState(0)
+    for i in range(length):
+        value = 3.0 * np.sin(2 * np.pi * pulse / 60.0 * i / fps)
+        frame = np.clip(128 + value + random_state.normal(0, 2, (height, width, 3)), 0, 255).astype(np.uint8)
+        writer.write(frame)
+    writer.release()
+
+
+def best_time(function, repeats=REPEATS):
+    """ Times the given function, returning the best of the given amount of runs.
+
+    Args:
+        function (function): The function to time.
+        repeats (int): The amount of runs.
+    Returns:
+        float: The best time, in seconds.
+    """
+    return min(timeit.repeat(function, number=1, repeat=repeats))
+
+
+def run_case(case):
+    """ Runs the benchmarks of one case. This is executed in a fresh process.
+
+    Args:
+        case (dict): The case (with 'path', 'width', 'height', 'length', 'fps' and 'pulse' keys).
+    Returns:
+        dict: The case, plus the time of each stage, throughput, peak RSS and accuracy.
+    """
+    width, height, length = case['width'], case['height'], case['length']
+    roi = (height // 4, 3 * height // 4, width // 4, 3 * width // 4)
+    results = dict(case)
+
+    results['measure'] = best_time(lambda: heart_rate_utils.measure(video_utils.Video(case['path'], streaming=True),
+                                                                    roi, MIN_FREQ, MAX_FREQ, use_all_frames=True),
+                                   repeats=1)
+    bpm = heart_rate_utils.measure(video_utils.Video(case['path'], streaming=True), roi, MIN_FREQ, MAX_FREQ,
+                                   use_all_frames=True)
+    results['bpm'] = bpm
+    results['error_bpm'] = abs(bpm - case['pulse'])
+    results['streaming_rss_mb'] = _peak_rss_mb()
+
+    results['load'] = best_time(lambda: video_utils.Video(case['path']), repeats=1)
+    video = video_utils.Video(case['path'])
+    results['create_signal'] = best_time(lambda: heart_rate_utils._create_signal(video.g, roi, height, width))
+    signal = heart_rate_utils._create_signal(video.g, roi, height, width)
+    results['fft'] = best_time(lambda: fft.fft(signal))
+    results['rfft'] = best_time(lambda: fft.rfft(signal))
+    spectrum = heart_rate_utils._process_signal(signal)
+    bandpass_filter = heart_rate_utils._get_bandpass_filter(signal.shape[-1], case['fps'], MIN_FREQ, MAX_FREQ)
+    results['filter'] = best_time(lambda: heart_rate_utils._filter_signal(spectrum, [bandpass_filter]))
+    results['loaded_rss_mb'] = _peak_rss_mb()
+
+    for stage in ('measure', 'load', 'create_signal'):
+        results[stage + '_fps'] = length / results[stage]
+    return results
+
+
+def _peak_rss_mb():
+    """
+    Returns:
+        float: The peak resident set size of this process so far, in megabytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0  # Bytes in macOS, else kilobytes
+
+
+def print_results(results):
+    """ Prints the given results as a table.
+
+    Args:
+        results (list): The results of each case.
+    """
+    header = "{:>10} {:>6} {:>5} | {:>9} {:>9} {:>9} | {:>8} {:>8} {:>8} | {:>7} {:>7} | {:>6}"
+    row = "{:>10} {:>6} {:>5} | {:>9.0f} {:>9.0f} {:>9.0f} | {:>8.1f} {:>8.1f} {:>8.1f} | {:>7.0f} {:>7.0f} | {:>6.2f}"
+    print(header.format('resolution', 'frames', 'fps', 'measure/s', 'load/s', 'signal/s',
+                        'fft us', 'rfft us', 'filter us', 'strm MB', 'load MB', 'err'))
+    for result in results:
+        print(row.format('{}x{}'.format(result['width'], result['height']), result['length'], int(result['fps']),
+                         result['measure_fps'], result['load_fps'], result['create_signal_fps'],
+                         result['fft'] * 1e6, result['rfft'] * 1e6, result['filter'] * 1e6,
+                         result['streaming_rss_mb'], result['loaded_rss_mb'], result['error_bpm']))
+
+
+def main(args):
+    """Main entry point allowing external calls
+
+    Args:
+      args ([str]): command line parameter list
+    """
+    args = parse_args(args)
+    resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+    lengths = QUICK_LENGTHS if args.quick else LENGTHS
+    frame_rates = QUICK_FPS if args.quick else FPS
+
+    directory = tempfile.mkdtemp(prefix='heart_rate_benchmarks_')
+    try:
+        cases = []
+        for width, height in resolutions:
+            for length in lengths:
+                for fps in frame_rates:
+                    path = os.path.join(directory, '{}x{}_{}_{}.avi'.format(width, height, length, int(fps)))
+                    generate_video(path, width, height, length, fps, args.pulse)
+                    cases.append({'path': path, 'width': width, 'height': height, 'length': length, 'fps': fps,
+                                  'pulse': args.pulse})
+
+        results = []
+        for case in cases:
+            pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+            try:
+                results.append(pool.apply(run_case, (case,)))
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        shutil.rmtree(directory)
+
+    print_results(results)
+    if args.json_path is not None:
+        with open(args.json_path, 'w') as json_file:
+            json.dump([dict(result, path=os.path.basename(result['path'])) for result in results], json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
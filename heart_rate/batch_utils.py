@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+""" Batch processing utilities module
+This module is in charge of providing utilities for measuring heart beat rates of many videos in parallel.
+"""
+import csv
+import glob
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fft
+import heart_rate_utils
+import video_utils
+
+_logger = logging.getLogger(__name__)
+
+_GLOB_CHARACTERS = '*?['
+
+_RESULT_FIELDS = ['path', 'bpm', 'error']
+
+
+def collect_paths(spec):
+    """ Collects the paths of the videos to be processed.
+
+    Params:
+        spec (str): A directory (all its files are collected), a glob pattern (all matching files are collected),
+                    or a manifest file (a file listing one path per line, ignoring blank lines and '#' comments).
+    Returns:
+        list: The collected paths.
+    Raises:
+        ValueError: If the spec is None, is not a string, or is an empty string.
+        IOError: If the spec is not a directory, a glob pattern or a file.
+    """
+    if spec is None or not isinstance(spec, str) or not spec:
+        _logger.debug("The given batch spec is not valid")
+        raise ValueError("None, non string or empty string batch spec")
+
+    if os.path.isdir(spec):
+        _logger.debug("Collecting files in directory '{}'".format(spec))
+        paths = [os.path.join(spec, name) for name in sorted(os.listdir(spec)) if not name.startswith('.')]
+        return [path for path in paths if os.path.isfile(path)]
+    if any(character in spec for character in _GLOB_CHARACTERS):
+        _logger.debug("Collecting files matching '{}'".format(spec))
+        return [path for path in sorted(glob.glob(spec)) if os.path.isfile(path)]
+    if os.path.isfile(spec):
+        _logger.debug("Collecting files listed in manifest '{}'".format(spec))
+        with open(spec) as manifest:
+            lines = [line.strip() for line in manifest]
+        return [line for line in lines if line and not line.startswith('#')]
+
+    _logger.debug("The given batch spec is not a directory, a glob pattern or a file")
+    raise IOError("'{}' is not a directory, a glob pattern or a manifest file".format(spec))
+
+
+def measure_batch(paths, roi, min_freq, max_freq, channel='G', workers=None, decoding=None, **options):
+    """ Measures the heart beat rate of each of the given videos, distributing them among worker processes.
+    Each worker streams the video it is processing, so it only holds one video's working set at a time.
+    A failure measuring a video does not stop the batch: it is reported in the video's result.
+
+    Params:
+        paths (list): The paths to the videos to analyze.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the video signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the video signal.
+        channel (str): The channel to process.
+        workers (int): The amount of worker processes. If None, the amount of processors is used.
+        decoding (dict): Keyword arguments for video_utils.decoding_options ('channel', 'crop_margin' and 'stride'),
+                         resolved for each video. If None, whole frames are decoded.
+        options: Additional keyword arguments for heart_rate_utils.measure.
+    Returns:
+        generator: A generator of result dicts (with 'path', 'bpm' and 'error' keys), in completion order.
+    """
+    if paths is None or not isinstance(paths, list):
+        _logger.debug("The given paths are null or are not a list")
+        raise ValueError("The paths must be a non null list")
+    if workers is not None and (not isinstance(workers, int) or workers <= 0):
+        _logger.debug("Wrong amount of workers. Must be a positive integer")
+        raise ValueError("The amount of workers must be a positive integer")
+    return _measure_batch(paths, roi, min_freq, max_freq, channel, workers, decoding or {}, options)
+
+
+def _measure_batch(paths, roi, min_freq, max_freq, channel, workers, decoding, options):
+    """ Submits the measures of the given videos to a process pool, yielding results as they finish.
+    Note: We assume validations were already performed when execution of this method is reached.
+
+    Params:
+        See measure_batch.
+    Returns:
+        generator: A generator of result dicts, in completion order.
+    """
+    _logger.info("Measuring heart beat rate of {} videos...".format(len(paths)))
+    backend = fft.get_backend()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_measure_video, path, roi, min_freq, max_freq, channel, backend, decoding, options)
+                   for path in paths]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _measure_video(path, roi, min_freq, max_freq, channel, backend, decoding, options):
+    """ Measures the heart beat rate of the given video. This is executed by worker processes.
+
+    Params:
+        path (str): The path to the video to analyze.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the video signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the video signal.
+        channel (str): The channel to process.
+        backend (str): The FFT backend to use.
+        decoding (dict): Keyword arguments for video_utils.decoding_options.
+        options (dict): Additional keyword arguments for heart_rate_utils.measure.
+    Returns:
+        dict: The result, with 'path', 'bpm' and 'error' keys.
+    """
+    # noinspection PyBroadException
+    try:
+        fft.set_backend(backend)
+        video = video_utils.Video(path, streaming=True,
+                                  **video_utils.decoding_options(path, roi, max_freq=max_freq, **decoding))
+        bpm = heart_rate_utils.measure(video, roi, min_freq, max_freq, channel, **options)
+        return {'path': path, 'bpm': bpm, 'error': None}
+    except Exception as e:
+        return {'path': path, 'bpm': None, 'error': str(e) or e.__class__.__name__}
+
+
+class ResultWriter:
+    """ Class that writes batch results to a stream as they arrive, in CSV or JSON lines format.
+    """
+
+    FORMATS = ['csv', 'jsonl']
+
+    def __init__(self, stream, output_format='csv'):
+        """ Creates a new ResultWriter instance.
+
+        Args:
+            stream (file): The stream to write to.
+            output_format (str): The output format. Must be one of ResultWriter.FORMATS.
+        Returns:
+            A new ResultWriter instance.
+        Raises:
+            ValueError: If the output format is not valid.
+        """
+        if output_format not in self.FORMATS:
+            _logger.debug("Wrong output format. Must be one of {}, but was {}".format(self.FORMATS, output_format))
+            raise ValueError("The output format was wrong. Must be one of {}".format(self.FORMATS))
+        self._stream = stream
+        self._csv_writer = None
+        if output_format == 'csv':
+            self._csv_writer = csv.DictWriter(stream, fieldnames=_RESULT_FIELDS)
+            self._csv_writer.writeheader()
+
+    def write(self, result):
+        """ Writes the given result, flushing the stream so it can be followed while the batch runs.
+
+        Args:
+            result (dict): The result to write.
+        """
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(result)
+        else:
+            self._stream.write(json.dumps(result) + '\n')
+        self._stream.flush()
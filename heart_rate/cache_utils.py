@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+""" Cache utilities module
+This module is in charge of providing utilities for caching signals extracted from videos on disk.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+_FINGERPRINT_CHUNK_SIZE = 1024 * 1024  # Amount of bytes hashed at the beginning and at the end of each video
+
+_DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class SignalCache:
+    """ Class representing a persistent cache of the per frame ROI means of videos (one row per B, G and R channel).
+    Entries are keyed by the video fingerprint (size, modification time and a hash of its content), the ROI,
+    and the decoding stride.
+    Signals are stored as .npy files, which are memory mapped when read.
+    When the cache exceeds its max. size, least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_bytes=_DEFAULT_MAX_BYTES):
+        """ Creates a new SignalCache instance.
+
+        Args:
+            directory (str): The directory where entries are stored. It is created if it does not exist.
+            max_bytes (int): The max. size (in bytes) of the stored signals.
+        Returns:
+            A new SignalCache instance.
+        Raises:
+            ValueError: If the given directory is None, is not a string, or is an empty string,
+                        or if max_bytes is not a positive integer.
+            IOError: If the given directory exists but is not a directory.
+        """
+        if directory is None or not isinstance(directory, str) or not directory:
+            _logger.debug("The given cache directory is not valid")
+            raise ValueError("None, non string or empty string cache directory")
+        if max_bytes is None or not isinstance(max_bytes, int) or max_bytes <= 0:
+            _logger.debug("The given cache max. size is not valid")
+            raise ValueError("The cache max. size must be a positive integer")
+        if not os.path.isdir(directory):
+            if os.path.exists(directory):
+                _logger.debug("The given cache directory is not a directory")
+                raise IOError("'{}' is not a directory".format(directory))
+            os.makedirs(directory)
+
+        self._directory = directory
+        self._max_bytes = max_bytes
+
+    def get(self, path_to_video, roi, stride=1):
+        """ Gets the signal of the given video and ROI, if it was cached.
+
+        Args:
+            path_to_video (str): The path to the video.
+            roi (tuple): The ROI from which the signal was extracted.
+            stride (int): The stride with which the video was decoded.
+        Returns:
+            tuple: The signal (a read-only memory mapped array with shape (3, length)) and the video fps,
+                   or None if there is no entry for the given video and ROI.
+        """
+        signal_path, metadata_path = self._entry_paths(path_to_video, roi, stride)
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+            signal = np.load(signal_path, mmap_mode='r')
+        except (IOError, OSError, ValueError):
+            _logger.debug("Cache miss for '{}' and ROI {}".format(path_to_video, roi))
+            return None
+
+        _logger.debug("Cache hit for '{}' and ROI {}".format(path_to_video, roi))
+        os.utime(signal_path, None)  # Mark as recently used
+        return signal, metadata['fps']
+
+    def put(self, path_to_video, roi, signal, fps, stride=1):
+        """ Stores the signal of the given video and ROI, evicting least recently used entries if necessary.
+
+        Args:
+            path_to_video (str): The path to the video.
+            roi (tuple): The ROI from which the signal was extracted.
+            signal (ndarray): The per frame ROI means, with shape (3, length).
+            fps (float): The video fps (considering the stride).
+            stride (int): The stride with which the video was decoded.
+        """
+        signal_path, metadata_path = self._entry_paths(path_to_video, roi, stride)
+        _logger.debug("Caching signal for '{}' and ROI {}".format(path_to_video, roi))
+        # Write into temporary files that are renamed at the end, so readers never see partial entries
+        metadata = {'fps': fps, 'roi': list(roi), 'stride': stride}
+        self._write_atomically(metadata_path, lambda f: f.write(json.dumps(metadata)))
+        self._write_atomically(signal_path, lambda f: np.save(f, np.asarray(signal, dtype=np.float64)))
+        self._evict()
+
+    def _entry_paths(self, path_to_video, roi, stride=1):
+        """ Gets the paths of the files of the entry for the given video, ROI and stride.
+
+        Args:
+            path_to_video (str): The path to the video.
+            roi (tuple): The ROI.
+            stride (int): The decoding stride.
+        Returns:
+            tuple: The signal file path, and the metadata file path.
+        """
+        key = repr(tuple(roi)) if stride == 1 else '{}/{}'.format(repr(tuple(roi)), stride)  # Keep old keys valid
+        key = hashlib.sha1(_fingerprint(path_to_video) + key).hexdigest()
+        return os.path.join(self._directory, key + '.npy'), os.path.join(self._directory, key + '.json')
+
+    def _write_atomically(self, path, write_function):
+        """ Writes a file by writing a temporary file in the same directory, and renaming it.
+
+        Args:
+            path (str): The path of the file to write.
+            write_function (function): A function that receives the opened file and writes it.
+        """
+        descriptor, temporary_path = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary_file:
+                write_function(temporary_file)
+            os.rename(temporary_path, path)
+        except Exception:
+            os.remove(temporary_path)
+            raise
+
+    def _evict(self):
+        """ Removes least recently used entries until the stored signals fit in the cache max. size.
+        """
+        entries = []
+        for name in os.listdir(self._directory):
+            if not name.endswith('.npy'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self._directory, name))
+            except OSError:
+                continue  # Removed by another process
+            entries.append((stat.st_mtime, stat.st_size, name[:-len('.npy')]))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total_bytes <= self._max_bytes:
+                break
+            _logger.debug("Evicting cache entry {}".format(key))
+            for extension in ('.npy', '.json'):
+                try:
+                    os.remove(os.path.join(self._directory, key + extension))
+                except OSError:
+                    pass  # Removed by another process
+            total_bytes -= size
+
+    @property
+    def directory(self):
+        """
+        Returns:
+            The directory where entries are stored.
+        """
+        return self._directory
+
+    @property
+    def max_bytes(self):
+        """
+        Returns:
+            The max. size (in bytes) of the stored signals.
+        """
+        return self._max_bytes
+
+
+def _fingerprint(path_to_video):
+    """ Calculates a fingerprint of the given video, made of its size, its modification time,
+    and a hash of its first and last bytes (so big videos are not read entirely).
+
+    Args:
+        path_to_video (str): The path to the video.
+    Returns:
+        str: The fingerprint.
+    """
+    stat = os.stat(path_to_video)
+    content_hash = hashlib.sha1()
+    with open(path_to_video, 'rb') as video_file:
+        content_hash.update(video_file.read(_FINGERPRINT_CHUNK_SIZE))
+        if stat.st_size > 2 * _FINGERPRINT_CHUNK_SIZE:
+            video_file.seek(-_FINGERPRINT_CHUNK_SIZE, os.SEEK_END)
+        content_hash.update(video_file.read())
+    return '{}:{}:{}'.format(stat.st_size, stat.st_mtime, content_hash.hexdigest())
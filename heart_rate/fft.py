@@ -3,52 +3,575 @@
 This module is in charge of providing utilities for computing FFTs.
 """
 import logging
+import threading
+from collections import OrderedDict
 
 import numpy as np
 
+try:
+    import scipy.fft as _scipy_fft  # pocketfft based
+except ImportError:
+    _scipy_fft = None
+
 _logger = logging.getLogger(__name__)
 
+PLANS_CACHE_SIZE = 32  # The default max. amount of cached plans (and of cached zoom FFT tables)
+
+_plans = OrderedDict()
+_zoom_cache = OrderedDict()
+_plans_cache_size = PLANS_CACHE_SIZE
+_plans_lock = threading.Lock()  # Plans can be requested by several threads (e.g a server worker pool)
+
+_backend = 'native'
+
 
-def fft(x):
+def fft(x, backend=None, axis=-1):
     """ Calculates the Fast Fourier Transform to the given series.
+    N-dimensional arrays are transformed along the given axis, transforming all the series at once.
     Params:
         x (array): The series to which the FFT must be computed.
+        backend (str): The name of the backend to use. If None, the one set with set_backend is used.
+        axis (int): The axis along which the FFT is computed.
     Returns:
         array: The computed FFT of the given series.
     """
     if x is None or not isinstance(x, np.ndarray):
         _logger.debug("The given series is null or is not a numpy array")
         raise ValueError("The series must be a non null numpy array")
-    # As we know its going to have a complex part, we need to specifically set the type to admit complex
-    x = np.asarray(x, dtype=np.complex)
-    n = len(x)
-    if n <= 1:
-        return x
+    return _along_axis(_BACKENDS[_get_backend_name(backend)]['fft'], x, axis)
+
+
+def rfft(x, backend=None, axis=-1):
+    """ Calculates the Fast Fourier Transform to the given real series, returning only non-negative frequency terms.
+    As the FFT of a real series is Hermitian-symmetric, negative frequency terms are redundant.
+    N-dimensional arrays are transformed along the given axis, transforming all the series at once.
+    Params:
+        x (array): The real series to which the FFT must be computed.
+        backend (str): The name of the backend to use. If None, the one set with set_backend is used.
+        axis (int): The axis along which the FFT is computed.
+    Returns:
+        array: The n // 2 + 1 non-negative frequency terms of the FFT of the given series.
+    """
+    if x is None or not isinstance(x, np.ndarray):
+        _logger.debug("The given series is null or is not a numpy array")
+        raise ValueError("The series must be a non null numpy array")
+    if np.iscomplexobj(x):
+        _logger.debug("The given series is not real")
+        raise ValueError("The series must be real")
+    return _along_axis(_BACKENDS[_get_backend_name(backend)]['rfft'], x, axis)
+
+
+def zoom_fft(x, min_freq, max_freq, m, fs=1.0, backend=None, axis=-1):
+    """ Calculates the spectrum of the given series only at m frequencies evenly spaced in [min_freq, max_freq],
+    using the chirp-z transform (computed as a convolution, like Bluestein's algorithm).
+    This gives a dense spectrum of a narrow band at the cost of an FFT of length n + m - 1 (rounded up to a power
+    of 2), instead of the huge zero-padded FFT that the same resolution would require.
+    Params:
+        x (array): The series (transformed along its last axis).
+        min_freq (float): The first frequency.
+        max_freq (float): The last frequency.
+        m (int): The amount of frequencies.
+        fs (float): The sampling rate of the series.
+        backend (str): The name of the backend used for the convolution. If None, the one set with set_backend is used.
+        axis (int): The axis along which the spectrum is computed.
+    Returns:
+        array: The spectrum at each frequency (see zoom_fftfreq).
+    """
+    if x is None or not isinstance(x, np.ndarray):
+        _logger.debug("The given series is null or is not a numpy array")
+        raise ValueError("The series must be a non null numpy array")
+    if m is None or not isinstance(m, int) or m <= 0:
+        _logger.debug("The given amount of frequencies is not a positive integer")
+        raise ValueError("The amount of frequencies must be a positive integer")
+    if fs is None or fs <= 0 or min_freq is None or max_freq is None or max_freq < min_freq:
+        _logger.debug("Wrong sampling rate, or min/max frequencies")
+        raise ValueError("The sampling rate must be positive, and the max. frequency not lower than the min. one")
+    transform = _BACKENDS[_get_backend_name(backend)]['fft']
+    return _along_axis(lambda series: _zoom_fft(series, min_freq, max_freq, m, fs, transform), x, axis)
+
+
+def _zoom_fft(x, min_freq, max_freq, m, fs, transform):
+    """ Calculates the zoom FFT of the given series along its last axis.
+    Note: We assume validations were already performed when execution of this method is reached.
+    Params:
+        See zoom_fft. The transform is the FFT function used for the convolution.
+    Returns:
+        array: The spectrum at each frequency.
+    """
+    n = x.shape[-1]
+    step = (max_freq - min_freq) / float(fs * (m - 1)) if m > 1 else 0.0  # In cycles per sample
+    pre_chirp, kernel_fft, post_chirp = _zoom_tables(n, m, min_freq / float(fs), step, transform)
+    length = kernel_fft.shape[-1]
+    padded = np.zeros(x.shape[:-1] + (length,), dtype=np.complex128)
+    padded[..., :n] = x * pre_chirp
+    product = transform(padded) * kernel_fft
+    convolution = np.conj(transform(np.conj(product))) / length  # Inverse FFT, using the forward transform
+    return convolution[..., :m] * post_chirp
+
+
+def zoom_fftfreq(min_freq, max_freq, m):
+    """ Calculates the frequencies at which zoom_fft evaluates the spectrum.
+    Params:
+        min_freq (float): The first frequency.
+        max_freq (float): The last frequency.
+        m (int): The amount of frequencies.
+    Returns:
+        array: The frequencies.
+    """
+    return np.linspace(min_freq, max_freq, m)
+
+
+def _zoom_tables(n, m, start, step, transform):
+    """ Gets the chirps and the transformed convolution kernel of the chirp-z transform.
+    Tables are cached like plans (see plan), as frequencies can be different in each request of a long-lived process.
+    Using nk = (n^2 + k^2 - (k - n)^2) / 2, the transform at frequency start + k * step (in cycles per sample) is
+    post_chirp[k] * sum_n(x[n] * pre_chirp[n] * kernel[k - n]), a convolution computed with FFTs.
+    Params:
+        n (int): The series length.
+        m (int): The amount of frequencies.
+        start (float): The first frequency, in cycles per sample.
+        step (float): The spacing between frequencies, in cycles per sample.
+        transform (function): The FFT function used to transform the kernel.
+    Returns:
+        tuple: The pre-chirp (length n), the FFT of the kernel, and the post-chirp (length m).
+    """
+    key = (n, m, start, step, transform)
+    with _plans_lock:
+        tables = _zoom_cache.pop(key, None)
+        if tables is not None:
+            _zoom_cache[key] = tables  # Mark as recently used
+            return tables
+    length = 2 ** int(np.ceil(np.log2(n + m - 1)))
+    samples = np.arange(max(n, m), dtype=np.float64)
+    chirp = np.exp(-1j * np.pi * step * samples * samples)
+    pre_chirp = np.exp(-2j * np.pi * start * samples[:n]) * chirp[:n]
+    kernel = np.zeros(length, dtype=np.complex128)
+    kernel[:m] = np.conj(chirp[:m])
+    kernel[length - n + 1:] = np.conj(chirp[1:n][::-1])  # Negative lags
+    tables = (pre_chirp, transform(kernel), chirp[:m])  # Transformed outside the lock, as it gets a plan
+    with _plans_lock:
+        _zoom_cache[key] = tables
+        while len(_zoom_cache) > _plans_cache_size:
+            _zoom_cache.popitem(last=False)
+    return tables
+
+
+def set_backend(name):
+    """ Sets the backend used by default to compute FFTs.
+    Params:
+        name (str): The name of the backend. Must be one of available_backends().
+    """
+    global _backend
+    _backend = _get_backend_name(name)
+    _logger.debug("Using '{}' FFT backend".format(_backend))
+
+
+def get_backend():
+    """
+    Returns:
+        str: The name of the backend used by default to compute FFTs.
+    """
+    return _backend
+
+
+def available_backends():
+    """
+    Returns:
+        list: The names of the backends that can be used in this environment.
+    """
+    return sorted(_BACKENDS.keys())
+
+
+def _get_backend_name(name):
+    """ Resolves the given backend name, falling back to the default backend if it is None.
+    Params:
+        name (str): The backend name, or None.
+    Returns:
+        str: The resolved backend name.
+    """
+    if name is None:
+        return _backend
+    if name not in _BACKENDS:
+        _logger.debug("Unknown FFT backend '{}'. Available backends are {}".format(name, available_backends()))
+        raise ValueError("Unknown FFT backend. Must be one of {}".format(available_backends()))
+    return name
+
+
+def plan(n, dtype=np.complex128):
+    """ Gets a plan for computing FFTs of series of the given length and dtype.
+    Plans are cached by length and dtype (at most PLANS_CACHE_SIZE of them, evicting the least recently used one),
+    so their tables are only computed once for the few lengths videos come in.
+    Params:
+        n (int): The series length.
+        dtype (dtype): The dtype of the series. Plans for real dtypes compute the FFT of real series
+                       (i.e its n // 2 + 1 non-negative frequency terms, like rfft),
+                       and plans for complex dtypes compute the whole FFT.
+                       Single precision dtypes give single precision transforms.
+    Returns:
+        Plan: The plan.
+    Raises:
+        ValueError: If the length is not a positive integer, or if the dtype is not a floating point or complex one.
+    """
+    if n is None or not isinstance(n, (int, long)) or n <= 0:
+        _logger.debug("The given plan length is not a positive integer")
+        raise ValueError("The plan length must be a positive integer")
+    dtype = np.dtype(dtype)
+    if dtype.kind not in ('f', 'c'):
+        _logger.debug("The given plan dtype is not a floating point or complex dtype")
+        raise ValueError("The plan dtype must be a floating point or complex dtype")
+    key = (int(n), dtype)
+    with _plans_lock:
+        fft_plan = _plans.pop(key, None)
+        if fft_plan is not None:
+            _plans[key] = fft_plan  # Mark as recently used
+            return fft_plan
+    fft_plan = Plan(int(n), dtype)  # Created outside the lock, as plans get the plans they are built on
+    with _plans_lock:
+        _plans[key] = fft_plan
+        while len(_plans) > _plans_cache_size:
+            _plans.popitem(last=False)
+    return fft_plan
+
+
+def set_plan_cache_size(size):
+    """ Sets the max. amount of plans (and of zoom FFT tables) that are cached
+    (least recently used ones are evicted first).
+    Params:
+        size (int): The max. amount of cached plans.
+    Raises:
+        ValueError: If the size is not a positive integer.
+    """
+    global _plans_cache_size
+    if size is None or not isinstance(size, int) or size <= 0:
+        _logger.debug("The given plan cache size is not a positive integer")
+        raise ValueError("The plan cache size must be a positive integer")
+    with _plans_lock:
+        _plans_cache_size = size
+        for cache in (_plans, _zoom_cache):
+            while len(cache) > _plans_cache_size:
+                cache.popitem(last=False)
+
+
+class Plan:
+    """ Class representing a precomputed FFT of series of a fixed length, computed with this module's implementation.
+    Twiddle factors, bit-reversal permutations and chirps are computed when the plan is created, and the scratch
+    buffers of each thread are kept between executions, so executing a plan with a preallocated output buffer on
+    series of the same shape does not allocate.
+    Lengths that are a power of 2 use the radix-2 algorithm, and any other length uses Bluestein's algorithm.
+    Real series of even length are packed into a complex series of half the length (even samples as the real part,
+    and odd samples as the imaginary part), so the transform costs about half the one of a complex series.
+    Plans can be shared by several threads.
+    """
+
+    def __init__(self, n, dtype=np.complex128):
+        """ Creates a new Plan instance. Use plan to get cached plans instead.
+
+        Args:
+            n (int): The series length.
+            dtype (dtype): The dtype of the series (see plan).
+        Returns:
+            A new Plan instance.
+        """
+        self._n = n
+        self._dtype = np.dtype(dtype)
+        self._output_dtype = np.result_type(self._dtype, np.complex64)
+        self._local = threading.local()
+        if self._dtype.kind == 'f':
+            self._execute = self._execute_real_packed if n % 2 == 0 else self._execute_real
+            if n % 2 == 0:
+                half = n // 2
+                self._inner_plan = plan(half, self._output_dtype)
+                twiddles = np.exp(-2j * np.pi * np.arange(half + 1) / n)
+                # The FFT is (Z[k] + C[k]) / 2 + twiddles[k] * (Z[k] - C[k]) / 2j, being Z the FFT of the packed series,
+                # and C[k] = conj(Z[n / 2 - k]) (both periodic)
+                self._z_factors = (0.5 - 0.5j * twiddles).astype(self._output_dtype)
+                self._c_factors = (0.5 + 0.5j * twiddles).astype(self._output_dtype)
+                self._reversed_indexes = (half - np.arange(half + 1)) % half
+            else:
+                self._inner_plan = plan(n, self._output_dtype)
+        elif n == 1:
+            self._execute = self._execute_trivial
+        elif 2 ** int(round(np.log2(n))) == n:
+            self._execute = self._execute_radix2
+            self._permutation = _bit_reversal_permutation(n)
+            twiddles = np.exp(-2j * np.pi * np.arange(n // 2) / n).astype(self._output_dtype)
+            self._stage_twiddles = [np.ascontiguousarray(twiddles[::n // size]) for size in _stage_sizes(n)]
+        else:
+            self._execute = self._execute_bluestein
+            m = 2 ** int(np.ceil(np.log2(2 * n - 1)))
+            k = np.arange(n)
+            chirp = np.exp(-1j * np.pi * ((k * k) % (2 * n)) / n)  # The modulo keeps the phase accurate for large k
+            kernel = np.zeros(m, dtype=self._output_dtype)
+            kernel[:n] = np.conj(chirp)
+            kernel[m - n + 1:] = np.conj(chirp[1:][::-1])
+            self._inner_plan = plan(m, self._output_dtype)
+            self._kernel_fft = self._inner_plan.execute(kernel)
+            self._chirp = chirp.astype(self._output_dtype)
+            self._scaled_chirp = (chirp / m).astype(self._output_dtype)  # Includes the scaling of the inverse FFT
+
+    @property
+    def n(self):
+        """
+        Returns:
+            int: The series length.
+        """
+        return self._n
+
+    @property
+    def dtype(self):
+        """
+        Returns:
+            dtype: The dtype of the series.
+        """
+        return self._dtype
+
+    @property
+    def output_length(self):
+        """
+        Returns:
+            int: The length of the transform (n // 2 + 1 for real series, else n).
+        """
+        return self._n // 2 + 1 if self._dtype.kind == 'f' else self._n
+
+    def execute(self, x, out=None):
+        """ Calculates the FFT of the given series (or series, along the last axis).
+
+        Args:
+            x (array): The series. Its last axis must have the plan length.
+            out (array): The array where the FFT is written, with the shape of the series (but the last axis having
+                         output_length) and the complex dtype of the plan. If None, a new array is allocated.
+        Returns:
+            array: The computed FFT of the given series (out, if it was given).
+        Raises:
+            ValueError: If the series or the output array are not valid.
+        """
+        if x is None or not isinstance(x, np.ndarray) or x.ndim == 0 or x.shape[-1] != self._n:
+            _logger.debug("The given series is null, is not a numpy array, or its length is not the plan length")
+            raise ValueError("The series must be a non null numpy array with the plan length")
+        if self._dtype.kind == 'f' and np.iscomplexobj(x):
+            _logger.debug("The given series is not real")
+            raise ValueError("The series must be real")
+        shape = x.shape[:-1] + (self.output_length,)
+        if out is None:
+            out = np.empty(shape, dtype=self._output_dtype)
+        elif not isinstance(out, np.ndarray) or out.shape != shape or out.dtype != self._output_dtype:
+            _logger.debug("The given output array does not have shape {} and dtype {}"
+                          .format(shape, self._output_dtype))
+            raise ValueError("The output array must have shape {} and dtype {}".format(shape, self._output_dtype))
+        if out.flags.c_contiguous:
+            self._execute(x, out)
+        else:
+            target = self._buffer('out', shape)
+            self._execute(x, target)
+            out[...] = target
+        return out
+
+    def _buffer(self, name, shape):
+        """ Gets a scratch buffer of the calling thread, allocating it only if there is none with the given shape.
+
+        Args:
+            name (str): The buffer name.
+            shape (tuple): The buffer shape.
+        Returns:
+            ndarray: The buffer (with the complex dtype of the plan, and uninitialized contents).
+        """
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = buffers[name] = np.empty(shape, dtype=self._output_dtype)
+        return buffer
+
+    def _execute_trivial(self, x, out):
+        """ Calculates the FFT of series of length 1 (i.e the series themselves).
+        Note: Like the other _execute_* methods, we assume the output array is C-contiguous and has the right shape.
+        """
+        out[...] = x
+
+    def _execute_radix2(self, x, out):
+        """ Calculates the FFT using an iterative radix-2 (Cooley-Tukey) algorithm.
+        Each butterfly stage is computed at once for all blocks, in place in the output array.
+        """
+        if x.dtype != self._output_dtype:
+            cast = self._buffer('cast', x.shape)
+            cast[...] = x
+            x = cast
+        np.take(x, self._permutation, axis=-1, out=out, mode='wrap')  # Bit-reversal permutation ('wrap' avoids a copy)
+        n = self._n
+        scratch = self._buffer('odd', x.shape[:-1] + (n // 2,))
+        for size, twiddles in zip(_stage_sizes(n), self._stage_twiddles):
+            half = size // 2
+            blocks = out.reshape(out.shape[:-1] + (n // size, size))  # A view, so butterflies are applied in place
+            odd = scratch.reshape(out.shape[:-1] + (n // size, half))
+            np.multiply(blocks[..., half:], twiddles, out=odd)
+            np.subtract(blocks[..., :half], odd, out=blocks[..., half:])
+            np.add(blocks[..., :half], odd, out=blocks[..., :half])
+
+    def _execute_bluestein(self, x, out):
+        """ Calculates the FFT using Bluestein's (chirp-z) algorithm.
+        The transform is expressed as a convolution, which is computed with radix-2 FFTs of the next suitable length
+        (the inverse FFT using the forward one, by conjugating its input and output).
+        """
+        n = self._n
+        m = self._inner_plan.n
+        padded = self._buffer('padded', x.shape[:-1] + (m,))
+        np.multiply(x, self._chirp, out=padded[..., :n])
+        padded[..., n:] = 0
+        transformed = self._buffer('transformed', padded.shape)
+        self._inner_plan._execute(padded, transformed)
+        np.multiply(transformed, self._kernel_fft, out=transformed)
+        np.conjugate(transformed, out=transformed)
+        self._inner_plan._execute(transformed, padded)
+        np.conjugate(padded[..., :n], out=out)
+        np.multiply(out, self._scaled_chirp, out=out)
+
+    def _execute_real_packed(self, x, out):
+        """ Calculates the FFT of real series of even length, packing them into complex series of half the length.
+        """
+        half = self._n // 2
+        packed = self._buffer('packed', x.shape[:-1] + (half,))
+        packed.real = x[..., 0::2]
+        packed.imag = x[..., 1::2]
+        z = self._buffer('z', packed.shape)
+        self._inner_plan._execute(packed, z)
+        c = self._buffer('c', out.shape)
+        np.take(z, self._reversed_indexes, axis=-1, out=c, mode='wrap')
+        np.conjugate(c, out=c)
+        np.multiply(z, self._z_factors[:half], out=out[..., :half])
+        np.multiply(z[..., 0], self._z_factors[half], out=out[..., half])  # Z[n / 2] is Z[0]
+        np.multiply(c, self._c_factors, out=c)
+        np.add(out, c, out=out)
+
+    def _execute_real(self, x, out):
+        """ Calculates the FFT of real series of odd length, keeping the non-negative frequency terms of the whole FFT.
+        """
+        transformed = self._buffer('transformed', x.shape)
+        self._inner_plan._execute(x, transformed)
+        out[...] = transformed[..., :self.output_length]
+
+
+def _stage_sizes(n):
+    """
+    Params:
+        n (int): The series length (a power of 2).
+    Returns:
+        list: The block size of each radix-2 butterfly stage (2, 4, ..., n).
+    """
+    return [2 ** stage for stage in range(1, int(round(np.log2(n))) + 1)]
+
+
+def _bit_reversal_permutation(n):
+    """
+    Params:
+        n (int): The series length (a power of 2).
+    Returns:
+        array: The bit-reversal permutation indexes.
+    """
+    bits = int(round(np.log2(n)))
+    indexes = np.arange(n)
+    permutation = np.zeros(n, dtype=np.intp)
+    for bit in range(bits):
+        permutation |= ((indexes >> bit) & 1) << (bits - 1 - bit)
+    return permutation
+
+
+def _native_fft(x):
+    """ Calculates the FFT of the given series using this module's implementation (see Plan).
+    Params:
+        x (array): The series to which the FFT must be computed.
+    Returns:
+        array: The computed FFT of the given series (empty series are returned as they are, as complex series).
+    """
+    if x.shape[-1] == 0:
+        return np.array(x, dtype=np.complex128)
+    return plan(x.shape[-1], np.complex128).execute(x)
 
-    if 2 ** int(round(np.log2(n))) != n:
-        _logger.debug("The given series length is not a power of 2")
-        raise ValueError("Size of n must be a power of 2")
 
-    even_indexed = fft(x[0::2])
-    odd_indexed = fft(x[1::2])
+def _native_rfft(x):
+    """ Calculates the FFT of the given real series using this module's implementation (see Plan).
+    Params:
+        x (array): The real series to which the FFT must be computed.
+    Returns:
+        array: The n // 2 + 1 non-negative frequency terms of the FFT of the given series.
+    """
+    return plan(x.shape[-1], np.float64).execute(x)
+
+
+def fftfreq(n, d=1.0):
+    """ Calculates the frequencies of each of the bins of an FFT (in the same order as the FFT output).
+    Params:
+        n (int): The FFT length.
+        d (float): The sample spacing (i.e the inverse of the sampling rate).
+    Returns:
+        array: The frequencies of each bin.
+    """
+    if n is None or n <= 0:
+        _logger.debug("The given length is not positive")
+        raise ValueError("The length must be positive")
+    return np.concatenate((np.arange(0, (n - 1) // 2 + 1), np.arange(-(n // 2), 0))) / (d * n)
 
-    x_k = np.concatenate([even_indexed, odd_indexed])
 
-    for k in range(0, n // 2, 1):
-        k_value = x_k[k]
-        x_k[k] = k_value + np.exp(-2j * np.pi * k / n) * x_k[k + n // 2]
-        x_k[k + n // 2] = k_value - np.exp(-2j * np.pi * k / n) * x_k[k + n // 2]
-    return x_k
+def rfftfreq(n, d=1.0):
+    """ Calculates the frequencies of each of the bins of a real series FFT (i.e the non-negative frequencies).
+    Params:
+        n (int): The FFT length.
+        d (float): The sample spacing (i.e the inverse of the sampling rate).
+    Returns:
+        array: The frequencies of each bin.
+    """
+    if n is None or n <= 0:
+        _logger.debug("The given length is not positive")
+        raise ValueError("The length must be positive")
+    return np.arange(0, n // 2 + 1) / (d * n)
 
 
-def fftshift(x):
+def fftshift(x, axis=-1):
     """Rearranges a Fourier transform x by shifting the zero-frequency component to the center of the array.
     Params:
         x (array): The series to be shifted
+        axis (int): The axis along which the series is shifted.
     Returns:
         array: The shifted series.
     """
     if x is None or not isinstance(x, np.ndarray):
         _logger.debug("The given series is null or is not a numpy array")
         raise ValueError("The series must be a non null numpy array")
-    return np.roll(x, len(x) / 2)
+    _validate_axis(x, axis)
+    return np.roll(x, x.shape[axis] // 2, axis=axis)
+
+
+def _along_axis(transform, x, axis):
+    """ Applies the given transform (which works along the last axis) along the given axis.
+    Params:
+        transform (function): The transform.
+        x (array): The series.
+        axis (int): The axis.
+    Returns:
+        array: The transformed series, with the transformed axis in its original position.
+    """
+    _validate_axis(x, axis)
+    if axis % x.ndim == x.ndim - 1:
+        return transform(x)
+    return np.moveaxis(transform(np.moveaxis(x, axis, -1)), -1, axis)
+
+
+def _validate_axis(x, axis):
+    """ Validates the given axis of the given array.
+    Params:
+        x (array): The array.
+        axis (int): The axis.
+    Raises:
+        ValueError: If the array is 0-dimensional, or if the axis is out of range.
+    """
+    if x.ndim == 0 or not isinstance(axis, int) or not -x.ndim <= axis < x.ndim:
+        _logger.debug("The given axis is out of range")
+        raise ValueError("The axis must be in range, and the series must have at least one dimension")
+
+
+_BACKENDS = {
+    'native': {'fft': _native_fft, 'rfft': _native_rfft},
+    'numpy': {'fft': np.fft.fft, 'rfft': np.fft.rfft},
+}
+if _scipy_fft is not None:
+    _BACKENDS['scipy'] = {'fft': _scipy_fft.fft, 'rfft': _scipy_fft.rfft}
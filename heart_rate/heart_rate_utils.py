@@ -3,24 +3,58 @@
 This module is in charge of providing utilities for calculating heart beat rates.
 """
 import logging
-from inspect import getargspec
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
+import cv2
 import numpy as np
 
 import fft
+import pipeline_utils
+import profiling_utils
+import tracking_utils
 import video_utils
 
 _logger = logging.getLogger(__name__)
 
 _HERTZ_PER_MINUTE = 60
 
+_CHANNEL_INDEXES = {'B': 0, 'G': 1, 'R': 2}
 
-def measure(video, roi, min_freq, max_freq, channel='G'):
+INTERPOLATIONS = ['parabolic', 'gaussian']
+
+ESTIMATORS = ['periodogram', 'welch']
+
+PROJECTIONS = ['chrom', 'pos']
+
+_POS_WINDOW_SECONDS = 1.6
+
+# The POS projection axes (S1 = G - B and S2 = -2R + G + B), in 'B', 'G' and 'R' order
+_POS_AXES = np.array([[-1.0, 1.0, 0.0], [1.0, 1.0, -2.0]])
+
+WINDOWS = {'boxcar': np.ones, 'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman}
+
+_DEFAULT_SEGMENT_LENGTH = 256
+
+_BANDPASS_FILTERS_CACHE_SIZE = 64
+_bandpass_filters = OrderedDict()
+_bandpass_filters_lock = threading.Lock()  # Filters can be requested by several threads (e.g a server worker pool)
+
+
+def measure(video, roi, min_freq, max_freq, channel='G', use_all_frames=False, fft_length=None,
+            decode_workers=None, cache=None, stats=None, pipeline_depth=None, timeout=None, cancel_event=None,
+            interpolation=None, zoom=None, estimator='periodogram', segment_length=None, overlap=0.5, window='hann',
+            tracker=None):
     """ Measures the heart beat rate in the given video, customizing the process according to the given params.
 
     Params:
-        video (Video): The video to analyze.
-        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        video (FrameSource): The video to analyze (a Video, or any other source of frames, like an ArraySource).
+                             Frames are consumed in one pass, so a streaming video can be used.
+                             If the video keeps only one channel, it must be the given one.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI (in whole frame
+                     coordinates, even if the video frames are cropped).
                      Note: The first two elements define the height, and the second two, the width.
                      This means that roi[0] is the upper limit, roi[1] is the lower limit,
                      roi[2] is the left limit, and roi[3] is the right limit.
@@ -33,36 +67,440 @@ def measure(video, roi, min_freq, max_freq, channel='G'):
         min_freq (float): The min. frequency to use in the bandpass filtering applied to the video signal.
         max_freq (float): The max. frequency to use in the bandpass filtering applied to the video signal.
         channel (str): The channel to process.
+        use_all_frames (bool): When True, every frame is used. Else, only the first 2^k frames are used
+                               (being 2^k the greatest power of 2 not greater than the video length).
+        fft_length (int): The length to which the signal is zero-padded before being transformed.
+                          If None, the signal is not padded.
+        decode_workers (int): The amount of worker processes among which decoding is split (the video must be a
+                              streaming video file). If None, the video is decoded in this process.
+        cache (SignalCache): A cache of signals. If the signal of the video and ROI is cached, the video is not decoded.
+                             Else, the signal of all channels and frames is extracted and cached
+                             (so the video must be a video file, and keep all channels).
+        stats (Stats): A profiling_utils.Stats instance in which the time, frames and memory of each stage
+                       are recorded. If None, nothing is recorded.
+        pipeline_depth (int): If not None, frames are decoded in a background thread, and handed to the ROI
+                              reduction through a queue of this depth (so decoding and reduction overlap).
+                              Not used together with a cache or decode workers.
+        timeout (float): The max. amount of seconds the pipelined ROI reduction can take (requires a pipeline depth).
+        cancel_event (Event): A threading.Event that cancels the pipelined ROI reduction when set.
+                              Only used when pipelining.
+        interpolation (str): How the spectrum peak is refined between bins ('parabolic' or 'gaussian', see
+                             INTERPOLATIONS). If None, the frequency of the peak bin is used.
+        zoom (int): If not None, instead of the whole spectrum, only this amount of frequencies evenly spaced
+                    in [min_freq, max_freq] are evaluated (with a zoom FFT, see fft.zoom_fft).
+        estimator (str): The spectral estimator (see ESTIMATORS). 'periodogram' transforms the whole signal at once.
+                         'welch' averages the periodograms of overlapping windowed segments (less noisy, and the
+                         resolution depends on the segment length instead of the signal length).
+        segment_length (int): The length of the Welch segments. If None, 256 (or the signal length, if shorter).
+        overlap (float): The fraction of each Welch segment that overlaps the next one (in [0, 1)).
+        window (str): The window applied to each Welch segment (see WINDOWS).
+        tracker (RoiTracker): If not None, a tracking_utils.RoiTracker that moves the ROI along with the subject
+                              (starting at the given ROI, which can be None if the tracker has a detector).
+                              The video must keep whole frames (all channels, and not cropped).
+                              Not used together with a cache or decode workers.
     Returns:
         float: The average heart beat rate that could be measured from the given video.
+               If stats are given, a tuple with the heart beat rate and the stats is returned instead.
+    Raises:
+        TimeoutError: If the pipelined ROI reduction timed out (see concurrent.futures).
+        CancelledError: If the pipelined ROI reduction was cancelled (see concurrent.futures).
     """
     # Verify params...
-    if video is None or not isinstance(video, video_utils.Video):
-        _logger.debug("Could not measure heart beat rate. Video is null or not a Video instance")
-        raise ValueError("The video not be null and must be a Video instance")
+    if video is None or not isinstance(video, video_utils.FrameSource):
+        _logger.debug("Could not measure heart beat rate. Video is null or not a FrameSource instance")
+        raise ValueError("The video not be null and must be a FrameSource instance (e.g a Video)")
     if video.length == 0:
         _logger.debug("Video length is 0")
         raise ValueError("The video is empty")
     if channel is None or not isinstance(channel, str):
         _logger.debug("Could not measure heart beat rate. Channel is null or not a string instance")
         raise ValueError("The channel must not be null and must be a string")
+    if channel not in _CHANNEL_INDEXES:
+        _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+        raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+    if fft_length is not None and (not isinstance(fft_length, int) or fft_length <= 0):
+        _logger.debug("Could not measure heart beat rate. FFT length is not a positive integer")
+        raise ValueError("The FFT length must be a positive integer")
+    _validate_peak_options(interpolation, zoom)
+    _validate_estimator_options(estimator, segment_length, overlap, window)
+    _validate_pipeline_options(pipeline_depth, timeout)
+    _validate_decode_workers(video, decode_workers)
+    if tracker is not None:
+        _validate_tracker(video, tracker, cache, decode_workers)
 
     # Prepare stuff...
     _logger.info("Preparing stuff to measure heart beat rate from video...")
-    length = 2 ** int(np.log2(video.length))  # Get the previous power of 2 from the given video
-    half_length = length / 2
-    frequencies = np.linspace(-half_length, half_length - 1, length) * video.fps / length
+    # Use all frames, or get the previous power of 2 from the given video
+    length = video.length if use_all_frames else 2 ** int(np.log2(video.length))
 
     # Signal processing...
-    frames = _get_channel_signal(video, channel)[:length]  # Get just the first elements
-    signal = _create_signal(frames, roi, video.height, video.width)  # Will validate the ROI
-    processed_signal = _process_signal(signal)
-    # noinspection PyTypeChecker
-    filtered_signal = _filter_signal(processed_signal, [_create_bandpass_filter(frequencies, min_freq, max_freq)])
+    recorder = profiling_utils.NULL_STATS if stats is None else stats
+    with recorder.stage('roi_reduction') as stage:
+        signal = _center_signal(_reduce_video(video, roi, length, channel, decode_workers, cache, pipeline_depth,
+                                              timeout, cancel_event, tracker, recorder)[0])
+        stage.add_frames(signal.shape[-1])
+    heart_rate = _measure_spectrum(signal, video.fps, min_freq, max_freq, fft_length, recorder, interpolation, zoom,
+                                   estimator=estimator, segment_length=segment_length, overlap=overlap, window=window)
+    return heart_rate if stats is None else (heart_rate, stats)
+
+
+def measure_projection(video, roi, min_freq, max_freq, projection='pos', use_all_frames=False, fft_length=None,
+                       decode_workers=None, cache=None, stats=None, pipeline_depth=None, timeout=None,
+                       cancel_event=None, interpolation=None, zoom=None, estimator='periodogram', segment_length=None,
+                       overlap=0.5, window='hann', tracker=None):
+    """ Measures the heart beat rate in the given video combining its R, G and B channels with a chrominance
+    projection (that cancels most of the intensity and specular changes caused by motion and lighting).
+    The ROI means of the three channels are reduced in one pass, and the spectra of the projection and of each
+    channel are computed in one batched FFT, so measuring all of them costs about the same as measuring one channel.
+
+    Params:
+        video (FrameSource): The video to analyze (see measure). It must keep all channels.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI (see measure).
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the video signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the video signal.
+        projection (str): The projection (see PROJECTIONS). 'chrom' projects the normalized channels on two
+                          chrominance signals, combined with the ratio of their deviations in the heart band
+                          (de Haan and Jeanne, 2013). 'pos' projects them on the plane orthogonal to the skin tone,
+                          over sliding windows of 1.6 seconds which are overlap-added (Wang et al., 2017).
+        The rest of the params are the ones of measure.
+    Returns:
+        tuple: The average heart beat rate measured from the projection, and a dict with the one measured from each
+               channel ('R', 'G' and 'B'). If stats are given, the stats are returned as a third element.
+    Raises:
+        ValueError: If the video does not keep all channels, or if the ROI mean of a channel is zero.
+        TimeoutError: If the pipelined ROI reduction timed out (see concurrent.futures).
+        CancelledError: If the pipelined ROI reduction was cancelled (see concurrent.futures).
+    """
+    # Verify params...
+    if video is None or not isinstance(video, video_utils.FrameSource):
+        _logger.debug("Could not measure heart beat rate. Video is null or not a FrameSource instance")
+        raise ValueError("The video not be null and must be a FrameSource instance (e.g a Video)")
+    if video.length == 0:
+        _logger.debug("Video length is 0")
+        raise ValueError("The video is empty")
+    if video.channel is not None:
+        _logger.debug("The video only keeps the {} channel".format(video.channel))
+        raise ValueError("Projecting the channels requires a video that keeps all channels")
+    if projection not in PROJECTIONS:
+        _logger.debug("Wrong projection. Must be one of {}, but was {}".format(PROJECTIONS, projection))
+        raise ValueError("The projection was wrong. Must be one of {}".format(PROJECTIONS))
+    if fft_length is not None and (not isinstance(fft_length, int) or fft_length <= 0):
+        _logger.debug("Could not measure heart beat rate. FFT length is not a positive integer")
+        raise ValueError("The FFT length must be a positive integer")
+    _validate_peak_options(interpolation, zoom)
+    _validate_estimator_options(estimator, segment_length, overlap, window)
+    _validate_pipeline_options(pipeline_depth, timeout)
+    _validate_decode_workers(video, decode_workers)
+    if tracker is not None:
+        _validate_tracker(video, tracker, cache, decode_workers)
+
+    # Signal processing...
+    length = video.length if use_all_frames else 2 ** int(np.log2(video.length))
+    recorder = profiling_utils.NULL_STATS if stats is None else stats
+    with recorder.stage('roi_reduction') as stage:
+        means = _reduce_video(video, roi, length, 'BGR', decode_workers, cache, pipeline_depth, timeout,
+                              cancel_event, tracker, recorder)
+        stage.add_frames(means.shape[-1])
+    if means.shape[-1] == 0:
+        _logger.debug("The frames was an empty iterable")
+        raise ValueError("The frames must be a non empty iterable")
+    with recorder.stage('projection'):
+        _logger.info("Projecting channels ({})...".format(projection))
+        if projection == 'chrom':
+            projected = _project_chrom(means, video.fps, min_freq, max_freq)
+        else:
+            projected = _project_pos(means, video.fps)
+    signals = _center_signal(np.vstack((projected, means)))
+    heart_rates = _measure_spectrum(signals, video.fps, min_freq, max_freq, fft_length, recorder, interpolation, zoom,
+                                    estimator=estimator, segment_length=segment_length, overlap=overlap, window=window)
+    channel_heart_rates = {channel: float(heart_rates[1 + _CHANNEL_INDEXES[channel]]) for channel in _CHANNEL_INDEXES}
+    if stats is None:
+        return float(heart_rates[0]), channel_heart_rates
+    return float(heart_rates[0]), channel_heart_rates, stats
+
+
+def measure_signal(signal, fps, min_freq, max_freq, fft_length=None, interpolation=None, zoom=None,
+                   estimator='periodogram', segment_length=None, overlap=0.5, window='hann'):
+    """ Measures the heart beat rate in an already extracted signal (e.g ROI means computed by a client).
+    Many signals of the same length and fps can be measured at once, stacked in a (batch, length) array:
+    their spectra are computed in one batched FFT, and their peaks are picked at once.
+
+    Params:
+        signal (array): The mean value of the ROI of each frame (a one dimensional array),
+                        or a (batch, length) array with one signal per row.
+        fps (float): The amount of frames per second.
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the signal.
+        fft_length (int): The length to which the signal is zero-padded before being transformed.
+                          If None, the signal is not padded.
+        interpolation (str): How the spectrum peak is refined between bins (see measure).
+        zoom (int): The amount of frequencies evaluated with a zoom FFT (see measure).
+        estimator (str): The spectral estimator (see measure).
+        segment_length (int): The length of the Welch segments (see measure).
+        overlap (float): The fraction of each Welch segment that overlaps the next one.
+        window (str): The window applied to each Welch segment (see WINDOWS).
+    Returns:
+        float: The average heart beat rate that could be measured from the given signal.
+               For (batch, length) signals, an array with the heart beat rate of each signal.
+    """
+    if signal is None or np.ndim(signal) not in (1, 2):
+        _logger.debug("Could not measure heart beat rate. Signal is null or not one or two dimensional")
+        raise ValueError("The signal must be a non null one dimensional, or (batch, length), array")
+    if fps is None or fps <= 0:
+        _logger.debug("Wrong fps value. Must be positive")
+        raise ValueError("The fps must be positive")
+    if fft_length is not None and (not isinstance(fft_length, int) or fft_length <= 0):
+        _logger.debug("Could not measure heart beat rate. FFT length is not a positive integer")
+        raise ValueError("The FFT length must be a positive integer")
+    _validate_peak_options(interpolation, zoom)
+    _validate_estimator_options(estimator, segment_length, overlap, window)
+
+    signal = _center_signal(np.array(signal, dtype=np.float64))
+    return _measure_spectrum(signal, fps, min_freq, max_freq, fft_length, profiling_utils.NULL_STATS,
+                             interpolation, zoom, estimator=estimator, segment_length=segment_length,
+                             overlap=overlap, window=window)
+
+
+def extract_signal(frames, roi, channel=None, use_all_frames=False):
+    """ Extracts the signal of the given frames (i.e the mean value of their ROI), like measure does with a video,
+    so measuring it with measure_signal gives the same heart beat rate as measuring a video with those frames.
+
+    Params:
+        frames (ndarray): The frames, with shape (frames, height, width) for single channel frames,
+                          or (frames, height, width, 3) for BGR frames.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI (see measure).
+        channel (str): The channel to extract ('R', 'G' or 'B') from BGR frames. Not used with single channel frames.
+        use_all_frames (bool): If True, all frames are used. Else, only the first 2^k frames (see measure).
+    Returns:
+        ndarray: The signal (centered, i.e with zero mean).
+    Raises:
+        ValueError: If the frames, the ROI, or the channel are not valid.
+    """
+    if frames is None or not isinstance(frames, np.ndarray) or frames.ndim not in (3, 4) \
+            or (frames.ndim == 4 and frames.shape[3] != 3):
+        _logger.debug("The frames are null, are not a numpy array, or do not have a valid shape")
+        raise ValueError("The frames must be a numpy array with shape (frames, height, width) "
+                         "or (frames, height, width, 3)")
+    if frames.shape[0] == 0:
+        _logger.debug("The frames array is empty")
+        raise ValueError("The frames must not be empty")
+    if frames.ndim == 4 and channel not in _CHANNEL_INDEXES:
+        _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+        raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+    length = frames.shape[0] if use_all_frames else 2 ** int(np.log2(frames.shape[0]))
+    return _create_signal(frames, roi, frames.shape[1], frames.shape[2], length,
+                          channel if frames.ndim == 4 else None).reshape(-1)
+
+
+def _validate_peak_options(interpolation, zoom):
+    """ Validates the options of the spectrum peak estimation.
+
+    Params:
+        interpolation (str): How the spectrum peak is refined between bins, or None.
+        zoom (int): The amount of frequencies evaluated with a zoom FFT, or None.
+    Raises:
+        ValueError: If the interpolation is not one of INTERPOLATIONS, or if the zoom is not an integer above 1.
+    """
+    if interpolation is not None and interpolation not in INTERPOLATIONS:
+        _logger.debug("Wrong interpolation. Must be one of {}, but was {}".format(INTERPOLATIONS, interpolation))
+        raise ValueError("The interpolation was wrong. Must be one of {}".format(INTERPOLATIONS))
+    if zoom is not None and (not isinstance(zoom, int) or zoom < 2):
+        _logger.debug("Wrong zoom. Must be an integer greater than 1")
+        raise ValueError("The zoom must be an integer greater than 1")
+
+
+def _validate_estimator_options(estimator, segment_length, overlap, window):
+    """ Validates the options of the spectral estimator.
+
+    Params:
+        estimator (str): The spectral estimator.
+        segment_length (int): The length of the Welch segments, or None.
+        overlap (float): The fraction of each Welch segment that overlaps the next one.
+        window (str): The window applied to each Welch segment.
+    Raises:
+        ValueError: If any of the options is not valid.
+    """
+    if estimator not in ESTIMATORS:
+        _logger.debug("Wrong estimator. Must be one of {}, but was {}".format(ESTIMATORS, estimator))
+        raise ValueError("The estimator was wrong. Must be one of {}".format(ESTIMATORS))
+    if segment_length is not None and (not isinstance(segment_length, int) or segment_length < 2):
+        _logger.debug("Wrong segment length. Must be an integer greater than 1")
+        raise ValueError("The segment length must be an integer greater than 1")
+    if overlap is None or not 0 <= overlap < 1:
+        _logger.debug("Wrong overlap. Must be in [0, 1)")
+        raise ValueError("The overlap must be in [0, 1)")
+    if window not in WINDOWS:
+        _logger.debug("Wrong window. Must be one of {}, but was {}".format(sorted(WINDOWS), window))
+        raise ValueError("The window was wrong. Must be one of {}".format(sorted(WINDOWS)))
+
+
+def _measure_spectrum(signal, fps, min_freq, max_freq, fft_length, recorder, interpolation=None, zoom=None,
+                      estimator='periodogram', segment_length=None, overlap=0.5, window='hann'):
+    """ Measures the heart beat rate from the spectrum of the given (centered) signal, or signals.
+    Note: We assume validations were already performed when execution of this method is reached.
+
+    Params:
+        signal (ndarray): The centered signal (or signals, one per row of the last axis).
+        fps (float): The amount of frames per second.
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the signal.
+        fft_length (int): The length to which the signal is zero-padded before being transformed, or None.
+        recorder (Stats): The stats in which the 'fft' and 'filter' stages are recorded.
+        interpolation (str): How the spectrum peak is refined between bins, or None.
+        zoom (int): The amount of frequencies evaluated with a zoom FFT, or None.
+        estimator (str): The spectral estimator.
+        segment_length (int): The length of the Welch segments, or None.
+        overlap (float): The fraction of each Welch segment that overlaps the next one.
+        window (str): The window applied to each Welch segment.
+    Returns:
+        float: The average heart beat rate (or an array with the rate of each signal, for many signals).
+    """
+    if zoom is not None:
+        with recorder.stage('fft', signal.shape[-1]):
+            # The zoomed band needs no filtering
+            if estimator == 'welch':
+                segments = _segment_signal(signal, segment_length, overlap, window)
+                power = np.mean(np.abs(fft.zoom_fft(segments, min_freq, max_freq, zoom, fps)) ** 2, axis=-2)
+            else:
+                power = np.abs(fft.zoom_fft(signal, min_freq, max_freq, zoom, fps)) ** 2
+        frequencies = fft.zoom_fftfreq(min_freq, max_freq, zoom)
+        return _pick_peaks(power, frequencies, frequencies[1] - frequencies[0], interpolation) * _HERTZ_PER_MINUTE
+
+    with recorder.stage('fft', signal.shape[-1]):
+        processed_signal = _process_signal(signal, length=fft_length, estimator=estimator,
+                                           segment_length=segment_length, overlap=overlap, window=window)
+    with recorder.stage('filter'):
+        transformed_length = fft_length or _transformed_length(signal, estimator, segment_length)
+        frequencies = fft.rfftfreq(transformed_length, 1.0 / fps)
+        bandpass_filter = _get_bandpass_filter(transformed_length, fps, min_freq, max_freq)
+        # noinspection PyTypeChecker
+        filtered_signal = _filter_signal(processed_signal, [bandpass_filter])
 
     _logger.info("Calculating average heart beat rate...")
     # noinspection PyTypeChecker
-    return abs(frequencies[np.argmax(filtered_signal)]) * _HERTZ_PER_MINUTE
+    return _pick_peaks(filtered_signal, frequencies, float(fps) / transformed_length, interpolation) \
+        * _HERTZ_PER_MINUTE
+
+
+def _pick_peaks(spectra, frequencies, spacing, interpolation=None):
+    """ Picks the frequency of the peak of each of the given spectra at once.
+
+    Params:
+        spectra (ndarray): The power spectra (one per row of the last axis).
+        frequencies (ndarray): The frequency of each bin.
+        spacing (float): The spacing between bins.
+        interpolation (str): How each peak is refined between bins (see _interpolate_peaks), or None.
+    Returns:
+        The frequency of the peak (a float for one dimensional spectra, else an array with one per spectrum).
+    """
+    peaks = np.argmax(spectra, axis=-1)
+    peak_frequencies = frequencies[peaks] + _interpolate_peaks(spectra, peaks, interpolation) * spacing
+    return float(peak_frequencies) if spectra.ndim == 1 else peak_frequencies
+
+
+def _interpolate_peaks(spectra, peaks, interpolation):
+    """ Estimates the offset (in bins) of the true peak of each of the given spectra from its peak bin,
+    fitting a parabola to the peak bin and its two neighbours (to their logarithm, if the interpolation is gaussian).
+
+    Params:
+        spectra (ndarray): The power spectra (one per row of the last axis).
+        peaks (ndarray): The index of the peak bin of each spectrum.
+        interpolation (str): The interpolation ('parabolic' or 'gaussian'), or None.
+    Returns:
+        ndarray: The offsets, between -0.5 and 0.5 (0 if there is no interpolation, or the peak has no two neighbours).
+    """
+    offsets = np.zeros(np.shape(peaks))
+    length = spectra.shape[-1]
+    if interpolation is None or length < 3:
+        return offsets
+    rows = spectra.reshape(-1, length)
+    indexes = np.clip(np.reshape(peaks, -1), 1, length - 2)  # Edge peaks are discarded below
+    rows_range = np.arange(rows.shape[0])
+    left, center, right = rows[rows_range, indexes - 1], rows[rows_range, indexes], rows[rows_range, indexes + 1]
+    valid = (np.reshape(peaks, -1) == indexes)
+    if interpolation == 'gaussian':
+        valid &= (left > 0) & (center > 0) & (right > 0)  # E.g a neighbour was filtered out
+        left, center, right = [np.log(np.where(valid, values, 1.0)) for values in (left, center, right)]
+    denominator = left - 2 * center + right
+    valid &= denominator < 0  # Else, it is not a maximum (e.g a flat spectrum)
+    offsets.flat = np.where(valid, np.clip(0.5 * (left - right) / np.where(valid, denominator, -1.0), -0.5, 0.5), 0.0)
+    return offsets
+
+
+def measure_rois(video, rois, min_freq, max_freq, channel='G', use_all_frames=False):
+    """ Measures the heart beat rate in each of the given ROIs of the given video, decoding it only once.
+    Each frame is reduced to the mean value of every ROI at once (using an integral image),
+    and the spectra of all the ROIs signals are computed in one batched FFT.
+
+    Params:
+        video (FrameSource): The video to analyze (see measure). Frames are consumed in one pass,
+                             so a streaming video can be used.
+        rois (list): A list of 4-dimensional tuples, each of them holding the vertexes of a rectangular ROI
+                     (see measure). The grid_rois function can be used to split a ROI into a grid of ROIs.
+        min_freq (float): The min. frequency to use in the bandpass filtering applied to the video signal.
+        max_freq (float): The max. frequency to use in the bandpass filtering applied to the video signal.
+        channel (str): The channel to process.
+        use_all_frames (bool): When True, every frame is used. Else, only the first 2^k frames are used
+                               (being 2^k the greatest power of 2 not greater than the video length).
+    Returns:
+        tuple: An array with the average heart beat rate measured in each ROI,
+               and an array with the quality of each measure (i.e the fraction of the bandpass power that is around
+               the spectrum peak, between 0 and 1, being higher values more reliable).
+    """
+    # Verify params...
+    if video is None or not isinstance(video, video_utils.FrameSource):
+        _logger.debug("Could not measure heart beat rate. Video is null or not a FrameSource instance")
+        raise ValueError("The video not be null and must be a FrameSource instance (e.g a Video)")
+    if video.length == 0:
+        _logger.debug("Video length is 0")
+        raise ValueError("The video is empty")
+    if rois is None or not isinstance(rois, list) or not rois:
+        _logger.debug("Could not measure heart beat rate. ROIs is null, not a list, or an empty list")
+        raise ValueError("The ROIs must be a non empty list")
+    for roi in rois:
+        _validate_roi(roi, video.height, video.width)
+        if roi[1] <= roi[0] or roi[3] <= roi[2]:
+            _logger.debug("The ROI {} is empty".format(roi))
+            raise ValueError("Wrong ROI. Is empty")
+    frame_rois = [video.frame_roi(roi) for roi in rois]
+
+    # Signal processing...
+    length = video.length if use_all_frames else 2 ** int(np.log2(video.length))
+    frames = _get_channel_signal(video, channel)
+    _logger.info("Mapping {} ROIs of each frame to their mean value...".format(len(rois)))
+    signals = _center_signal(_reduce_rois_means(frames, frame_rois, length))
+    processed_signals = _process_signal(signals)
+    frequencies = fft.rfftfreq(signals.shape[-1], 1.0 / video.fps)
+    bandpass_filter = _get_bandpass_filter(signals.shape[-1], video.fps, min_freq, max_freq)
+    # noinspection PyTypeChecker
+    filtered_signals = _filter_signal(processed_signals, [bandpass_filter])
+
+    _logger.info("Calculating average heart beat rate of each ROI...")
+    peaks = np.argmax(filtered_signals, axis=-1)
+    return frequencies[peaks] * _HERTZ_PER_MINUTE, _peak_quality(filtered_signals, peaks)
+
+
+def grid_rois(roi, rows, columns):
+    """ Splits the given rectangular ROI into a grid of ROIs.
+
+    Params:
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI (see measure).
+        rows (int): The amount of rows of the grid.
+        columns (int): The amount of columns of the grid.
+    Returns:
+        list: The ROIs of the grid, row by row.
+    """
+    if roi is None or not isinstance(roi, tuple) or len(roi) != 4 or not all(isinstance(vertex, int) for vertex in roi):
+        _logger.debug("Wrong ROI definition. Must be a 4-Dimensional tuple of ints")
+        raise ValueError("Invalid ROI definition. Must be a 4-Dimensional tuple of ints")
+    if not isinstance(rows, int) or not isinstance(columns, int) or rows <= 0 or columns <= 0:
+        _logger.debug("Wrong grid definition. Rows and columns must be positive integers")
+        raise ValueError("Invalid grid definition. Rows and columns must be positive integers")
+
+    row_limits = np.linspace(roi[0], roi[1], rows + 1).astype(int)
+    column_limits = np.linspace(roi[2], roi[3], columns + 1).astype(int)
+    return [(int(row_limits[i]), int(row_limits[i + 1]), int(column_limits[j]), int(column_limits[j + 1]))
+            for i in range(rows) for j in range(columns)]
 
 
 def _get_channel_signal(video, channel):
@@ -73,7 +511,7 @@ def _get_channel_signal(video, channel):
         video (Video): The video from which the signal is extracted.
         channel (str): The channel to be extracted.
     Returns:
-        ndarray: The signal extracted from the channel video.
+        iterable: The frames of the given channel (a generator if the video is in streaming mode).
     """
     if channel == 'R':
         _logger.info("Getting frames from the R channel...")
@@ -89,24 +527,347 @@ def _get_channel_signal(video, channel):
     raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
 
 
-def _create_signal(frames, roi, video_height, video_width):
-    """ Creates the signal to be processed from the given list of frames.
+def _create_signal(frames, roi, video_height, video_width, length=None, channels=None):
+    """ Creates the signal to be processed from the given frames.
+    Frames are consumed in one pass, so a generator can be used in order to avoid keeping all of them in memory.
 
     Params:
-        frames (list): The list of frames from where the signal will be created. We assume all frames has same shape.
+        frames (iterable): The frames from where the signal will be created. We assume all frames has same shape.
         roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
                      Note: The first two elements define the height, and the second two, the width.
                      This means that roi[0] is the upper limit, roi[1] is the lower limit,
                      roi[2] is the left limit, and roi[3] is the right limit.
         video_height (int): The video height
         video_width (int): The video width
+        length (int): The max. amount of frames to consume. Can be None if frames has a length.
+        channels (str): The channels to extract (e.g 'G' or 'BGR') when frames are whole BGR frames.
+                        If None, frames are considered to be single channel frames.
     Returns:
-        array: The created signal.
+        array: The created signal. When channels are given, it has one row per channel.
     """
     # Validate param...
-    if frames is None or not isinstance(frames, list) or not frames:
-        _logger.debug("The frames was null, was not a list or was an empty list")
-        raise ValueError("The frames must be a non empty list")
+    if frames is None or not hasattr(frames, '__iter__'):
+        _logger.debug("The frames was null or was not iterable")
+        raise ValueError("The frames must be a non empty iterable")
+    if length is None:
+        if not hasattr(frames, '__len__'):
+            _logger.debug("The frames length could not be determined")
+            raise ValueError("The length must be given when frames has no length")
+        length = len(frames)
+    _validate_roi(roi, video_height, video_width)
+
+    _logger.info("Mapping ROI of each frame to its mean value...")
+    return _center_signal(_reduce_roi_means(frames, roi, length, channels))
+
+
+def _reduce_video(video, roi, length, channels, decode_workers, cache, pipeline_depth, timeout, cancel_event,
+                  tracker, recorder):
+    """ Reduces the frames of the given video to the mean value of the ROI of each of the given channels, in one pass.
+    Note: We assume validations of the options were already performed when execution of this method is reached.
+
+    Params:
+        video (FrameSource): The video.
+        roi (tuple): The ROI (validated here).
+        length (int): The max. amount of frames to consume.
+        channels (str): The channels to extract (e.g 'G' or 'BGR').
+        recorder (Stats): The stats in which decoding and tracking are recorded.
+        The rest of the params are the ones of measure.
+    Returns:
+        ndarray: The ROI means (not centered), with one row per channel.
+    """
+    if cache is not None:
+        cached_signal = _get_cached_signal(video, roi, cache, decode_workers)  # Will validate the ROI
+        return np.array(cached_signal[[_CHANNEL_INDEXES[channel] for channel in channels], :length])
+    if decode_workers is not None and video.streaming and video.path is not None:
+        return _reduce_roi_means_parallel(video, roi, length, channels, decode_workers)  # Will validate the ROI
+
+    single_channel = len(channels) == 1 and tracker is None
+    frames = _get_channel_signal(video, channels) if single_channel else video.frames()
+    if pipeline_depth is not None:
+        frames = pipeline_utils.prefetch(frames, pipeline_depth, timeout, cancel_event)
+    if video.streaming:
+        # Decoding happens while the signal is created (when pipelining, only waits for frames are recorded)
+        frames = recorder.timed_iter('decode', frames)
+    if tracker is not None:
+        return _reduce_tracked_roi_means(frames, roi, tracker, video.height, video.width, length, channels, recorder)
+    _validate_roi(roi, video.height, video.width)
+    _logger.info("Mapping ROI of each frame to its mean value...")
+    if single_channel:
+        return _reduce_roi_means(frames, video.frame_roi(roi), length)[np.newaxis]
+    return _reduce_roi_means(frames, video.frame_roi(roi), length, channels)
+
+
+def _reduce_tracked_roi_means(frames, roi, tracker, video_height, video_width, length, channels, recorder):
+    """ Reduces each frame to the mean value of the ROI moved by the given tracker, as frames are consumed.
+
+    Params:
+        frames (iterable): The whole BGR frames.
+        roi (tuple): The initial ROI, or None (if the tracker has a detector).
+        tracker (RoiTracker): The tracker.
+        video_height (int): The video height
+        video_width (int): The video width
+        length (int): The max. amount of frames to consume.
+        channels (str): The channels to extract (e.g 'G' or 'BGR').
+        recorder (Stats): The stats in which tracking is recorded (as the 'tracking' stage).
+    Returns:
+        ndarray: The ROI means, with shape (len(channels), length).
+                 Length is smaller than the requested one if frames were exhausted before.
+    Raises:
+        ValueError: If there is no initial ROI, and the tracker detected no target in the first frame.
+    """
+    if roi is not None:
+        _validate_roi(roi, video_height, video_width)
+    tracker.start(roi)
+
+    _logger.info("Mapping tracked ROI of each frame to its mean value...")
+    indexes = [_CHANNEL_INDEXES[channel] for channel in channels]
+    means = np.empty((len(indexes), length), dtype=np.float64)
+    count = 0
+    for frame in islice(frames, length):
+        with recorder.stage('tracking', 1):
+            frame_roi = tracker.update(frame)
+        means[:, count] = _get_roi(frame, frame_roi).mean(axis=(0, 1))[indexes]
+        count += 1
+    _logger.debug("The tracker detected the target in {} keyframes".format(tracker.detections))
+    return means[:, :count]
+
+
+def _project_chrom(means, fps, min_freq, max_freq):
+    """ Projects the given channel means with the CHROM method: X = 3R - 2G and Y = 1.5R + G - 1.5B
+    (of the channels normalized by their mean), combined as X - alpha * Y, being alpha the ratio between the
+    deviations of X and Y in the heart band. By Parseval's theorem, those deviations are computed from the power
+    of the band bins, so X and Y do not need to be filtered (and transformed back) first.
+
+    Params:
+        means (ndarray): The ROI means, with one row per 'B', 'G' and 'R' channels.
+        fps (float): The frames per second of the video.
+        min_freq (float): The min. frequency of the heart band.
+        max_freq (float): The max. frequency of the heart band.
+    Returns:
+        ndarray: The projected signal.
+    Raises:
+        ValueError: If the mean of a channel is zero.
+    """
+    channel_means = means.mean(axis=-1, keepdims=True)
+    if np.any(channel_means <= 0):
+        _logger.debug("The ROI mean of a channel is zero, so channels can not be normalized")
+        raise ValueError("The ROI mean of every channel must be positive")
+    b, g, r = means / channel_means
+    chrominances = np.array([3 * r - 2 * g, 1.5 * r + g - 1.5 * b])
+    chrominances -= chrominances.mean(axis=-1, keepdims=True)
+    bandpass_filter = _get_bandpass_filter(chrominances.shape[-1], fps, min_freq, max_freq)
+    band_power = _filter_signal(_process_signal(chrominances), [bandpass_filter]).sum(axis=-1)
+    alpha = np.sqrt(band_power[0] / band_power[1]) if band_power[1] > 0 else 0.0
+    return chrominances[0] - alpha * chrominances[1]
+
+
+def _project_pos(means, fps):
+    """ Projects the given channel means with the POS method. In each window of 1.6 seconds, the channels are
+    normalized by their window mean, and projected on S1 = G - B and S2 = -2R + G + B, which are combined as
+    S1 + (std(S1) / std(S2)) * S2. The projections of all the windows are overlap-added.
+    As every window projection is linear in the channels, the deviations and the overlap-add are computed
+    with windowed sums (from cumulative sums) instead of one array per window, so it costs O(length).
+
+    Params:
+        means (ndarray): The ROI means, with one row per 'B', 'G' and 'R' channels.
+        fps (float): The frames per second of the video.
+    Returns:
+        ndarray: The projected signal.
+    Raises:
+        ValueError: If the mean of a channel in a window is zero.
+    """
+    window_length = min(means.shape[-1], max(2, int(round(_POS_WINDOW_SECONDS * fps))))
+    window_means = _window_sums(means, window_length) / window_length
+    if np.any(window_means <= 0):
+        _logger.debug("The ROI mean of a channel is zero in a window, so channels can not be normalized")
+        raise ValueError("The ROI mean of every channel must be positive")
+    # The covariance of each pair of normalized channels in each window (normalized channels have mean 1)
+    products = _window_sums(means[:, np.newaxis] * means[np.newaxis], window_length) / window_length
+    covariances = products / (window_means[:, np.newaxis] * window_means[np.newaxis]) - 1
+    variances = [np.einsum('i,ijk,j->k', axis, covariances, axis) for axis in _POS_AXES]
+    alpha = np.sqrt(np.divide(variances[0], variances[1], out=np.zeros_like(variances[0]),
+                              where=variances[1] > 0))
+    # The coefficient of each (not normalized) channel in the projection of each window.
+    # As both axes sum 0, the projections already have zero mean
+    coefficients = (_POS_AXES[0][:, np.newaxis] + alpha * _POS_AXES[1][:, np.newaxis]) / window_means
+    # Overlap-add: each sample is weighted by the sum of the coefficients of the windows that contain it
+    padding = np.zeros((coefficients.shape[0], window_length - 1))
+    weights = _window_sums(np.concatenate((padding, coefficients, padding), axis=-1), window_length)
+    return np.sum(means * weights, axis=0)
+
+
+def _window_sums(signal, window_length):
+    """
+    Params:
+        signal (ndarray): The signal (summed along its last axis).
+        window_length (int): The length of the windows.
+    Returns:
+        ndarray: The sum of each window of the given length (i.e signal.shape[-1] - window_length + 1 sums).
+    """
+    sums = np.cumsum(signal, axis=-1)
+    sums = np.concatenate((np.zeros(signal.shape[:-1] + (1,)), sums), axis=-1)
+    return sums[..., window_length:] - sums[..., :-window_length]
+
+
+def _validate_pipeline_options(pipeline_depth, timeout):
+    """ Validates the pipelining options (the depth and timeout themselves are validated by pipeline_utils.prefetch).
+
+    Params:
+        pipeline_depth (int): The depth of the queue of decoded frames, or None.
+        timeout (float): The max. amount of seconds the pipelined ROI reduction can take, or None.
+    Raises:
+        ValueError: If a timeout is given without a pipeline depth (as it would be ignored).
+    """
+    if timeout is not None and pipeline_depth is None:
+        _logger.debug("A timeout was given, but the ROI reduction is not pipelined")
+        raise ValueError("A timeout requires a pipeline depth")
+
+
+def _validate_decode_workers(video, decode_workers):
+    """ Validates that the given video can be decoded by the given decode workers
+    (the amount of workers itself is validated when decoding).
+
+    Params:
+        video (FrameSource): The video to measure.
+        decode_workers (int): The decode workers requested to measure, or None.
+    Raises:
+        ValueError: If decode workers are given, and the video is not a streaming video file
+                    (as the workers would be ignored).
+    """
+    if decode_workers is not None and (not video.streaming or video.path is None):
+        _logger.debug("Decode workers were given, but the video is not a streaming video file")
+        raise ValueError("Decoding in parallel requires a streaming video file")
+
+
+def _validate_tracker(video, tracker, cache, decode_workers):
+    """ Validates the given tracker can be used to measure the given video.
+
+    Params:
+        video (FrameSource): The video.
+        tracker (RoiTracker): The tracker.
+        cache (SignalCache): The cache requested to measure, or None.
+        decode_workers (int): The decode workers requested to measure, or None.
+    Raises:
+        ValueError: If the tracker is not a RoiTracker, if the video does not keep whole frames,
+                    or if a cache or decode workers were requested.
+    """
+    if not isinstance(tracker, tracking_utils.RoiTracker):
+        _logger.debug("The tracker is not a RoiTracker instance")
+        raise ValueError("The tracker must be a RoiTracker instance")
+    if video.channel is not None or video.crop is not None:
+        _logger.debug("The video does not keep whole frames, so the ROI can not be tracked")
+        raise ValueError("Tracking the ROI requires a video that keeps all channels of whole frames")
+    if cache is not None or decode_workers is not None:
+        _logger.debug("A cache or decode workers were requested together with a tracker")
+        raise ValueError("A tracked ROI can not be used together with a cache or decode workers")
+
+
+def _get_cached_signal(video, roi, cache, decode_workers=None):
+    """ Gets the ROI means of all channels and frames of the given video from the given cache,
+    extracting and caching them if they were not cached.
+
+    Params:
+        video (Video): The video from where the means are extracted.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        cache (SignalCache): The cache.
+        decode_workers (int): The amount of worker processes among which decoding is split (streaming videos only).
+    Returns:
+        ndarray: The ROI means (not centered), with one row per 'B', 'G' and 'R' channels.
+    Raises:
+        ValueError: If the video is not a video file, or does not keep all channels.
+    """
+    if video.path is None:
+        _logger.debug("Could not cache the signal. The frames do not come from a video file")
+        raise ValueError("Caching signals requires a video file")
+    if video.channel is not None:
+        _logger.debug("Could not cache the signal. The video only keeps the {} channel".format(video.channel))
+        raise ValueError("Caching signals requires a video that keeps all channels")
+    cached = cache.get(video.path, roi, video.stride)
+    if cached is not None:
+        _logger.info("Using cached ROI means...")
+        return cached[0]
+
+    if decode_workers is not None and video.streaming:  # Only video files have a path (checked above)
+        signal = _reduce_roi_means_parallel(video, roi, video.length, 'BGR', decode_workers)  # Will validate the ROI
+    else:
+        _validate_roi(roi, video.height, video.width)
+        _logger.info("Mapping ROI of each frame to its mean value...")
+        signal = _reduce_roi_means(video.frames(), video.frame_roi(roi), video.length, 'BGR')
+    cache.put(video.path, roi, signal, video.fps, video.stride)
+    return signal
+
+
+def _reduce_roi_means_parallel(video, roi, length, channels, workers):
+    """ Reduces the frames of the given streaming video to the mean value of their ROI, decoding it in parallel.
+    The frames range is split into one chunk per worker process. Each worker seeks to the start of its chunk,
+    and reduces its frames to ROI means, so only the means are sent back. Chunks are then stitched in order.
+    Note: Seeking relies on OpenCV's CAP_PROP_POS_FRAMES, which is frame-accurate for most (but not all) codecs.
+
+    Params:
+        video (Video): The streaming video from where the signal will be created.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        length (int): The max. amount of frames to consume.
+        channels (str): The channels to extract (e.g 'G' or 'BGR').
+        workers (int): The amount of worker processes.
+    Returns:
+        ndarray: The ROI means, with one row per channel.
+    """
+    if workers is None or not isinstance(workers, int) or workers <= 0:
+        _logger.debug("Wrong amount of workers. Must be a positive integer")
+        raise ValueError("The amount of workers must be a positive integer")
+    if not channels or not all(channel in _CHANNEL_INDEXES for channel in channels):
+        _logger.debug("Wrong channels were passed. Must be 'R', 'G' or 'B', but were {}".format(channels))
+        raise ValueError("The channels were wrong. Must be 'R', 'G' or 'B")
+    if video.channel is not None and channels != video.channel:
+        _logger.debug("The {} channels were requested, but only the {} one is kept".format(channels, video.channel))
+        raise ValueError("The channels were not kept when decoding the video")
+    _validate_roi(roi, video.height, video.width)
+    frame_roi = video.frame_roi(roi)
+
+    _logger.info("Mapping ROI of each frame to its mean value, using {} workers...".format(workers))
+    bounds = np.linspace(0, length, min(workers, length) + 1).astype(int)
+    chunks_count = len(bounds) - 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        chunks = list(executor.map(_reduce_chunk, [video.path] * chunks_count, [frame_roi] * chunks_count,
+                                   bounds[:-1], bounds[1:], [channels] * chunks_count,
+                                   [video.decoding_options] * chunks_count))
+    finally:
+        executor.shutdown()
+    return np.concatenate(chunks, axis=-1)
+
+
+def _reduce_chunk(path, roi, start, stop, channels, decoding_options=None):
+    """ Decodes the given range of frames of a video, reducing them to ROI means. This is executed by worker processes.
+
+    Params:
+        path (str): The path to the video.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI (in decoded frame
+                     coordinates).
+        start (int): The index of the first frame of the chunk.
+        stop (int): The index of the frame at which the chunk ends (exclusive).
+        channels (str): The channels to extract (e.g 'G' or 'BGR').
+        decoding_options (dict): The decoding options of the video (see Video.decoding_options).
+    Returns:
+        ndarray: The ROI means, with shape (len(channels), stop - start).
+    """
+    video = video_utils.Video(path, streaming=True, **(decoding_options or {}))
+    frames = video.frames(None, int(start), int(stop))
+    if video.channel is not None:  # Frames are already single channel
+        return _reduce_roi_means(frames, roi, int(stop - start))[np.newaxis]
+    return _reduce_roi_means(frames, roi, int(stop - start), channels)
+
+
+def _validate_roi(roi, video_height, video_width):
+    """ Validates the given ROI.
+
+    Params:
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        video_height (int): The video height
+        video_width (int): The video width
+    Raises:
+        ValueError: If the ROI is not a 4-dimensional tuple of ints, or if it is out of range or empty.
+    """
     if roi is None or not isinstance(roi, tuple) or len(roi) != 4 or not all(isinstance(vertex, int) for vertex in roi):
         _logger.debug("Wrong ROI definition. Must be a 4-Dimensional tuple of ints")
         raise ValueError("Invalid ROI definition. Must be a 4-Dimensional tuple of ints")
@@ -114,16 +875,88 @@ def _create_signal(frames, roi, video_height, video_width):
     if roi[0] < 0 or roi[1] >= video_height or roi[2] < 0 or roi[3] >= video_width:
         _logger.debug("The ROI is out of range")
         raise ValueError("Wrong ROI. Is out of range")
+    if roi[1] <= roi[0] or roi[3] <= roi[2]:
+        _logger.debug("The ROI is empty")
+        raise ValueError("Wrong ROI. Is empty")
 
-    _logger.info("Getting ROI from frames...")
-    roi_frames = map(lambda frame: _get_roi(frame, roi), frames)
-    _logger.info("Mapping ROI frames to mean value...")
-    raw_signal = map(lambda roi_frame: np.mean(roi_frame), roi_frames)  # Calculate the mean of the ROI
-    _logger.info("Calculating mean of the raw signal...")
-    raw_signal_mean = np.mean(raw_signal)  # Calculate the mean of the signal to be substracted to it
+
+def _center_signal(signal):
+    """ Creates the final signal to be processed, subtracting its mean (in place).
+
+    Params:
+        signal (ndarray): The ROI means, with one row per channel, or a one dimensional array.
+    Returns:
+        ndarray: The signal without its mean.
+    """
+    if signal.shape[-1] == 0:
+        _logger.debug("The frames was an empty iterable")
+        raise ValueError("The frames must be a non empty iterable")
 
     _logger.info("Creating signal to process...")
-    return np.array(map(lambda point: point - raw_signal_mean, raw_signal))  # Creates the final signal to be processed
+    signal -= np.mean(signal, axis=-1, keepdims=True)
+    return signal
+
+
+def _reduce_roi_means(frames, roi, length, channels=None):
+    """ Reduces each frame to the mean value of its ROI, as frames are consumed.
+    Results are written into a preallocated array, and frames are not kept after being reduced.
+    Note: We assume validations were already performed when execution of this method is reached.
+
+    Params:
+        frames (iterable): The frames to be reduced.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        length (int): The max. amount of frames to consume.
+        channels (str): The channels to extract (e.g 'G' or 'BGR') when frames are whole BGR frames.
+                        If None, frames are considered to be single channel frames.
+    Returns:
+        ndarray: The ROI means, with shape (length,), or (len(channels), length) if channels are given.
+                 Length is smaller than the requested one if frames were exhausted before.
+    """
+    indexes = None if channels is None else [_CHANNEL_INDEXES[channel] for channel in channels]
+    means = np.empty(length if indexes is None else (len(indexes), length), dtype=np.float64)
+    count = 0
+    for frame in islice(frames, length):
+        roi_frame = _get_roi(frame, roi)
+        if indexes is None:
+            means[count] = roi_frame.mean()
+        elif len(indexes) == 1:
+            means[0, count] = roi_frame[:, :, indexes[0]].mean()
+        else:
+            means[:, count] = roi_frame.mean(axis=(0, 1))[indexes]
+        count += 1
+    return means[..., :count]
+
+
+def _reduce_rois_means(frames, rois, length):
+    """ Reduces each frame to the mean value of each of the given ROIs, as frames are consumed.
+    An integral image of the bounding box of all the ROIs is computed for each frame,
+    so each ROI mean costs four lookups, regardless of its size.
+    Note: We assume validations were already performed when execution of this method is reached.
+
+    Params:
+        frames (iterable): The single channel frames to be reduced.
+        rois (list): The non empty rectangular ROIs.
+        length (int): The max. amount of frames to consume.
+    Returns:
+        ndarray: The ROI means, with shape (len(rois), length).
+                 Length is smaller than the requested one if frames were exhausted before.
+    """
+    limits = np.array(rois, dtype=np.intp)
+    top, left = limits[:, 0].min(), limits[:, 2].min()
+    bottom, right = limits[:, 1].max(), limits[:, 3].max()
+    upper, lower = limits[:, 0] - top, limits[:, 1] - top  # Limits relative to the bounding box
+    lefts, rights = limits[:, 2] - left, limits[:, 3] - left
+    areas = ((lower - upper) * (rights - lefts)).astype(np.float64)
+
+    means = np.empty((len(rois), length), dtype=np.float64)
+    count = 0
+    for frame in islice(frames, length):
+        integral = cv2.integral(np.ascontiguousarray(frame[top:bottom, left:right]), sdepth=cv2.CV_64F)
+        means[:, count] = integral[lower, rights] - integral[upper, rights] - integral[lower, lefts] \
+            + integral[upper, lefts]
+        count += 1
+    means /= areas[:, np.newaxis]
+    return means[:, :count]
 
 
 def _get_roi(frame, roi):
@@ -143,20 +976,87 @@ def _get_roi(frame, roi):
     return frame[roi[0]:roi[1], roi[2]:roi[3]]
 
 
-def _process_signal(signal):
+def _process_signal(signal, backend=None, length=None, estimator='periodogram', segment_length=None, overlap=0.5,
+                    window='hann'):
     """ Process the given signal, transforming it into the frequency domain.
+    As the signal is real, only the non-negative frequencies power spectrum is computed.
     Params:
         signal (array): The signal to be processed:
+        backend (str): The FFT backend to use (see fft.available_backends()). If None, the default one is used.
+        length (int): The length to which the signal (or each Welch segment) is zero-padded before being transformed.
+                      If None, it is not padded.
+        estimator (str): The spectral estimator ('periodogram' or 'welch', see ESTIMATORS).
+        segment_length (int): The length of the Welch segments. If None, 256 (or the signal length, if shorter).
+        overlap (float): The fraction of each Welch segment that overlaps the next one.
+        window (str): The window applied to each Welch segment (see WINDOWS).
     Returns:
-        array: The processed signal
+        array: The processed signal (i.e the power of each of the non-negative frequencies).
+               With the 'welch' estimator, the mean power of the segments.
     """
     # Validate param...
     if signal is None or not isinstance(signal, np.ndarray):
         _logger.error("Could not process signal. Must not be null, and must be instance of numpy's array")
         raise ValueError("The signal must not be null and must be a numpy array")
+    _validate_estimator_options(estimator, segment_length, overlap, window)
+    if estimator == 'welch':
+        signal = _segment_signal(signal, segment_length, overlap, window)
+    if length is not None and length < signal.shape[-1]:
+        _logger.error("Could not process signal. The padded length is smaller than the signal length")
+        raise ValueError("The length must not be smaller than the signal length")
+
+    if length is not None and length > signal.shape[-1]:
+        _logger.info("Zero-padding signal to {} samples...".format(length))
+        padded_signal = np.zeros(signal.shape[:-1] + (length,), dtype=signal.dtype)
+        padded_signal[..., :signal.shape[-1]] = signal
+        signal = padded_signal
 
     _logger.info("Processing signal...")
-    return np.abs(fft.fftshift(fft.fft(signal))) ** 2
+    # All the Welch segments are transformed in one batched call (the native backend reuses the plan of the length)
+    power = np.abs(fft.rfft(signal, backend)) ** 2
+    return np.mean(power, axis=-2) if estimator == 'welch' else power
+
+
+def _segment_signal(signal, segment_length, overlap, window):
+    """ Splits the given signal into overlapping windowed segments (for the Welch estimator).
+    Segments are taken from a strided view of the signal, so only the windowed copy is allocated.
+    Trailing samples that do not fill a segment are discarded.
+
+    Params:
+        signal (ndarray): The signal (segmented along its last axis).
+        segment_length (int): The length of the segments. If None, 256 (or the signal length, if shorter).
+        overlap (float): The fraction of each segment that overlaps the next one.
+        window (str): The window applied to each segment (see WINDOWS).
+    Returns:
+        ndarray: The windowed segments, with shape signal.shape[:-1] + (segments, segment_length).
+    Raises:
+        ValueError: If the segment length is greater than the signal length.
+    """
+    segment_length = _transformed_length(signal, 'welch', segment_length)
+    if segment_length > signal.shape[-1]:
+        _logger.debug("The segment length is greater than the signal length")
+        raise ValueError("The segment length must not be greater than the signal length")
+    step = max(1, int(round(segment_length * (1 - overlap))))
+    count = 1 + (signal.shape[-1] - segment_length) // step
+    signal = np.ascontiguousarray(signal, dtype=np.float64)
+    segments = np.lib.stride_tricks.as_strided(signal, shape=signal.shape[:-1] + (count, segment_length),
+                                               strides=signal.strides[:-1] + (step * signal.strides[-1],
+                                                                              signal.strides[-1]))
+    # Each segment is centered, so its mean does not leak into the low frequencies through the window
+    return (segments - segments.mean(axis=-1, keepdims=True)) * WINDOWS[window](segment_length)
+
+
+def _transformed_length(signal, estimator, segment_length):
+    """
+    Params:
+        signal (ndarray): The signal.
+        estimator (str): The spectral estimator.
+        segment_length (int): The length of the Welch segments, or None.
+    Returns:
+        int: The length of the series transformed by the given estimator (before any zero-padding).
+    """
+    if estimator != 'welch':
+        return signal.shape[-1]
+    return segment_length if segment_length is not None else min(_DEFAULT_SEGMENT_LENGTH, signal.shape[-1])
 
 
 def _filter_signal(signal, filters=None):
@@ -174,10 +1074,9 @@ def _filter_signal(signal, filters=None):
         raise ValueError("Wrong type for signal")
     if filters is None:
         filters = []
-    invalid_filters = filter(lambda filter_function: len(getargspec(filter_function).args) != 1, filters)
-    if invalid_filters:
-        _logger.debug("A filter which does not receive only one argument was tried to be used.")
-        raise ValueError("All filters should receive one argument (the signal to be filtered)")
+    if not all(callable(filter_function) for filter_function in filters):
+        _logger.debug("A filter which is not a function was tried to be used.")
+        raise ValueError("All filters should be functions receiving one argument (the signal to be filtered)")
 
     _logger.info("Filtering processed signal...")
     # Apply all filters
@@ -194,7 +1093,7 @@ def _filter_signal(signal, filters=None):
 def _create_bandpass_filter(freqs, min_freq, max_freq):
     """ Creates a bandpass filter (a filter that passes frequencies between a min. and a max. value).
     Params:
-        freqs (ndarray): An array containing the frequencies.
+        freqs (ndarray): An array containing the frequencies (e.g the non-negative frequencies of a real signal).
         min_freq (float): The minimum frequency the filter will pass.
         max_freq (float): The maximum frequency the filter will pass.
     Returns:
@@ -214,6 +1113,49 @@ def _create_bandpass_filter(freqs, min_freq, max_freq):
         raise ValueError("The given min and max. frequencies pair is invalid. "
                          "The max. frequency must not be smaller than the max. frequency")
 
-    # Create anonymous function that takes a signal as argument and applies the filtering to it
-    length = freqs.shape[0]
-    return lambda signal: np.array([signal[i] if min_freq <= freqs[i] <= max_freq else 0.0 for i in range(length)])
+    # Create anonymous function that takes a signal as argument and applies the filtering to it,
+    # multiplying it by a precomputed mask (1.0 for passed frequencies, and 0.0 for the rest)
+    mask = ((min_freq <= freqs) & (freqs <= max_freq)).astype(np.float64)
+    mask.flags.writeable = False
+    return lambda signal: signal * mask
+
+
+def _get_bandpass_filter(length, fps, min_freq, max_freq):
+    """ Gets a bandpass filter for the non-negative frequencies spectrum of a real signal.
+    Filters are cached by length, fps and band, so they are only created once for videos with the same properties
+    (at most _BANDPASS_FILTERS_CACHE_SIZE of them, evicting the least recently used one).
+    Params:
+        length (int): The length of the signal (or the padded length) from which the spectrum was obtained.
+        fps (float): The frames per second of the video from which the spectrum was obtained.
+        min_freq (float): The minimum frequency the filter will pass.
+        max_freq (float): The maximum frequency the filter will pass.
+    Returns:
+        function: A function that takes a signal and returns the filtered signal, applying bandpass filtering.
+    """
+    key = (length, fps, min_freq, max_freq)
+    with _bandpass_filters_lock:
+        bandpass_filter = _bandpass_filters.pop(key, None)
+        if bandpass_filter is None:
+            _logger.debug("Creating bandpass filter for {} samples, {} fps and [{}, {}] band".format(*key))
+            bandpass_filter = _create_bandpass_filter(fft.rfftfreq(length, 1.0 / fps), min_freq, max_freq)
+            if len(_bandpass_filters) >= _BANDPASS_FILTERS_CACHE_SIZE:
+                _bandpass_filters.popitem(last=False)
+        _bandpass_filters[key] = bandpass_filter  # Inserted (or re-inserted) as the most recently used one
+    return bandpass_filter
+
+
+def _peak_quality(filtered_signal, peaks):
+    """ Calculates the quality of the peaks of the given filtered spectra,
+    as the fraction of the bandpass power that is in the peak bin and its two neighbours.
+
+    Params:
+        filtered_signal (ndarray): The filtered spectra, with one row per signal.
+        peaks (ndarray): The index of the peak of each spectrum.
+    Returns:
+        ndarray: The quality of each peak (between 0 and 1).
+    """
+    padded = np.pad(filtered_signal, [(0, 0), (1, 1)], 'constant')  # So neighbours of the edges are zeros
+    rows = np.arange(filtered_signal.shape[0])
+    peak_power = padded[rows, peaks] + padded[rows, peaks + 1] + padded[rows, peaks + 2]
+    band_power = filtered_signal.sum(axis=-1)
+    return np.where(band_power > 0, peak_power / np.where(band_power > 0, band_power, 1.0), 0.0)
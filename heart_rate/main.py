@@ -1,9 +1,18 @@
 # -*- coding: utf-8 -*-
 import argparse
+import json
 import logging
+import os
 import sys
 
+import batch_utils
+import cache_utils
+import fft
 import heart_rate_utils
+import profiling_utils
+import realtime_utils
+import server_utils
+import tracking_utils
 import video_utils
 from heart_rate import __version__
 
@@ -46,9 +55,137 @@ def parse_args(args):
         '-vp',
         '--video-path',
         dest="video_path",
-        help="Set that path to the video to analyze.",
+        help="Set that path to the video to analyze. It can also be a directory of images (see --fps), "
+             "or '-' to read raw BGR frames from the standard input (see --frame-size and --fps).",
         action='store',
         type=str)
+    parser.add_argument(
+        '--fps',
+        dest="fps",
+        help="Set the frames per second of an image directory, or of raw frames.",
+        action='store',
+        type=float)
+    parser.add_argument(
+        '--frame-size',
+        dest="frame_size",
+        help="Set the WIDTHxHEIGHT (e.g 640x480) of the raw frames read from the standard input.",
+        action='store',
+        type=parse_frame_size)
+    parser.add_argument(
+        '--frame-count',
+        dest="frame_count",
+        help="Read at most the given amount of raw frames, on demand (else, the standard input is read until its end).",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '-s',
+        '--streaming',
+        dest="streaming",
+        help="Decode the video frames on demand instead of loading them all into memory.",
+        action='store_true')
+    parser.add_argument(
+        '--store',
+        dest="store",
+        help="Store decoded frames in one contiguous array, or in a memory mapped file (see --store-path).",
+        action='store',
+        choices=video_utils.STORES)
+    parser.add_argument(
+        '--store-path',
+        dest="store_path",
+        help="Set the path to the file backing the memmap store. If it exists, the video is not decoded again.",
+        action='store',
+        type=str)
+    parser.add_argument(
+        '-dw',
+        '--decode-workers',
+        dest="decode_workers",
+        help="Split the video decoding among the given amount of worker processes (requires streaming).",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--pipeline-depth',
+        dest="pipeline_depth",
+        help="Decode frames in a background thread, handing them to the ROI reduction through a queue of the given "
+             "depth.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--timeout',
+        dest="timeout",
+        help="Set the max. amount of seconds the pipelined ROI reduction can take (requires --pipeline-depth).",
+        action='store',
+        type=float)
+    parser.add_argument(
+        '--single-channel',
+        dest="single_channel",
+        help="Only keep the processed channel of each decoded frame.",
+        action='store_true')
+    parser.add_argument(
+        '--crop-margin',
+        dest="crop_margin",
+        help="Only keep the ROI, plus the given margin (in pixels), of each decoded frame.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--stride',
+        dest="stride",
+        help="Only decode one of every STRIDE frames. If 'auto', the greatest stride that keeps the frame rate "
+             "above twice the Nyquist rate of the max. frequency is used.",
+        action='store',
+        type=parse_stride)
+
+    parser.add_argument(
+        '--cache-dir',
+        dest="cache_dir",
+        help="Set the directory where extracted signals are cached, so videos are not decoded again.",
+        action='store',
+        type=str)
+    parser.add_argument(
+        '--cache-size',
+        dest="cache_size",
+        help="Set the max. size (in megabytes) of the cached signals.",
+        action='store',
+        type=int)
+
+    # Batch arguments
+    parser.add_argument(
+        '-b',
+        '--batch',
+        dest="batch",
+        help="Measure every video in the given directory, glob pattern or manifest file (one path per line).",
+        action='store',
+        type=str)
+    parser.add_argument(
+        '-w',
+        '--workers',
+        dest="workers",
+        help="Set the amount of worker processes used in batch mode.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '-o',
+        '--output',
+        dest="output",
+        help="Set the path to the file where batch results are written (standard output if not set).",
+        action='store',
+        type=str)
+    parser.add_argument(
+        '--output-format',
+        dest="output_format",
+        help="Set the format of the batch results.",
+        action='store',
+        choices=batch_utils.ResultWriter.FORMATS)
+
+    # Server arguments
+    parser.add_argument(
+        '--serve',
+        dest="serve",
+        help="Serve JSON lines measure requests from the standard input, or from the given Unix socket, "
+             "using a pool of --workers threads.",
+        action='store',
+        nargs='?',
+        const='-',
+        type=str)
 
     # Heart Beat measure arguments
     parser.add_argument(
@@ -79,6 +216,29 @@ def parse_args(args):
         help="Set right limit of the rectangular ROI.",
         action='store',
         type=int)
+    parser.add_argument(
+        '--track',
+        dest="track",
+        help="Move the ROI along with the subject, tracking it on downscaled frames.",
+        action='store_true')
+    parser.add_argument(
+        '--detector',
+        dest="detector",
+        help="Detect the ROI on keyframes, tracking it in between (the ROI limits are then optional).",
+        action='store',
+        choices=tracking_utils.DETECTORS)
+    parser.add_argument(
+        '--keyframe-interval',
+        dest="keyframe_interval",
+        help="Set the amount of frames between keyframes, on which the ROI is detected and its template refreshed.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--cascade',
+        dest="cascade",
+        help="Set the path to the cascade classifier used by the face detector.",
+        action='store',
+        type=str)
     parser.add_argument(
         '-mF',
         '--min-freq',
@@ -114,6 +274,91 @@ def parse_args(args):
         help="Set the channel to be processed to BLUE.",
         action='store_const',
         const="R")
+    parser.add_argument(
+        '--projection',
+        dest="projection",
+        help="Combine the R, G and B channels with a chrominance projection, measuring each channel as well.",
+        action='store',
+        choices=heart_rate_utils.PROJECTIONS)
+    parser.add_argument(
+        '--all-frames',
+        dest="use_all_frames",
+        help="Use every frame of the video, instead of the first power of 2 amount of frames.",
+        action='store_true')
+    parser.add_argument(
+        '--fft-length',
+        dest="fft_length",
+        help="Zero-pad the signal to the given length before computing its FFT.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--interpolation',
+        dest="interpolation",
+        help="Refine the spectrum peak between bins, fitting a parabola (to the logarithm of the power, if gaussian).",
+        action='store',
+        choices=heart_rate_utils.INTERPOLATIONS)
+    parser.add_argument(
+        '--zoom',
+        dest="zoom",
+        help="Evaluate the spectrum only at the given amount of frequencies between the min. and max. frequencies.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--estimator',
+        dest="estimator",
+        help="Set the spectral estimator. 'welch' averages the spectra of overlapping windowed segments.",
+        action='store',
+        choices=heart_rate_utils.ESTIMATORS)
+    parser.add_argument(
+        '--segment-length',
+        dest="segment_length",
+        help="Set the length of the Welch segments (256 by default).",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--overlap',
+        dest="overlap",
+        help="Set the fraction of each Welch segment that overlaps the next one.",
+        action='store',
+        type=float)
+    parser.add_argument(
+        '--segment-window',
+        dest="segment_window",
+        help="Set the window applied to each Welch segment.",
+        action='store',
+        choices=sorted(heart_rate_utils.WINDOWS))
+    parser.add_argument(
+        '--grid',
+        dest="grid",
+        help="Split the ROI into a grid of ROWSxCOLUMNS tiles (e.g 3x3), measuring each of them in the same pass.",
+        action='store',
+        type=parse_grid)
+    parser.add_argument(
+        '--window-size',
+        dest="window_size",
+        help="Measure the heart beat rate over a sliding window of the given amount of frames.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--hop-size',
+        dest="hop_size",
+        help="Set the amount of frames between sliding window readings.",
+        action='store',
+        type=int)
+    parser.add_argument(
+        '--profile',
+        dest="profile",
+        help="Print the time, frames and memory of each stage as JSON, or dump them to the given path.",
+        action='store',
+        nargs='?',
+        const='-',
+        type=str)
+    parser.add_argument(
+        '--fft-backend',
+        dest="fft_backend",
+        help="Set the implementation used to compute FFTs.",
+        action='store',
+        choices=fft.available_backends())
 
     # Set default values
     parser.set_defaults(log_level=logging.WARN)
@@ -121,10 +366,150 @@ def parse_args(args):
     parser.set_defaults(min_freq=0.4)
     parser.set_defaults(max_freq=7.0)
     parser.set_defaults(channel="G")
+    parser.set_defaults(hop_size=1)
+    parser.set_defaults(keyframe_interval=30)
+    parser.set_defaults(stride=1)
+    parser.set_defaults(estimator='periodogram')
+    parser.set_defaults(overlap=0.5)
+    parser.set_defaults(segment_window='hann')
+    parser.set_defaults(output_format="csv")
+    parser.set_defaults(cache_size=512)
+    parser.set_defaults(fft_backend=fft.get_backend())
 
     return parser.parse_args(args)
 
 
+def parse_grid(value):
+    """Parse a grid definition
+
+    Args:
+      value (str): grid definition, as ROWSxCOLUMNS
+
+    Returns:
+      (int, int): amount of rows and columns
+    """
+    try:
+        rows, columns = [int(part) for part in value.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid grid '{}'. Must be ROWSxCOLUMNS (e.g 3x3)".format(value))
+    return rows, columns
+
+
+def parse_frame_size(value):
+    """Parse a frame size
+
+    Args:
+      value (str): frame size, as WIDTHxHEIGHT
+
+    Returns:
+      (int, int): width and height
+    """
+    try:
+        width, height = [int(part) for part in value.lower().split('x')]
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid frame size '{}'. Must be WIDTHxHEIGHT (e.g 640x480)".format(value))
+    return width, height
+
+
+def parse_stride(value):
+    """Parse a stride
+
+    Args:
+      value (str): a positive amount of frames, or 'auto'
+
+    Returns:
+      int or str: the stride, or 'auto'
+    """
+    if value == video_utils.AUTO_STRIDE:
+        return value
+    try:
+        stride = int(value)
+    except ValueError:
+        stride = 0
+    if stride <= 0:
+        raise argparse.ArgumentTypeError("Invalid stride '{}'. Must be a positive integer or 'auto'".format(value))
+    return stride
+
+
+def decoding_arguments(args):
+    """Gets the decoding arguments from the command line parameters
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+
+    Returns:
+      dict: keyword arguments for video_utils.decoding_options
+    """
+    return {'channel': args.channel if args.single_channel else None, 'crop_margin': args.crop_margin,
+            'stride': args.stride}
+
+
+def estimator_arguments(args):
+    """Gets the spectral estimator arguments from the command line parameters
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+
+    Returns:
+      dict: keyword arguments for heart_rate_utils.measure
+    """
+    return {'estimator': args.estimator, 'segment_length': args.segment_length, 'overlap': args.overlap,
+            'window': args.segment_window}
+
+
+def create_source(args, roi, stats=None):
+    """Creates the source of the frames to analyze
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      roi (tuple): the ROI to measure (used to decode only what is needed)
+      stats (:obj:`Stats`): stats in which decoding is recorded, or None
+
+    Returns:
+      :obj:`FrameSource`: raw frames from the standard input if the video path is '-', the images of the video path
+      if it is a directory, or else the video
+    """
+    if args.video_path == '-':
+        if args.frame_size is None or args.fps is None:
+            raise ValueError("Reading raw frames requires --frame-size and --fps")
+        return video_utils.RawStreamSource(sys.stdin, args.frame_size[0], args.frame_size[1], args.fps,
+                                           args.frame_count)
+    if os.path.isdir(args.video_path):
+        if args.fps is None:
+            raise ValueError("Reading an image directory requires --fps")
+        return video_utils.ImageDirectorySource(args.video_path, args.fps)
+    options = video_utils.decoding_options(args.video_path, roi, max_freq=args.max_freq, **decoding_arguments(args))
+    return video_utils.Video(args.video_path, streaming=uses_streaming(args),
+                             store=args.store, store_path=args.store_path, stats=stats, **options)
+
+
+def uses_streaming(args):
+    """Tells whether the video is streamed
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+
+    Returns:
+      bool: whether streaming was requested, or a signal cache is used (so frames are only decoded, lazily,
+      if the signal was not cached) without a store
+    """
+    return args.streaming or (args.cache_dir is not None and args.store is None)
+
+
+def create_tracker(args):
+    """Creates the ROI tracker, if tracking was requested
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+
+    Returns:
+      :obj:`RoiTracker`: the tracker, or None if neither --track nor --detector were given
+    """
+    if not args.track and args.detector is None:
+        return None
+    return tracking_utils.RoiTracker(args.detector, args.keyframe_interval, cascade_path=args.cascade)
+
+
 def setup_logging(log_level):
     """Setup basic logging
 
@@ -146,25 +531,197 @@ def main(args):
     args = parse_args(args)
     setup_logging(args.log_level)
     _logger.info("Starting application...")
+    fft.set_backend(args.fft_backend)
+    if args.timeout is not None and args.pipeline_depth is None:
+        _logger.error("The --timeout argument requires --pipeline-depth")
+        exit(1)
 
+    cache = None
+    if args.cache_dir is not None:
+        try:
+            cache = cache_utils.SignalCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        except Exception as e:
+            _logger.error("Could not create signal cache. Error message is: \"{}\"".format(e.message))
+            exit(1)
+
+    if args.batch is not None:
+        run_batch(args, cache)
+        return
+    if args.serve is not None:
+        run_server(args, cache)
+        return
+
+    roi = (args.roi_upper_limit, args.roi_lower_limit, args.roi_left_limit, args.roi_right_limit)
+    if args.detector is not None and roi == (None, None, None, None):
+        roi = None  # The ROI is detected
+    stats = profiling_utils.Stats() if args.profile is not None else None
+    if args.decode_workers is not None and (args.video_path == '-' or not uses_streaming(args)
+                                            or (args.video_path is not None and os.path.isdir(args.video_path))):
+        _logger.error("The --decode-workers argument requires streaming a video file (see --streaming)")
+        exit(1)
+    if stats is not None and (args.grid is not None or args.window_size is not None):
+        _logger.error("Profiling can only be used to measure the average heart beat rate")
+        exit(1)
+    if (args.grid is not None or args.window_size is not None) \
+            and (cache is not None or args.decode_workers is not None or args.pipeline_depth is not None):
+        _logger.error("The signal cache, decode workers and pipelining can only be used to measure the average "
+                      "heart beat rate")
+        exit(1)
     try:
-        video = video_utils.Video(args.video_path)
+        video = create_source(args, roi, stats)
     except Exception as e:
         _logger.error("Could not create video instance. Error message is: \"{}\"".format(e.message))
         exit(1)
+    try:
+        tracker = create_tracker(args)
+    except Exception as e:
+        _logger.error("Could not create ROI tracker. Error message is: \"{}\"".format(e.message))
+        exit(1)
+    if tracker is not None and (args.grid is not None or args.window_size is not None):
+        _logger.error("A tracked ROI can only be used to measure the average heart beat rate")
+        exit(1)
+    if args.projection is not None and (args.grid is not None or args.window_size is not None):
+        _logger.error("A projection can only be used to measure the average heart beat rate")
+        exit(1)
 
-    roi = (args.roi_upper_limit, args.roi_lower_limit, args.roi_left_limit, args.roi_right_limit)
     min_freq = args.min_freq
     max_freq = args.max_freq
     channel = args.channel
     try:
-        # noinspection PyUnboundLocalVariable
-        result = heart_rate_utils.measure(video, roi, min_freq, max_freq, channel)
-        print("Average heart beat rate is {}".format(result))
+        if args.grid is not None:
+            rois = heart_rate_utils.grid_rois(roi, args.grid[0], args.grid[1])
+            # noinspection PyUnboundLocalVariable
+            results, qualities = heart_rate_utils.measure_rois(video, rois, min_freq, max_freq, channel,
+                                                               use_all_frames=args.use_all_frames)
+            for tile_roi, result, quality in zip(rois, results, qualities):
+                print("Average heart beat rate in ROI {} is {} (quality {:.3f})".format(tile_roi, result, quality))
+            return
+        if args.window_size is not None:
+            # noinspection PyUnboundLocalVariable
+            readings = realtime_utils.measure_series(video, roi, min_freq, max_freq,
+                                                     args.window_size, args.hop_size, channel)
+            for time, result in readings:
+                print("Heart beat rate at {:.2f}s is {}".format(time, result))
+            return
+        if args.projection is not None:
+            # noinspection PyUnboundLocalVariable
+            result = heart_rate_utils.measure_projection(video, roi, min_freq, max_freq, args.projection,
+                                                         use_all_frames=args.use_all_frames,
+                                                         fft_length=args.fft_length,
+                                                         decode_workers=args.decode_workers, cache=cache,
+                                                         stats=stats, pipeline_depth=args.pipeline_depth,
+                                                         timeout=args.timeout, interpolation=args.interpolation,
+                                                         zoom=args.zoom, tracker=tracker,
+                                                         **estimator_arguments(args))
+            if stats is not None:
+                result, channel_results, stats = result
+            else:
+                result, channel_results = result
+            print("Average heart beat rate ({} projection) is {}".format(args.projection.upper(), result))
+            for channel_name in ('R', 'G', 'B'):
+                print("Average heart beat rate in the {} channel is {}".format(channel_name,
+                                                                               channel_results[channel_name]))
+        else:
+            # noinspection PyUnboundLocalVariable
+            result = heart_rate_utils.measure(video, roi, min_freq, max_freq, channel,
+                                              use_all_frames=args.use_all_frames, fft_length=args.fft_length,
+                                              decode_workers=args.decode_workers, cache=cache, stats=stats,
+                                              pipeline_depth=args.pipeline_depth, timeout=args.timeout,
+                                              interpolation=args.interpolation, zoom=args.zoom, tracker=tracker,
+                                              **estimator_arguments(args))
+            if stats is not None:
+                result, stats = result
+            print("Average heart beat rate is {}".format(result))
     except Exception as e:
         _logger.error("Could not measure heart beat rate. Exception message was {}".format(e.message))
         exit(1)
 
+    if stats is not None:
+        dump_stats(stats, args.profile)
+
+
+def dump_stats(stats, path):
+    """Prints the given stats as JSON, or dumps them to the given path
+
+    Args:
+      stats (:obj:`Stats`): recorded stats
+      path (str): path to the file where stats are dumped, or '-' to print them
+    """
+    if path == '-':
+        print(json.dumps(stats.as_dict(), indent=2))
+        return
+    with open(path, 'w') as stats_file:
+        json.dump(stats.as_dict(), stats_file, indent=2)
+
+
+def run_batch(args, cache=None):
+    """Measures the heart beat rate of every video in the batch, writing results as they are ready
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      cache (:obj:`SignalCache`): signal cache shared by the workers, or None
+    """
+    try:
+        paths = batch_utils.collect_paths(args.batch)
+    except Exception as e:
+        _logger.error("Could not collect batch videos. Error message is: \"{}\"".format(e.message))
+        exit(1)
+
+    roi = (args.roi_upper_limit, args.roi_lower_limit, args.roi_left_limit, args.roi_right_limit)
+    output = sys.stdout if args.output is None else open(args.output, 'w')
+    failures = 0
+    try:
+        writer = batch_utils.ResultWriter(output, args.output_format)
+        # noinspection PyUnboundLocalVariable
+        results = batch_utils.measure_batch(paths, roi, args.min_freq, args.max_freq, args.channel, args.workers,
+                                            decoding=decoding_arguments(args), use_all_frames=args.use_all_frames,
+                                            fft_length=args.fft_length,
+                                            cache=cache, pipeline_depth=args.pipeline_depth, timeout=args.timeout,
+                                            interpolation=args.interpolation, zoom=args.zoom,
+                                            **estimator_arguments(args))
+        for result in results:
+            if result['error'] is not None:
+                failures += 1
+                _logger.warn("Could not measure heart beat rate of '{}'. Error message was {}"
+                             .format(result['path'], result['error']))
+            writer.write(result)
+    except Exception as e:
+        _logger.error("Could not run batch. Exception message was {}".format(e.message))
+        exit(1)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    _logger.info("Batch finished. {} of {} videos failed".format(failures, len(paths)))
+
+
+def run_server(args, cache=None):
+    """Serves measure requests until the input is exhausted (or until interrupted, when serving a socket)
+
+    Args:
+      args (:obj:`argparse.Namespace`): command line parameters namespace
+      cache (:obj:`SignalCache`): signal cache shared by the requests, or None
+    """
+    try:
+        server = server_utils.Server(args.workers, cache, {'min_freq': args.min_freq, 'max_freq': args.max_freq,
+                                                           'channel': args.channel})
+    except Exception as e:
+        _logger.error("Could not create server. Error message is: \"{}\"".format(e.message))
+        exit(1)
+
+    try:
+        # noinspection PyUnboundLocalVariable
+        if args.serve == '-':
+            server.serve_stream(sys.stdin, sys.stdout)
+        else:
+            server.serve_unix(args.serve)
+    except KeyboardInterrupt:
+        _logger.info("Server interrupted")
+    except Exception as e:
+        _logger.error("Could not serve requests. Exception message was {}".format(e.message))
+        exit(1)
+    finally:
+        server.close()
+
 
 def run():
     """Entry point for console_scripts
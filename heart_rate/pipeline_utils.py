@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+""" Pipeline utilities module
+This module is in charge of providing utilities for overlapping the production of items (e.g decoding frames)
+with their consumption (e.g reducing them), using a background thread and a bounded queue.
+"""
+import logging
+import threading
+from Queue import Empty, Full, Queue
+from concurrent.futures import CancelledError, TimeoutError
+from timeit import default_timer
+
+_logger = logging.getLogger(__name__)
+
+_POLL_INTERVAL = 0.05  # Seconds between checks of the stop conditions while waiting on a full or an empty queue
+
+_END = object()  # Marks the end of the produced items
+
+
+def prefetch(iterable, depth, timeout=None, cancel_event=None):
+    """ Iterates over the given iterable in a background thread, handing its items through a bounded queue.
+    While the consumer processes an item, the producer thread prepares the next ones (OpenCV releases the GIL
+    while decoding, so decoding and processing overlap). At most depth items are held in the queue.
+    If the consumer stops early (i.e the generator is closed, or the iteration timed out or was cancelled),
+    it returns right away, and the producer thread stops (releasing the iterable) once its current item is produced.
+
+    Args:
+        iterable (iterable): The iterable to prefetch (e.g the frames generator of a streaming video).
+        depth (int): The max. amount of items held in the queue.
+        timeout (float): The max. amount of seconds the whole iteration can take. If None, there is no limit.
+        cancel_event (Event): A threading.Event that cancels the iteration when set. Can be None.
+    Returns:
+        generator: A generator of the items of the given iterable.
+    Raises:
+        ValueError: If the depth or the timeout are not valid.
+    """
+    if depth is None or not isinstance(depth, int) or depth <= 0:
+        _logger.debug("Wrong queue depth. Must be a positive integer")
+        raise ValueError("The queue depth must be a positive integer")
+    if timeout is not None and timeout <= 0:
+        _logger.debug("Wrong timeout. Must be positive")
+        raise ValueError("The timeout must be positive")
+    return _prefetch(iterable, depth, None if timeout is None else default_timer() + timeout, cancel_event)
+
+
+def _prefetch(iterable, depth, deadline, cancel_event):
+    """ Runs the producer thread, yielding the items it queues.
+    Note: We assume validations were already performed when execution of this method is reached.
+
+    Params:
+        See prefetch. The deadline is the timer value at which the iteration times out, or None.
+    Returns:
+        generator: A generator of the items of the given iterable.
+    Raises:
+        TimeoutError: If the deadline is reached.
+        CancelledError: If the cancel event is set.
+        Exception: Any exception raised by the iterable, re-raised in the consumer.
+    """
+    items = Queue(maxsize=depth)
+    stop_event = threading.Event()
+    errors = []
+    producer = threading.Thread(target=_produce, args=(iterable, items, stop_event, errors))
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            _check_stop_conditions(deadline, cancel_event)
+            try:
+                # Blocking without a timeout is cheaper (timed waits poll in Python 2)
+                item = items.get() if deadline is None and cancel_event is None \
+                    else items.get(timeout=_get_wait(deadline, cancel_event))
+            except Empty:
+                continue  # The deadline was reached, or the cancel event must be checked again
+            if item is _END:
+                break
+            yield item
+        if errors:
+            raise errors[0]
+    finally:
+        # Not joining the producer, which might be blocked producing an item (e.g a stalled stream).
+        # It is a daemon thread, and stops by itself, as puts give up once the stop event is set
+        stop_event.set()
+        _drain(items)
+
+
+def _produce(iterable, items, stop_event, errors):
+    """ Puts the items of the given iterable into the given queue, until they are exhausted or stop is requested.
+    This is executed by the producer thread. Puts block until there is room in the queue, or stop is requested.
+
+    Params:
+        iterable (iterable): The iterable to produce.
+        items (Queue): The bounded queue.
+        stop_event (Event): An event that is set when the consumer stops.
+        errors (list): A list where an exception raised by the iterable is appended.
+    """
+    iterator = iter(iterable)
+    try:
+        for item in iterator:
+            if stop_event.is_set() or not _put(items, item, stop_event):
+                return
+    except Exception as e:
+        errors.append(e)
+    finally:
+        if hasattr(iterator, 'close'):
+            iterator.close()  # E.g releases the capture of a frames generator
+    _put(items, _END, stop_event)
+
+
+def _put(items, item, stop_event):
+    """ Puts the given item into the given queue, waiting for room in it until stop is requested.
+
+    Params:
+        items (Queue): The bounded queue.
+        item (object): The item.
+        stop_event (Event): An event that is set when the consumer stops.
+    Returns:
+        bool: Whether the item was put (i.e stop was not requested).
+    """
+    try:
+        items.put_nowait(item)  # Cheaper than a timed put (which polls in Python 2) when there is room
+        return True
+    except Full:
+        pass
+    while not stop_event.is_set():
+        try:
+            items.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def _drain(items):
+    """ Removes all the items of the given queue, without blocking.
+
+    Params:
+        items (Queue): The queue.
+    """
+    try:
+        while True:
+            items.get_nowait()
+    except Empty:
+        pass
+
+
+def _get_wait(deadline, cancel_event):
+    """
+    Params:
+        deadline (float): The timer value at which the iteration times out, or None.
+        cancel_event (Event): The cancel event, or None.
+    Returns:
+        float: The max. amount of seconds to wait for an item before checking the stop conditions again.
+    """
+    wait = _POLL_INTERVAL if cancel_event is not None else None
+    if deadline is not None:
+        remaining = max(0, deadline - default_timer())
+        wait = remaining if wait is None else min(wait, remaining)
+    return wait
+
+
+def _check_stop_conditions(deadline, cancel_event):
+    """ Checks whether the iteration must stop.
+
+    Params:
+        deadline (float): The timer value at which the iteration times out, or None.
+        cancel_event (Event): The cancel event, or None.
+    Raises:
+        TimeoutError: If the deadline is reached.
+        CancelledError: If the cancel event is set.
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        _logger.debug("The pipeline was cancelled")
+        raise CancelledError("The pipeline was cancelled")
+    if deadline is not None and default_timer() > deadline:
+        _logger.debug("The pipeline timed out")
+        raise TimeoutError("The pipeline timed out")
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+""" Profiling utilities module
+This module is in charge of providing utilities for recording per stage statistics (time, frames and memory).
+"""
+import logging
+import sys
+from collections import OrderedDict
+from timeit import default_timer
+
+try:
+    import resource
+except ImportError:  # Not available in Windows
+    resource = None
+
+_logger = logging.getLogger(__name__)
+
+
+class Stats:
+    """ Class that records statistics of each stage of a process: wall time, processed frames, amount of calls,
+    and how much the stage increased the peak resident set size of the process (i.e the memory it needed on top of
+    the peak reached before it ran, which is 0 for a stage that fits in memory that was already used).
+    Stages can be nested. Each stage wall time and peak increase exclude the ones of the stages nested in it.
+    """
+
+    def __init__(self):
+        """ Creates a new (empty) Stats instance.
+
+        Returns:
+            A new Stats instance.
+        """
+        self._stages = OrderedDict()
+        self._nested_times = []  # A stack with the time spent in nested stages, for each running stage
+        self._nested_increases = []  # A stack with the peak increase of nested stages, for each running stage
+
+    def stage(self, name, frames=0):
+        """ Creates a context manager that records a stage while the context is running.
+
+        Args:
+            name (str): The stage name. Several runs of a stage with the same name are accumulated.
+            frames (int): The amount of frames processed in the stage.
+        Returns:
+            A context manager.
+        """
+        return _Stage(self, name, frames)
+
+    def timed_iter(self, name, iterable):
+        """ Wraps the given iterable, recording the time spent producing each item as a stage
+        (e.g to record decoding time of a lazy frames generator, apart from the time spent processing the frames).
+
+        Args:
+            name (str): The stage name.
+            iterable (iterable): The iterable to wrap. Each item is counted as a frame.
+        Returns:
+            generator: A generator of the items of the given iterable.
+        """
+        iterator = iter(iterable)
+        try:
+            while True:
+                start, start_peak = default_timer(), _peak_rss_bytes()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    self._record(name, default_timer() - start, 0, _peak_increase(start_peak), calls=0)
+                    return
+                self._record(name, default_timer() - start, 1, _peak_increase(start_peak), calls=0)
+                yield item
+        finally:
+            self._record(name, 0.0, 0, 0)  # Also reached if the consumer stops early (i.e when the generator is closed)
+
+    def _record(self, name, elapsed, frames, peak_increase, calls=1):
+        """ Records a run of a stage.
+
+        Args:
+            name (str): The stage name.
+            elapsed (float): The wall time of the run (excluding nested stages), in seconds.
+            frames (int): The amount of frames processed in the run.
+            peak_increase (int): The increase of the peak resident set size during the run (excluding nested stages),
+                                 in bytes.
+            calls (int): The amount of calls to add.
+        """
+        if self._nested_times:
+            self._nested_times[-1] += elapsed
+            self._nested_increases[-1] += peak_increase
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {'wall_time': 0.0, 'frames': 0, 'calls': 0,
+                                          'peak_rss_increase_bytes': None if resource is None else 0}
+        stage['wall_time'] += elapsed
+        stage['frames'] += frames
+        stage['calls'] += calls
+        if resource is not None:
+            stage['peak_rss_increase_bytes'] += peak_increase
+
+    def as_dict(self):
+        """
+        Returns:
+            dict: The stats of each stage (in the order they were first run), and the total wall time.
+        """
+        stages = OrderedDict()
+        for name, stage in self._stages.items():
+            stages[name] = dict(stage)
+            stages[name]['frames_per_second'] = stage['frames'] / stage['wall_time'] \
+                if stage['frames'] and stage['wall_time'] > 0 else None
+        return {'stages': stages, 'wall_time': sum(stage['wall_time'] for stage in self._stages.values())}
+
+
+class _NullStats:
+    """ Class with the same interface as Stats, which does not record anything (so profiling costs nothing).
+    """
+
+    def stage(self, name, frames=0):
+        return _NULL_STAGE
+
+    def timed_iter(self, name, iterable):
+        return iterable
+
+
+class _Stage:
+    """ Context manager that records a stage run into a Stats instance.
+    """
+
+    def __init__(self, stats, name, frames):
+        self._stats = stats
+        self._name = name
+        self._frames = frames
+        self._start = None
+        self._start_peak = None
+
+    def __enter__(self):
+        self._stats._nested_times.append(0.0)
+        self._stats._nested_increases.append(0)
+        self._start = default_timer()
+        self._start_peak = _peak_rss_bytes()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = default_timer() - self._start
+        peak_increase = _peak_increase(self._start_peak)
+        nested_time = self._stats._nested_times.pop()
+        nested_increase = self._stats._nested_increases.pop()
+        self._stats._record(self._name, elapsed - nested_time, self._frames, peak_increase - nested_increase)
+        if self._stats._nested_times:
+            # The parent excludes this stage, including its children
+            self._stats._nested_times[-1] += nested_time
+            self._stats._nested_increases[-1] += nested_increase
+        return False
+
+    def add_frames(self, frames):
+        """ Adds processed frames to the stage (e.g when the amount is only known once the stage finished).
+
+        Args:
+            frames (int): The amount of frames.
+        """
+        self._frames += frames
+
+
+class _NullStage:
+    """ Context manager that does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def add_frames(self, frames):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+NULL_STATS = _NullStats()
+
+
+def _peak_rss_bytes():
+    """
+    Returns:
+        int: The peak resident set size of this process so far, in bytes, or None if it can not be known.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Bytes in macOS, else kilobytes
+
+
+def _peak_increase(start_peak):
+    """
+    Params:
+        start_peak (int): The peak resident set size when a run started (see _peak_rss_bytes), or None.
+    Returns:
+        int: How much the peak resident set size increased since the run started, in bytes (0 if it can not be known).
+    """
+    if start_peak is None:
+        return 0
+    return _peak_rss_bytes() - start_peak
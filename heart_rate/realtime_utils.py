@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+""" Real time Heart Rate Calculations utilities module
+This module is in charge of providing utilities for calculating heart beat rates as frames arrive (e.g from a camera).
+"""
+import logging
+
+import numpy as np
+
+import heart_rate_utils
+import video_utils
+
+_logger = logging.getLogger(__name__)
+
+_HERTZ_PER_MINUTE = 60
+
+_CHANNEL_INDEXES = {'B': 0, 'G': 1, 'R': 2}
+
+
+class HeartRateMonitor:
+    """ Class that estimates the heart beat rate over a sliding window of frames.
+    The spectrum of the window is updated incrementally with a sliding DFT, restricted to the bins of the heart band,
+    so each frame costs as much as the amount of bins in the band (instead of a whole FFT per reading).
+    """
+
+    def __init__(self, roi, fps, min_freq, max_freq, window_size, hop_size=1, channel='G'):
+        """ Creates a new HeartRateMonitor instance.
+
+        Args:
+            roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+                         This means that roi[0] is the upper limit, roi[1] is the lower limit,
+                         roi[2] is the left limit, and roi[3] is the right limit.
+            fps (float): The amount of frames per second.
+            min_freq (float): The min. frequency of the heart band.
+            max_freq (float): The max. frequency of the heart band.
+            window_size (int): The amount of frames over which each reading is calculated.
+            hop_size (int): The amount of frames between readings.
+            channel (str): The channel to process.
+        Returns:
+            A new HeartRateMonitor instance.
+        Raises:
+            ValueError: If any of the arguments is not valid.
+        """
+        if roi is None or not isinstance(roi, tuple) or len(roi) != 4 or not all(isinstance(v, int) for v in roi):
+            _logger.debug("Wrong ROI definition. Must be a 4-Dimensional tuple of ints")
+            raise ValueError("Invalid ROI definition. Must be a 4-Dimensional tuple of ints")
+        if roi[0] < 0 or roi[2] < 0:
+            _logger.debug("The ROI is out of range")
+            raise ValueError("Wrong ROI. Is out of range")
+        if roi[1] <= roi[0] or roi[3] <= roi[2]:
+            _logger.debug("The ROI is empty")
+            raise ValueError("Wrong ROI. Is empty")
+        if fps is None or fps <= 0:
+            _logger.debug("Wrong fps value. Must be positive")
+            raise ValueError("The fps must be positive")
+        if min_freq is None or max_freq is None or max_freq < min_freq:
+            _logger.debug("Wrong min/max frequencies value")
+            raise ValueError("The given min and max. frequencies pair is invalid")
+        if window_size is None or not isinstance(window_size, int) or window_size < 2:
+            _logger.debug("Wrong window size. Must be an integer greater than 1")
+            raise ValueError("The window size must be an integer greater than 1")
+        if hop_size is None or not isinstance(hop_size, int) or hop_size < 1:
+            _logger.debug("Wrong hop size. Must be a positive integer")
+            raise ValueError("The hop size must be a positive integer")
+        if channel not in _CHANNEL_INDEXES:
+            _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+            raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+
+        # Bins of the window spectrum inside the heart band (excluding the DC bin, so the mean does not matter)
+        first_bin = max(1, int(np.ceil(min_freq * window_size / fps)))
+        last_bin = min(window_size // 2, int(np.floor(max_freq * window_size / fps)))
+        if last_bin < first_bin:
+            _logger.debug("The heart band contains no bins for the given window size and fps")
+            raise ValueError("The window is too short for the given band. Increase the window size")
+        bins = np.arange(first_bin, last_bin + 1)
+
+        self._roi = roi
+        self._fps = fps
+        self._window_size = window_size
+        self._hop_size = hop_size
+        self._channel_index = _CHANNEL_INDEXES[channel]
+        self._frequencies = bins * float(fps) / window_size
+        self._twiddles = np.exp(2j * np.pi * bins / window_size)
+        self._kernel = np.exp(-2j * np.pi * np.outer(np.arange(window_size), bins) / window_size)
+        self._buffer = np.zeros(window_size, dtype=np.float64)  # Ring buffer of ROI means
+        self._spectrum = np.zeros(bins.shape[0], dtype=np.complex128)
+        self._count = 0
+        self._bpm = None
+        self._roi_checked = False  # The ROI is checked against the size of the first pushed frame
+
+    def push(self, frame):
+        """ Adds a frame to the window.
+
+        Args:
+            frame (ndarray): A BGR frame, or a frame of the channel being processed.
+        Returns:
+            float: The heart beat rate measured over the window, if a reading is due with this frame. Else, None.
+        Raises:
+            ValueError: If the ROI is out of range of the frame.
+        """
+        if not self._roi_checked:
+            if self._roi[1] > frame.shape[0] or self._roi[3] > frame.shape[1]:
+                _logger.debug("The ROI is out of range of the {}x{} frames".format(frame.shape[1], frame.shape[0]))
+                raise ValueError("Wrong ROI. Is out of range")
+            self._roi_checked = True
+        roi_frame = heart_rate_utils._get_roi(frame, self._roi)
+        return self.push_value((roi_frame if roi_frame.ndim == 2 else roi_frame[:, :, self._channel_index]).mean())
+
+    def push_value(self, value):
+        """ Adds an already reduced sample (i.e the mean of the ROI of a frame) to the window.
+
+        Args:
+            value (float): The sample.
+        Returns:
+            float: The heart beat rate measured over the window, if a reading is due with this sample. Else, None.
+        """
+        position = self._count % self._window_size
+        oldest = self._buffer[position]
+        self._buffer[position] = value
+        self._count += 1
+
+        if self._count % self._window_size == 0:
+            # Recompute the spectrum from the buffer once per window, so rounding errors do not accumulate
+            self._spectrum = self._buffer.dot(self._kernel)  # The buffer is in chronological order at this point
+        else:
+            self._spectrum = (self._spectrum + (value - oldest)) * self._twiddles
+
+        if self._count < self._window_size or (self._count - self._window_size) % self._hop_size != 0:
+            return None
+        power = self._spectrum.real ** 2 + self._spectrum.imag ** 2
+        self._bpm = self._frequencies[np.argmax(power)] * _HERTZ_PER_MINUTE
+        return self._bpm
+
+    @property
+    def bpm(self):
+        """
+        Returns:
+            The last heart beat rate reading, or None if no reading was made yet.
+        """
+        return self._bpm
+
+    @property
+    def count(self):
+        """
+        Returns:
+            The amount of frames pushed so far.
+        """
+        return self._count
+
+    @property
+    def fps(self):
+        """
+        Returns:
+            The amount of frames per second
+        """
+        return self._fps
+
+
+def measure_series(video, roi, min_freq, max_freq, window_size, hop_size=1, channel='G'):
+    """ Measures the heart beat rate over a sliding window, as the video frames are decoded.
+
+    Params:
+        video (FrameSource): The video to analyze (see heart_rate_utils.measure).
+                             It is consumed in one pass, so a streaming video can be used.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI
+                     (in whole frame coordinates, even if the video frames are cropped).
+        min_freq (float): The min. frequency of the heart band.
+        max_freq (float): The max. frequency of the heart band.
+        window_size (int): The amount of frames over which each reading is calculated.
+        hop_size (int): The amount of frames between readings.
+        channel (str): The channel to process.
+    Returns:
+        generator: A generator of (time, heart beat rate) tuples, being time the second of the last frame of the window.
+    Raises:
+        ValueError: If any of the arguments is not valid (e.g the ROI is out of range of the video).
+    """
+    if video is None or not isinstance(video, video_utils.FrameSource):
+        _logger.debug("Could not measure heart beat rate. Video is null or not a FrameSource instance")
+        raise ValueError("The video not be null and must be a FrameSource instance (e.g a Video)")
+
+    heart_rate_utils._validate_roi(roi, video.height, video.width)
+    monitor = HeartRateMonitor(video.frame_roi(roi), video.fps, min_freq, max_freq, window_size, hop_size, channel)
+    return _readings(monitor, video.frames(channel))
+
+
+def _readings(monitor, frames):
+    """ Pushes the given frames to the given monitor, yielding its readings.
+
+    Params:
+        monitor (HeartRateMonitor): The monitor to which frames are pushed.
+        frames (iterable): The frames to push.
+    Returns:
+        generator: A generator of (time, heart beat rate) tuples, being time the second of the last frame of the window.
+    """
+    for frame in frames:
+        bpm = monitor.push(frame)
+        if bpm is not None:
+            yield (monitor.count / float(monitor.fps), bpm)
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+""" Server utilities module
+This module is in charge of providing a long-lived local service that measures heart beat rates on request,
+so the interpreter startup and imports are paid once, and filter and FFT tables stay warm between requests.
+Requests and responses are JSON objects, one per line, read from a stream (e.g stdin) or a Unix socket.
+"""
+import SocketServer
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import heart_rate_utils
+import video_utils
+
+_logger = logging.getLogger(__name__)
+
+_DEFAULTS = {'min_freq': 0.4, 'max_freq': 7.0, 'channel': 'G'}
+
+_SIGNAL_OPTIONS = ['fft_length', 'interpolation', 'zoom', 'estimator', 'segment_length', 'overlap', 'window']
+
+_MEASURE_OPTIONS = _SIGNAL_OPTIONS + ['use_all_frames', 'pipeline_depth', 'timeout']
+
+_STRING_OPTIONS = ['interpolation', 'estimator', 'window']
+
+
+class Server:
+    """ Class that handles measure requests with a pool of worker threads.
+    Workers share the process caches (bandpass filters, FFT tables and the signal cache, if any).
+    OpenCV and numpy release the GIL while decoding and transforming, so requests run concurrently.
+
+    A request is a JSON object with:
+        'id': Any value, echoed in the response (so responses can be matched, as they arrive in completion order).
+        'roi': The ROI, as a list with the upper, lower, left and right limits.
+        'min_freq', 'max_freq', 'channel': Optional. The server defaults are used if not given.
+        Either 'path' (the path to a video file), or 'frames' (base64 encoded raw uint8 frames, with 'shape' being
+        [frames, height, width] for single channel frames, or [frames, height, width, 3] for BGR frames,
+        and 'fps' being their amount of frames per second).
+        Requests can also have 'use_all_frames', 'fft_length', 'interpolation', 'zoom', 'estimator',
+        'segment_length', 'overlap' and 'window' (so the same frames give the same heart beat rate either way).
+        Video requests can also have 'pipeline_depth', 'timeout', 'single_channel', 'crop_margin' and 'stride'
+        (see heart_rate_utils.measure and video_utils.decoding_options).
+    A response is a JSON object with 'id', 'bpm' and 'error' (None, unless the request failed).
+    """
+
+    def __init__(self, workers=None, cache=None, defaults=None):
+        """ Creates a new Server instance.
+
+        Args:
+            workers (int): The amount of worker threads. If None, the amount of processors is used.
+            cache (SignalCache): A cache of signals, shared by all the requests. Can be None.
+            defaults (dict): The default 'min_freq', 'max_freq' and 'channel' of requests.
+        Returns:
+            A new Server instance.
+        Raises:
+            ValueError: If the amount of workers is not valid.
+        """
+        if workers is not None and (not isinstance(workers, int) or workers <= 0):
+            _logger.debug("Wrong amount of workers. Must be a positive integer")
+            raise ValueError("The amount of workers must be a positive integer")
+        self._executor = ThreadPoolExecutor(max_workers=workers or multiprocessing.cpu_count())
+        self._cache = cache
+        self._defaults = dict(_DEFAULTS, **(defaults or {}))
+
+    def handle(self, request):
+        """ Handles the given request. Failures are reported in the response, instead of being raised.
+
+        Args:
+            request (dict): The request.
+        Returns:
+            dict: The response, with 'id', 'bpm' and 'error' keys.
+        """
+        request_id = request.get('id') if isinstance(request, dict) else None
+        # noinspection PyBroadException
+        try:
+            return {'id': request_id, 'bpm': self._measure(request), 'error': None}
+        except Exception as e:
+            _logger.debug("Request {} failed: {}".format(request_id, e))
+            return {'id': request_id, 'bpm': None, 'error': str(e) or e.__class__.__name__}
+
+    def submit(self, request):
+        """ Submits the given request to the worker pool.
+
+        Args:
+            request (dict): The request.
+        Returns:
+            Future: A future of the response.
+        """
+        return self._executor.submit(self.handle, request)
+
+    def serve_stream(self, input_stream, output_stream):
+        """ Handles the requests read from the given input stream (one per line) until it is exhausted,
+        writing each response to the given output stream as soon as it is ready.
+
+        Args:
+            input_stream (file): The stream from which requests are read.
+            output_stream (file): The stream to which responses are written.
+        """
+        write_lock = threading.Lock()
+
+        def write_response(response):
+            with write_lock:
+                output_stream.write(json.dumps(response) + '\n')
+                output_stream.flush()
+
+        def handle_and_write(request):
+            # Written by the worker, so waiting for the future also waits for the response to be written
+            write_response(self.handle(request))
+
+        futures = []
+        for line in iter(input_stream.readline, ''):  # Not iterating the file, which reads ahead in Python 2
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                write_response({'id': None, 'bpm': None, 'error': "Invalid JSON request"})
+                continue
+            futures.append(self._executor.submit(handle_and_write, request))
+            futures = [pending for pending in futures if not pending.done()]
+        for future in futures:
+            future.result()
+
+    def serve_unix(self, socket_path):
+        """ Listens for connections on the given Unix socket, serving each of them as a stream of requests
+        (see serve_stream), until interrupted.
+
+        Args:
+            socket_path (str): The path of the Unix socket. It is removed when the server stops.
+        Raises:
+            IOError: If the socket path already exists.
+        """
+        if os.path.exists(socket_path):
+            _logger.debug("The given socket path already exists")
+            raise IOError("'{}' already exists".format(socket_path))
+
+        server = self
+
+        class Handler(SocketServer.StreamRequestHandler):
+            def handle(self):
+                server.serve_stream(self.rfile, self.wfile)
+
+        socket_server = SocketServer.ThreadingUnixStreamServer(socket_path, Handler)
+        socket_server.daemon_threads = True
+        _logger.info("Listening on '{}'...".format(socket_path))
+        try:
+            socket_server.serve_forever()
+        finally:
+            socket_server.server_close()
+            os.remove(socket_path)
+
+    def close(self):
+        """ Waits for pending requests, and stops the worker threads.
+        """
+        self._executor.shutdown()
+
+    def _measure(self, request):
+        """ Measures the heart beat rate of the given request.
+
+        Args:
+            request (dict): The request.
+        Returns:
+            float: The heart beat rate.
+        Raises:
+            ValueError: If the request is not valid.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object")
+        roi = request.get('roi')
+        if not isinstance(roi, list):
+            raise ValueError("The request ROI must be a list")
+        roi = tuple(int(vertex) for vertex in roi)
+        min_freq = float(request.get('min_freq', self._defaults['min_freq']))
+        max_freq = float(request.get('max_freq', self._defaults['max_freq']))
+        channel = str(request.get('channel', self._defaults['channel']))
+
+        if request.get('frames') is not None:
+            return _measure_frames(request, roi, min_freq, max_freq, channel)
+        if request.get('path') is None:
+            raise ValueError("The request must have a 'path' or 'frames'")
+
+        path = str(request['path'])
+        options = video_utils.decoding_options(path, roi, channel if request.get('single_channel') else None,
+                                               request.get('crop_margin'), _stride(request.get('stride', 1)),
+                                               max_freq)
+        video = video_utils.Video(path, streaming=True, **options)
+        measure_options = _options(request, _MEASURE_OPTIONS)
+        return heart_rate_utils.measure(video, roi, min_freq, max_freq, channel, cache=self._cache,
+                                        **measure_options)
+
+
+def _measure_frames(request, roi, min_freq, max_freq, channel):
+    """ Measures the heart beat rate of the raw frames of the given request.
+
+    Args:
+        request (dict): The request, with 'frames', 'shape' and 'fps'.
+        roi (tuple): The ROI.
+        min_freq (float): The min. frequency of the bandpass filter.
+        max_freq (float): The max. frequency of the bandpass filter.
+        channel (str): The channel to process (only used with BGR frames).
+    Returns:
+        float: The heart beat rate.
+    Raises:
+        ValueError: If the frames, their shape, their channel, or their fps are not valid.
+    """
+    shape = request.get('shape')
+    if not isinstance(shape, list) or len(shape) not in (3, 4) or (len(shape) == 4 and shape[3] != 3):
+        raise ValueError("The frames shape must be [frames, height, width] or [frames, height, width, 3]")
+    frames = np.frombuffer(base64.b64decode(request['frames']), dtype=np.uint8)
+    if frames.size != np.prod(shape):
+        raise ValueError("The frames size does not match their shape")
+    frames = frames.reshape(shape)
+    signal = heart_rate_utils.extract_signal(frames, roi, channel, bool(request.get('use_all_frames', False)))
+    return heart_rate_utils.measure_signal(signal, float(request.get('fps', 0)), min_freq, max_freq,
+                                           **_options(request, _SIGNAL_OPTIONS))
+
+
+def _options(request, keys):
+    """
+    Args:
+        request (dict): A request.
+        keys (list): The keys of the options to get.
+    Returns:
+        dict: The options of the request with the given keys, as keyword arguments.
+    """
+    options = {key: request[key] for key in keys if request.get(key) is not None}
+    for key in _STRING_OPTIONS:
+        if key in options:
+            options[key] = str(options[key])  # JSON strings are unicode
+    return options
+
+
+def _stride(value):
+    """
+    Args:
+        value (object): A stride, as read from a request.
+    Returns:
+        The stride, as expected by video_utils.decoding_options.
+    """
+    return video_utils.AUTO_STRIDE if value == video_utils.AUTO_STRIDE else int(value)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+""" Tracking utilities module
+This module is in charge of providing utilities for moving the ROI along with the subject across frames.
+A (costly) detector is only run on keyframes, and the ROI is tracked in between with template matching
+on a downscaled grayscale window around it, so tracking costs a small fraction of decoding.
+"""
+import logging
+import os
+
+import cv2
+import numpy as np
+
+_logger = logging.getLogger(__name__)
+
+DETECTORS = ['face', 'skin']
+
+# The ROI of each detector, as fractions (upper, lower, left and right) of the detected box
+# (the forehead of a face, and the center of a skin region)
+_DETECTOR_ROI_FRACTIONS = {'face': (0.1, 0.3, 0.3, 0.7), 'skin': (0.25, 0.75, 0.25, 0.75)}
+
+_DEFAULT_CASCADE = 'haarcascade_frontalface_default.xml'
+
+_DETECTION_WIDTH = 320  # Frames wider than this are downscaled to this width before detecting
+
+_MIN_TEMPLATE_SIZE = 4  # In pixels of the downscaled frames
+
+_MIN_MATCH_SCORE = 0.3  # Below this normalized correlation, the target is considered lost and is not moved
+
+# The skin color range, in the YCrCb color space
+_SKIN_LOWER = np.array([0, 133, 77], dtype=np.uint8)
+_SKIN_UPPER = np.array([255, 173, 127], dtype=np.uint8)
+
+
+class RoiTracker:
+    """ Class that tracks a ROI across the frames of a video.
+    A target box (the initial ROI, or the box found by the detector) is tracked with template matching
+    in a window around its previous position. Only that window is downscaled (by an integer factor, averaging blocks
+    of pixels, so the template and the window share the same grid) and converted to grayscale.
+    On keyframes (one every keyframe_interval frames), the detector is run (if any), and the template is refreshed.
+    The ROI is the target box (for the initial ROI), or a part of it (see _DETECTOR_ROI_FRACTIONS).
+    """
+
+    def __init__(self, detector=None, keyframe_interval=30, downscale=4, search_margin=0.5, cascade_path=None):
+        """ Creates a new RoiTracker instance.
+
+        Args:
+            detector (str): The detector run on keyframes (see DETECTORS). If None, only the initial ROI is tracked.
+            keyframe_interval (int): The amount of frames between keyframes.
+            downscale (int): The factor by which frames are downscaled to track the target.
+            search_margin (float): The size of the margin around the previous target position in which the target
+                                   is searched, as a fraction of the target size.
+            cascade_path (str): The path to the cascade classifier used by the 'face' detector.
+                                If None, OpenCV's frontal face cascade is used.
+        Returns:
+            A new RoiTracker instance.
+        Raises:
+            ValueError: If any of the arguments is not valid, or if the cascade could not be loaded.
+        """
+        if detector is not None and detector not in DETECTORS:
+            _logger.debug("Wrong detector. Must be one of {}, but was {}".format(DETECTORS, detector))
+            raise ValueError("The detector was wrong. Must be one of {}".format(DETECTORS))
+        if keyframe_interval is None or not isinstance(keyframe_interval, int) or keyframe_interval <= 0:
+            _logger.debug("Wrong keyframe interval. Must be a positive integer")
+            raise ValueError("The keyframe interval must be a positive integer")
+        if downscale is None or not isinstance(downscale, int) or downscale <= 0:
+            _logger.debug("Wrong downscale factor. Must be a positive integer")
+            raise ValueError("The downscale factor must be a positive integer")
+        if search_margin is None or search_margin <= 0:
+            _logger.debug("Wrong search margin. Must be positive")
+            raise ValueError("The search margin must be positive")
+
+        self._detector = detector
+        self._keyframe_interval = keyframe_interval
+        self._downscale = downscale
+        self._search_margin = search_margin
+        self._cascade = _load_cascade(cascade_path) if detector == 'face' else None
+        self.start()
+
+    def start(self, roi=None):
+        """ Starts tracking a new video.
+
+        Args:
+            roi (tuple): The initial ROI (upper, lower, left and right limits), tracked until the detector finds
+                         a target. Can be None if there is a detector, and it finds a target in the first frame.
+        """
+        self._index = 0
+        self._target = None if roi is None else np.array(roi, dtype=np.float64)  # Upper, lower, left, right
+        self._fractions = (0.0, 1.0, 0.0, 1.0)
+        self._template = None
+        self._template_offset = None
+        self._detections = 0
+
+    def update(self, frame):
+        """ Moves the ROI to its position in the given frame (the next frame of the video).
+
+        Args:
+            frame (ndarray): The BGR frame.
+        Returns:
+            tuple: The ROI in the given frame (upper, lower, left and right limits, inside the frame).
+        Raises:
+            ValueError: If there is no ROI yet (i.e there was no initial ROI, and the detector found no target).
+        """
+        keyframe = self._index % self._keyframe_interval == 0
+        self._index += 1
+        detected = False
+        if keyframe and self._detector is not None:
+            target = self._detect(frame)
+            if target is not None:
+                self._target = target
+                self._fractions = _DETECTOR_ROI_FRACTIONS[self._detector]
+                self._detections += 1
+                detected = True
+        if self._target is None:
+            _logger.debug("There is no ROI to track. No initial ROI was given, and no target was detected")
+            raise ValueError("No initial ROI was given, and no target was detected in the first frame")
+        if self._template is not None and not detected:
+            self._track(frame)  # Also in keyframes, so the template is refreshed where the target is in this frame
+        if keyframe or self._template is None:
+            box = self._small_box(frame.shape)
+            self._template = self._downscale_box(frame, box)
+            # Where the target is relative to the template (which is aligned to the downscaled pixels)
+            self._template_offset = self._target[[0, 2]] / self._downscale - (box[0], box[2])
+        return self.roi(frame.shape[0], frame.shape[1])
+
+    def roi(self, height, width):
+        """
+        Args:
+            height (int): The frames height.
+            width (int): The frames width.
+        Returns:
+            tuple: The current ROI (upper, lower, left and right limits), moved inside a frame of the given size.
+        """
+        upper, lower, left, right = self._target
+        box_height, box_width = lower - upper, right - left
+        roi = [upper + self._fractions[0] * box_height, upper + self._fractions[1] * box_height,
+               left + self._fractions[2] * box_width, left + self._fractions[3] * box_width]
+        roi_height = min(max(1, int(round(roi[1] - roi[0]))), height)
+        roi_width = min(max(1, int(round(roi[3] - roi[2]))), width)
+        top = min(max(0, int(round(roi[0]))), height - roi_height)  # Keeps the ROI size, shifting it inside the frame
+        left = min(max(0, int(round(roi[2]))), width - roi_width)
+        return top, top + roi_height, left, left + roi_width
+
+    @property
+    def detections(self):
+        """
+        Returns:
+            int: The amount of keyframes in which the detector found a target, since tracking started.
+        """
+        return self._detections
+
+    def _detect(self, frame):
+        """ Runs the detector on the given frame.
+
+        Args:
+            frame (ndarray): The BGR frame.
+        Returns:
+            ndarray: The box of the largest target (upper, lower, left and right limits), or None if none was found.
+        """
+        scale = min(1.0, float(_DETECTION_WIDTH) / frame.shape[1])
+        small = frame if scale == 1.0 else cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes = _detect_faces(small, self._cascade) if self._detector == 'face' else _detect_skin(small)
+        if len(boxes) == 0:
+            _logger.debug("No target was detected in frame {}".format(self._index - 1))
+            return None
+        x, y, w, h = max(boxes, key=lambda box: box[2] * box[3])
+        return np.array([y, y + h, x, x + w], dtype=np.float64) / scale
+
+    def _track(self, frame):
+        """ Moves the target box to the position of the template in a window around its previous position.
+        The match position is refined to a fraction of a pixel (fitting a parabola around the best match),
+        so the ROI does not jitter by a whole downscaled pixel.
+
+        Args:
+            frame (ndarray): The BGR frame.
+        """
+        top, bottom, left, right = self._small_box(frame.shape)
+        margin_y = max(1, int(self._search_margin * (bottom - top)))
+        margin_x = max(1, int(self._search_margin * (right - left)))
+        small_height, small_width = frame.shape[0] // self._downscale, frame.shape[1] // self._downscale
+        window_box = (max(0, top - margin_y), min(small_height, bottom + margin_y),
+                      max(0, left - margin_x), min(small_width, right + margin_x))
+        window = self._downscale_box(frame, window_box)
+        if window.shape[0] < self._template.shape[0] or window.shape[1] < self._template.shape[1]:
+            return  # The target left the frame
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, max_score, _, (x, y) = cv2.minMaxLoc(scores)
+        if max_score < _MIN_MATCH_SCORE:
+            _logger.debug("The target was lost in frame {} (score {:.2f})".format(self._index - 1, max_score))
+            return
+        upper = (window_box[0] + y + _refine_peak(scores[:, x], y) + self._template_offset[0]) * self._downscale
+        left = (window_box[2] + x + _refine_peak(scores[y, :], x) + self._template_offset[1]) * self._downscale
+        self._target += np.array([upper, upper, left, left]) - self._target[[0, 0, 2, 2]]
+
+    def _small_box(self, shape):
+        """
+        Args:
+            shape (tuple): The shape of the frames.
+        Returns:
+            tuple: The target box in the downscaled frames (in integer pixels, inside the frame).
+        """
+        small_height, small_width = shape[0] // self._downscale, shape[1] // self._downscale
+        upper, lower, left, right = self._target / self._downscale
+        height = min(max(_MIN_TEMPLATE_SIZE, int(round(lower - upper))), small_height)
+        width = min(max(_MIN_TEMPLATE_SIZE, int(round(right - left))), small_width)
+        top = min(max(0, int(round(upper))), small_height - height)
+        left = min(max(0, int(round(left))), small_width - width)
+        return top, top + height, left, left + width
+
+    def _downscale_box(self, frame, box):
+        """
+        Args:
+            frame (ndarray): The BGR frame.
+            box (tuple): A box in the downscaled frames (upper, lower, left and right limits).
+        Returns:
+            ndarray: The given box of the downscaled grayscale frame (as float32, which is faster to match).
+        """
+        factor = self._downscale
+        patch = _to_gray(frame[box[0] * factor:box[1] * factor, box[2] * factor:box[3] * factor])
+        if factor > 1:
+            patch = cv2.resize(patch, (box[3] - box[2], box[1] - box[0]), interpolation=cv2.INTER_AREA)
+        return patch.astype(np.float32)
+
+
+def _load_cascade(cascade_path):
+    """ Loads the given cascade classifier (OpenCV's frontal face cascade, if None).
+
+    Args:
+        cascade_path (str): The path to the cascade, or None.
+    Returns:
+        CascadeClassifier: The loaded cascade.
+    Raises:
+        ValueError: If the cascade could not be loaded.
+    """
+    if cascade_path is None:
+        data = getattr(cv2, 'data', None)  # Only in recent opencv-python packages
+        if data is None:
+            _logger.debug("OpenCV cascades are not available. A cascade path must be given")
+            raise ValueError("OpenCV cascades are not available in this environment. Set the cascade path")
+        cascade_path = os.path.join(data.haarcascades, _DEFAULT_CASCADE)
+    cascade = cv2.CascadeClassifier(cascade_path)
+    if cascade.empty():
+        _logger.debug("Could not load the cascade")
+        raise ValueError("Could not load '{}' cascade".format(cascade_path))
+    return cascade
+
+
+def _detect_faces(frame, cascade):
+    """
+    Args:
+        frame (ndarray): The BGR frame.
+        cascade (CascadeClassifier): The face cascade.
+    Returns:
+        list: The (x, y, width, height) boxes of the detected faces.
+    """
+    return list(cascade.detectMultiScale(cv2.equalizeHist(_to_gray(frame)), scaleFactor=1.1, minNeighbors=5))
+
+
+def _detect_skin(frame):
+    """
+    Args:
+        frame (ndarray): The BGR frame.
+    Returns:
+        list: The (x, y, width, height) box of the largest region with skin color (empty if there is none).
+    """
+    mask = cv2.inRange(cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb), _SKIN_LOWER, _SKIN_UPPER)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), dtype=np.uint8))  # Removes isolated pixels
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+    if count < 2:
+        return []
+    largest = 1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])  # The first component is the background
+    return [tuple(stats[largest, :4])]
+
+
+def _to_gray(frame):
+    """
+    Args:
+        frame (ndarray): A BGR frame (or an already grayscale one).
+    Returns:
+        ndarray: The grayscale frame.
+    """
+    return frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def _refine_peak(scores, peak):
+    """ Estimates the offset of the true maximum of the given scores from its peak, fitting a parabola.
+
+    Args:
+        scores (ndarray): The scores (one dimensional).
+        peak (int): The index of the best score.
+    Returns:
+        float: The offset, between -0.5 and 0.5 (0 if the peak has no two neighbours).
+    """
+    if peak == 0 or peak == len(scores) - 1:
+        return 0.0
+    left, center, right = scores[peak - 1], scores[peak], scores[peak + 1]
+    denominator = left - 2 * center + right
+    if denominator >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (left - right) / denominator, -0.5, 0.5))
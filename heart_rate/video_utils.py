@@ -1,126 +1,833 @@
 # -*- coding: utf-8 -*-
 """ Video utilities module
-This module is in charge of providing utilities for loading videos into memory.
+This module is in charge of providing utilities for loading videos into memory,
+and for getting frames from other sources (numpy arrays, image sequences and raw streams).
 """
+import json
 import logging
 import os
+import tempfile
+from itertools import islice
 
 import cv2
+import numpy as np
+
+import profiling_utils
 
 _logger = logging.getLogger(__name__)
 
+_CHANNEL_INDEXES = {'B': 0, 'G': 1, 'R': 2}
+
+STORES = ['array', 'memmap']
+
+AUTO_STRIDE = 'auto'
+
+_DEFAULT_OVERSAMPLING = 2.0
+
+IMAGE_EXTENSIONS = ['.bmp', '.jpeg', '.jpg', '.png', '.tif', '.tiff']
+
+
+class FrameSource:
+    """ Base class of the sources of BGR frames that can be measured (e.g by heart_rate_utils.measure).
+    Subclasses set the length, width, height and fps (and whether frames are produced on demand),
+    and implement _iterate_frames.
+    """
+
+    _length = 0
+    _width = 0
+    _height = 0
+    _fps = 0.0
+    _streaming = False
+
+    def frames(self, channel=None, start=0, stop=None):
+        """ Iterates over the frames.
+
+        Args:
+            channel (str): The channel to yield ('R', 'G' or 'B'). If None, whole BGR frames are yielded.
+            start (int): The index of the first frame to yield.
+            stop (int): The index of the frame at which iteration stops (exclusive). If None, iterates until the end.
+        Returns:
+            generator: A generator of frames.
+        Raises:
+            ValueError: If the channel or the range is not valid.
+        """
+        if channel is not None and channel not in _CHANNEL_INDEXES:
+            _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+            raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+        if start < 0 or (stop is not None and stop < start):
+            _logger.debug("A wrong frames range was passed: [{}, {})".format(start, stop))
+            raise ValueError("The frames range was wrong")
+        frames = self._iterate_frames(start, stop)
+        if channel is None:
+            return frames
+        index = _CHANNEL_INDEXES[channel]
+        return (frame[:, :, index] for frame in frames)
+
+    def _iterate_frames(self, start, stop):
+        """ Iterates over the given range of whole BGR frames.
+        Note: We assume validations were already performed when execution of this method is reached.
+
+        Args:
+            start (int): The index of the first frame to yield.
+            stop (int): The index of the frame at which iteration stops (exclusive), or None.
+        Returns:
+            iterator: An iterator of frames.
+        """
+        raise NotImplementedError
+
+    def frame_roi(self, roi):
+        """ Translates the given ROI (in whole frame coordinates) into coordinates of the yielded frames.
+
+        Args:
+            roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        Returns:
+            tuple: The ROI (frames are not cropped, unless a subclass says otherwise).
+        """
+        return roi
+
+    @property
+    def length(self):
+        """
+        Returns:
+            The amount of frames.
+        """
+        return self._length
+
+    @property
+    def width(self):
+        """
+        Returns:
+            The frames width.
+        """
+        return self._width
+
+    @property
+    def height(self):
+        """
+        Returns:
+            The frames height.
+        """
+        return self._height
+
+    @property
+    def fps(self):
+        """
+        Returns:
+            The amount of frames per second.
+        """
+        return self._fps
+
+    @property
+    def path(self):
+        """
+        Returns:
+            The path to the video file, or None if frames do not come from a video file
+            (so they can not be cached, nor decoded in parallel).
+        """
+        return None
+
+    @property
+    def streaming(self):
+        """
+        Returns:
+            Whether frames are produced on demand (instead of being held in memory).
+        """
+        return self._streaming
+
+    @property
+    def channel(self):
+        """
+        Returns:
+            The only channel kept in the frames, or None if all channels are kept.
+        """
+        return None
+
+    @property
+    def crop(self):
+        """
+        Returns:
+            The rectangle of the frames that is kept, or None.
+        """
+        return None
+
+    @property
+    def stride(self):
+        """
+        Returns:
+            The amount of source frames per yielded frame.
+        """
+        return 1
 
-class Video:
-    """ Class representing a video loaded using OpenCV
+    @property
+    def b(self):
+        """
+        Returns:
+            The 'B' frames.
+        """
+        return self.frames('B')
+
+    @property
+    def g(self):
+        """
+        Returns:
+            The 'G' frames.
+        """
+        return self.frames('G')
+
+    @property
+    def r(self):
+        """
+        Returns:
+            The 'R' frames.
+        """
+        return self.frames('R')
+
+
+class Video(FrameSource):
+    """ Class representing a video loaded using OpenCV (i.e the source of the frames of a video file)
     """
 
-    def __init__(self, path_to_video):
-        """ Creates a new Video instance. This will load into memory the video.
+    def __init__(self, path_to_video, streaming=False, store=None, store_path=None, stats=None,
+                 channel=None, crop=None, stride=1):
+        """ Creates a new Video instance. Unless streaming is requested, this will load into memory the video.
 
         Args:
             path_to_video (str): The path to the video to analyze.
+            streaming (bool): When True, frames are not loaded into memory,
+                              but decoded lazily each time they are iterated.
+            store (str): How decoded frames are stored. If None, each frame is kept as a separate array.
+                         If 'array', frames are stored in one contiguous array with shape (frames, height, width, 3).
+                         If 'memmap', that array is a memory mapped .npy file (see store_path).
+            store_path (str): The path to the .npy file backing the 'memmap' store. If the file was already created
+                              for this video, it is opened instead of decoding the video again.
+            stats (Stats): A profiling_utils.Stats instance in which decoding is recorded. If None, it is not.
+            channel (str): If not None, only this channel ('R', 'G' or 'B') is kept from each decoded frame.
+            crop (tuple): If not None, only this rectangle of each decoded frame is kept. It is a 4-dimensional
+                          tuple with the upper, lower, left and right limits (like a ROI), in full frame coordinates.
+            stride (int): Only one of every stride frames is decoded (skipped frames are grabbed, but not decoded).
+                          The video fps and length are divided accordingly.
         Returns:
             A new video instance.
         Raises:
-            ValueError: If the given path_to_video is None, is not a string, or is an empty string.
+            ValueError: If the given path_to_video is None, is not a string, or is an empty string,
+                        or if the store or decoding options are not valid.
             IOError: If the given path_to_video is not a file.
         """
         # Check type and validate the given path_to_video
         if path_to_video is None or not isinstance(path_to_video, str) or not path_to_video:
             _logger.debug("The given path to the video is not valid")
             raise ValueError("None, non string or empty string path to video")
+        if store is not None and store not in STORES:
+            _logger.debug("Wrong store. Must be one of {}, but was {}".format(STORES, store))
+            raise ValueError("The store was wrong. Must be one of {}".format(STORES))
+        if store is not None and streaming:
+            _logger.debug("A store was requested for a streaming video")
+            raise ValueError("Streaming videos do not store frames")
+        if store == 'memmap' and (store_path is None or not isinstance(store_path, str) or not store_path):
+            _logger.debug("The given path to the store is not valid")
+            raise ValueError("None, non string or empty string path to the store")
+        if channel is not None and channel not in _CHANNEL_INDEXES:
+            _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+            raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+        if crop is not None and (not isinstance(crop, tuple) or len(crop) != 4
+                                 or not all(isinstance(limit, int) for limit in crop)
+                                 or crop[0] < 0 or crop[1] <= crop[0] or crop[2] < 0 or crop[3] <= crop[2]):
+            _logger.debug("Wrong crop definition. Must be a non empty 4-Dimensional tuple of non negative ints")
+            raise ValueError("Invalid crop definition. Must be a non empty 4-Dimensional tuple of non negative ints")
+        if stride is None or not isinstance(stride, int) or stride < 1:
+            _logger.debug("Wrong stride. Must be a positive integer")
+            raise ValueError("The stride must be a positive integer")
 
         # Check a file exists with the given path_to_file name
         if not os.path.isfile(path_to_video):
             _logger.debug("The given path to the video is not a file")
             raise IOError("'{}' is not a file".format(path_to_video))
 
-        video_capture = cv2.VideoCapture(path_to_video)
-        if not video_capture.isOpened():
-            _logger.debug("Could not open video")
-            raise IOError("Could not open '{}' file".format(path_to_video))
+        video_capture = _open_capture(path_to_video)
 
         _logger.info("Creating video instance... This might take a while")
         _logger.debug("Reading video properties...")
-        self._length = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._path = path_to_video
+        self._streaming = streaming
+        self._channel = channel
+        self._crop = crop
+        self._stride = stride
+        self._length = -(-int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)) // stride)  # Ceil division
         self._width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
         self._height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self._fps = video_capture.get(cv2.CAP_PROP_FPS)
+        self._fps = video_capture.get(cv2.CAP_PROP_FPS) / stride
         _logger.debug("Video properties read successfully")
 
-        _logger.debug("Reading video frames...")
+        if crop is not None and (crop[1] > self._height or crop[3] > self._width):
+            video_capture.release()
+            _logger.debug("The crop is out of range")
+            raise ValueError("Wrong crop. Is out of range")
+
+        self._frames = []
         self._b = []
         self._g = []
         self._r = []
-        while video_capture.isOpened():
-            ret, frame = video_capture.read()
-            if ret:
-                self._b += [frame[:, :, 0]]
-                self._g += [frame[:, :, 1]]
-                self._r += [frame[:, :, 2]]
-            else:
-                break
+        self._store = None
+        if streaming:
+            _logger.debug("Streaming mode. Frames will be decoded on demand")
+            video_capture.release()
+        elif store is not None:
+            self._store = self._load_store(video_capture, store, store_path,
+                                           profiling_utils.NULL_STATS if stats is None else stats)
+            self._length = self._store.shape[0]
+            self._frames = self._store
+            if channel is None:
+                self._b = self._store[:, :, :, 0]
+                self._g = self._store[:, :, :, 1]
+                self._r = self._store[:, :, :, 2]
+        else:
+            _logger.debug("Reading video frames...")
+            with (profiling_utils.NULL_STATS if stats is None else stats).stage('decode') as stage:
+                for frame in self._decode_frames(video_capture):
+                    self._frames += [frame]
+                    if channel is None:
+                        self._b += [frame[:, :, 0]]
+                        self._g += [frame[:, :, 1]]
+                        self._r += [frame[:, :, 2]]
+                stage.add_frames(len(self._frames))
+            _logger.debug("Video frames read successfully")
+
+        _logger.info("Video instance created successfully")
+
+    def _load_store(self, video_capture, store, store_path, recorder):
+        """ Loads the video frames into a contiguous array, preallocated with the frame count of the video.
+        For 'memmap' stores, a previously created store for this video is opened instead (without decoding).
+
+        Args:
+            video_capture (VideoCapture): The opened capture of the video.
+            store (str): The store ('array' or 'memmap').
+            store_path (str): The path to the .npy file backing the 'memmap' store.
+            recorder (Stats): The stats in which decoding is recorded (as the 'decode' stage),
+                              or opening a previously created store (as the 'store_open' stage).
+        Returns:
+            ndarray: The frames, with shape (frames, height, width, 3)
+                     (or (frames, height, width) if only one channel is kept).
+        """
+        metadata = {'video_path': os.path.abspath(self._path),
+                    'video_size': os.path.getsize(self._path), 'video_mtime': os.path.getmtime(self._path),
+                    'channel': self._channel, 'crop': None if self._crop is None else list(self._crop),
+                    'stride': self._stride}
+        metadata_path = store_path + '.json' if store == 'memmap' else None
+        if store == 'memmap' and os.path.isfile(store_path) and os.path.isfile(metadata_path):
+            with open(metadata_path) as metadata_file:
+                stored_metadata = json.load(metadata_file)
+            if all(stored_metadata.get(key) == value for key, value in metadata.items()):
+                _logger.debug("Opening previously stored frames...")
+                video_capture.release()
+                with recorder.stage('store_open') as stage:
+                    frames = np.load(store_path, mmap_mode='r')[:stored_metadata['length']]
+                    stage.add_frames(frames.shape[0])
+                return frames
+            _logger.debug("The stored frames belong to another video, to an older version of it, "
+                          "or were decoded with other options")
+
+        shape = (self._length,) + self._frame_shape()
+        temporary_path = None
+        if store == 'memmap':
+            # The store is decoded into a temporary file, which replaces the previous store once it is complete.
+            # The previous metadata is removed first, so an interrupted rebuild is never trusted
+            if os.path.isfile(metadata_path):
+                os.remove(metadata_path)
+            descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(store_path)),
+                                                          suffix='.npy.tmp')
+            os.close(descriptor)
+            frames = np.lib.format.open_memmap(temporary_path, mode='w+', dtype=np.uint8, shape=shape)
+        else:
+            frames = np.empty(shape, dtype=np.uint8)
+
+        _logger.debug("Reading video frames...")
+        count = 0
+        try:
+            with recorder.stage('decode') as stage:
+                for frame in self._decode_frames(video_capture):
+                    if count == self._length:
+                        _logger.warn("The video has more frames than reported. Exceeding frames are discarded")
+                        break
+                    frames[count] = frame
+                    count += 1
+                stage.add_frames(count)
+            if store == 'memmap':
+                frames.flush()
+                os.rename(temporary_path, store_path)  # The memory map keeps working, as the file is the same
+        except Exception:
+            if temporary_path is not None and os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+            raise
         _logger.debug("Video frames read successfully")
 
-        _logger.debug("Closing CV2...")
-        video_capture.release()
-        cv2.destroyAllWindows()
-        _logger.debug("CV2 closes successfully...")
+        if store == 'memmap':
+            metadata['length'] = count
+            _write_atomically(metadata_path, lambda metadata_file: json.dump(metadata, metadata_file))
+        return frames[:count]
 
-        _logger.info("Video instance created successfully")
+    def frames(self, channel=None, start=0, stop=None):
+        """ Iterates over the video frames.
+        In streaming mode, each frame is decoded when requested, and it is not kept after being yielded.
+
+        Args:
+            channel (str): The channel to yield ('R', 'G' or 'B'). If None, whole BGR frames are yielded
+                           (or frames of the kept channel, if only one channel is kept).
+            start (int): The index of the first frame to yield. In streaming mode, decoding seeks to this frame.
+            stop (int): The index of the frame at which iteration stops (exclusive). If None, iterates until the end.
+        Returns:
+            generator: A generator of frames.
+        Raises:
+            ValueError: If the channel or the range is not valid.
+        """
+        if channel is not None and channel not in _CHANNEL_INDEXES:
+            _logger.debug("A wrong channel was passed. Must be 'R', 'G' or 'B', but was {}".format(channel))
+            raise ValueError("The channel was wrong. Must be 'R', 'G' or 'B")
+        if start < 0 or (stop is not None and stop < start):
+            _logger.debug("A wrong frames range was passed: [{}, {})".format(start, stop))
+            raise ValueError("The frames range was wrong")
+        if self._channel is not None and channel not in (None, self._channel):
+            _logger.debug("The {} channel was requested, but only the {} one was kept".format(channel, self._channel))
+            raise ValueError("The channel was not kept when decoding the video")
+        if self._channel is not None:
+            channel = None  # Frames are already single channel
+        if self._store is not None:
+            return iter({None: self._frames, 'B': self._b, 'G': self._g, 'R': self._r}[channel][start:stop])
+        if not self._streaming:
+            return islice({None: self._frames, 'B': self._b, 'G': self._g, 'R': self._r}[channel], start, stop)
+        return self._stream_frames(channel, start, stop)
+
+    def _stream_frames(self, channel, start, stop):
+        """ Decodes the video frames one at a time.
+
+        Args:
+            channel (str): The channel to yield, or None to yield whole BGR frames.
+            start (int): The index of the first frame to yield.
+            stop (int): The index of the frame at which iteration stops (exclusive), or None.
+        Returns:
+            generator: A generator of frames.
+        """
+        video_capture = _open_capture(self._path)
+        if start > 0:
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, start * self._stride)
+        frames = self._decode_frames(video_capture)
+        for frame in frames if stop is None else islice(frames, stop - start):
+            yield frame if channel is None else frame[:, :, _CHANNEL_INDEXES[channel]]
+
+    def _decode_frames(self, video_capture):
+        """ Decodes frames from the given capture, applying the decoding options (stride, crop and channel).
+        When a crop or a channel is kept, the kept part is copied, so the whole decoded frame can be released.
+
+        Args:
+            video_capture (VideoCapture): An opened capture.
+        Returns:
+            generator: A generator of frames.
+        """
+        index = None if self._channel is None else _CHANNEL_INDEXES[self._channel]
+        for frame in _read_frames(video_capture, self._stride):
+            if self._crop is not None:
+                frame = frame[self._crop[0]:self._crop[1], self._crop[2]:self._crop[3]]
+            if index is not None:
+                frame = frame[:, :, index]
+            yield frame if self._crop is None and index is None else np.ascontiguousarray(frame)
+
+    def _frame_shape(self):
+        """
+        Returns:
+            tuple: The shape of the frames, once decoding options are applied.
+        """
+        height, width = (self._height, self._width) if self._crop is None \
+            else (self._crop[1] - self._crop[0], self._crop[3] - self._crop[2])
+        return (height, width) if self._channel is not None else (height, width, 3)
+
+    def frame_roi(self, roi):
+        """ Translates the given ROI (in whole frame coordinates) into coordinates of the decoded frames.
+
+        Args:
+            roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        Returns:
+            tuple: The ROI, relative to the crop (or the given ROI, if frames are not cropped).
+        Raises:
+            ValueError: If the ROI is not inside the crop.
+        """
+        if self._crop is None:
+            return roi
+        if roi[0] < self._crop[0] or roi[1] > self._crop[1] or roi[2] < self._crop[2] or roi[3] > self._crop[3]:
+            _logger.debug("The ROI {} is not inside the crop {}".format(roi, self._crop))
+            raise ValueError("Wrong ROI. Is not inside the decoded crop")
+        return roi[0] - self._crop[0], roi[1] - self._crop[0], roi[2] - self._crop[2], roi[3] - self._crop[2]
 
     @property
-    def length(self):
+    def path(self):
         """
         Returns:
-            The length of the video (i.e the amount of frames).
+            The path to the video file.
         """
-        return self._length
+        return self._path
 
     @property
-    def width(self):
+    def channel(self):
         """
         Returns:
-            The video width.
+            The only channel kept when decoding, or None if all channels are kept.
         """
-        return self._width
+        return self._channel
 
     @property
-    def height(self):
+    def crop(self):
         """
         Returns:
-            The video height.
+            The rectangle of the frames kept when decoding (upper, lower, left and right limits), or None.
         """
-        return self._height
+        return self._crop
 
     @property
-    def fps(self):
+    def stride(self):
         """
         Returns:
-            The amount of frames per second
+            The amount of source frames per decoded frame.
         """
-        return self._fps
+        return self._stride
+
+    @property
+    def decoding_options(self):
+        """
+        Returns:
+            dict: The decoding options (channel, crop and stride), as keyword arguments for the constructor.
+        """
+        return {'channel': self._channel, 'crop': self._crop, 'stride': self._stride}
 
     @property
     def b(self):
         """
         Returns:
-            The 'B' video frames.
+            The 'B' video frames (a generator when streaming, and a zero-copy array view when stored).
         """
-        return self._b
+        return self.frames('B') if self._streaming or self._channel is not None else self._b
 
     @property
     def g(self):
         """
         Returns:
-            The 'G' video frames.
+            The 'G' video frames (a generator when streaming, and a zero-copy array view when stored).
         """
-        return self._g
+        return self.frames('G') if self._streaming or self._channel is not None else self._g
 
     @property
     def r(self):
         """
         Returns:
-            The 'R' video frames.
+            The 'R' video frames (a generator when streaming, and a zero-copy array view when stored).
+        """
+        return self.frames('R') if self._streaming or self._channel is not None else self._r
+
+
+class ArraySource(FrameSource):
+    """ Class representing frames that are already decoded in memory, held in a numpy array (which is not copied).
+    """
+
+    def __init__(self, frames, fps):
+        """ Creates a new ArraySource instance.
+
+        Args:
+            frames (ndarray): The BGR frames, with shape (frames, height, width, 3).
+            fps (float): The amount of frames per second.
+        Returns:
+            A new ArraySource instance.
+        Raises:
+            ValueError: If the frames are not a (frames, height, width, 3) array, or if the fps is not positive.
+        """
+        if frames is None or not isinstance(frames, np.ndarray) or frames.ndim != 4 or frames.shape[3] != 3:
+            _logger.debug("The given frames are not a (frames, height, width, 3) numpy array")
+            raise ValueError("The frames must be a numpy array with shape (frames, height, width, 3)")
+        _validate_fps(fps)
+        self._frames = frames
+        self._length, self._height, self._width = frames.shape[:3]
+        self._fps = float(fps)
+
+    def _iterate_frames(self, start, stop):
+        return iter(self._frames[start:stop])
+
+
+class ImageDirectorySource(FrameSource):
+    """ Class representing a sequence of images in a directory (sorted by file name), read on demand.
+    """
+
+    def __init__(self, directory, fps):
+        """ Creates a new ImageDirectorySource instance. Only the first image is read.
+
+        Args:
+            directory (str): The path to the directory. Files with one of IMAGE_EXTENSIONS are the frames.
+            fps (float): The amount of frames per second.
+        Returns:
+            A new ImageDirectorySource instance.
+        Raises:
+            ValueError: If the directory is None, is not a string, or is an empty string,
+                        or if the fps is not positive.
+            IOError: If the directory is not a directory, has no images, or its first image could not be read.
+        """
+        if directory is None or not isinstance(directory, str) or not directory:
+            _logger.debug("The given directory is not valid")
+            raise ValueError("None, non string or empty string directory")
+        _validate_fps(fps)
+        if not os.path.isdir(directory):
+            _logger.debug("The given directory is not a directory")
+            raise IOError("'{}' is not a directory".format(directory))
+        self._directory = directory
+        self._paths = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                       if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+        if not self._paths:
+            _logger.debug("The given directory has no images")
+            raise IOError("'{}' has no images".format(directory))
+        self._height, self._width = _read_image(self._paths[0]).shape[:2]
+        self._length = len(self._paths)
+        self._fps = float(fps)
+        self._streaming = True
+
+    def _iterate_frames(self, start, stop):
+        for path in self._paths[start:stop]:
+            frame = _read_image(path)
+            if frame.shape[:2] != (self._height, self._width):
+                _logger.debug("The image '{}' has another size".format(path))
+                raise IOError("'{}' has another size than the first image".format(path))
+            yield frame
+
+    @property
+    def directory(self):
         """
-        return self._r
+        Returns:
+            The path to the directory of images.
+        """
+        return self._directory
+
+
+class RawStreamSource(FrameSource):
+    """ Class representing raw BGR frames (height * width * 3 bytes each, without any header) read from a stream
+    (e.g the standard input, fed by a camera process).
+    """
+
+    def __init__(self, stream, width, height, fps, length=None):
+        """ Creates a new RawStreamSource instance.
+        If no length is given, the stream is read until its end, and its frames are kept in memory (without copies).
+        Else, at most length frames are read on demand, so the stream can only be iterated once.
+
+        Args:
+            stream (file): The stream from which frames are read (opened in binary mode).
+            width (int): The frames width.
+            height (int): The frames height.
+            fps (float): The amount of frames per second.
+            length (int): The max. amount of frames to read. If None, the stream is read until its end.
+        Returns:
+            A new RawStreamSource instance.
+        Raises:
+            ValueError: If the stream is None, or if the size, fps or length are not valid.
+        """
+        if stream is None or not hasattr(stream, 'read'):
+            _logger.debug("The given stream is null or can not be read")
+            raise ValueError("The stream must be a non null readable stream")
+        if not isinstance(width, int) or not isinstance(height, int) or width <= 0 or height <= 0:
+            _logger.debug("Wrong frames size. Width and height must be positive integers")
+            raise ValueError("The frames width and height must be positive integers")
+        _validate_fps(fps)
+        if length is not None and (not isinstance(length, int) or length <= 0):
+            _logger.debug("Wrong amount of frames. Must be a positive integer")
+            raise ValueError("The amount of frames must be a positive integer")
+        self._stream = stream
+        self._width = width
+        self._height = height
+        self._fps = float(fps)
+        self._frame_bytes = height * width * 3
+        self._frames = None
+        self._consumed = False
+        if length is None:
+            _logger.debug("Reading raw frames until the end of the stream...")
+            data = stream.read()
+            self._length = len(data) // self._frame_bytes
+            if len(data) % self._frame_bytes != 0:
+                _logger.warn("The stream ends with an incomplete frame. It is discarded")
+            self._frames = np.frombuffer(data, dtype=np.uint8, count=self._length * self._frame_bytes) \
+                .reshape((self._length, height, width, 3))
+        else:
+            self._length = length
+            self._streaming = True
+
+    def _iterate_frames(self, start, stop):
+        if self._frames is not None:
+            return iter(self._frames[start:stop])
+        if self._consumed:
+            _logger.debug("The stream was already consumed")
+            raise IOError("The stream was already consumed")
+        self._consumed = True
+        return self._read_frames(start, self._length if stop is None else min(stop, self._length))
+
+    def _read_frames(self, start, stop):
+        """ Reads the given range of frames from the stream (skipping the first ones), until it ends.
+
+        Args:
+            start (int): The index of the first frame to yield.
+            stop (int): The index of the frame at which reading stops (exclusive).
+        Returns:
+            generator: A generator of frames.
+        """
+        for index in range(stop):
+            data = self._stream.read(self._frame_bytes)
+            if len(data) < self._frame_bytes:
+                if data:
+                    _logger.warn("The stream ends with an incomplete frame. It is discarded")
+                return
+            if index >= start:
+                yield np.frombuffer(data, dtype=np.uint8).reshape((self._height, self._width, 3))
+
+
+def probe(path_to_video):
+    """ Reads the properties of the given video, without decoding any frame.
+
+    Args:
+        path_to_video (str): The path to the video.
+    Returns:
+        dict: The video 'length', 'width', 'height' and 'fps'.
+    Raises:
+        IOError: If the video could not be opened.
+    """
+    video_capture = _open_capture(path_to_video)
+    try:
+        return {'length': int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+                'width': int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                'height': int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                'fps': video_capture.get(cv2.CAP_PROP_FPS)}
+    finally:
+        video_capture.release()
+
+
+def nyquist_stride(fps, max_freq, oversampling=_DEFAULT_OVERSAMPLING):
+    """ Calculates the greatest stride that keeps the sampling rate above the Nyquist rate of the given frequency.
+
+    Args:
+        fps (float): The amount of frames per second of the video.
+        max_freq (float): The max. frequency that must be preserved.
+        oversampling (float): The factor by which the sampling rate must exceed the Nyquist rate (2 * max_freq).
+    Returns:
+        int: The stride (1 if the video can not be downsampled).
+    """
+    if fps is None or fps <= 0 or max_freq is None or max_freq <= 0 or oversampling < 1:
+        _logger.debug("Wrong fps, max. frequency or oversampling. Must be positive (and oversampling at least 1)")
+        raise ValueError("The fps, max. frequency and oversampling must be positive, and oversampling at least 1")
+    return max(1, int(fps // (2 * max_freq * oversampling)))
+
+
+def decoding_options(path_to_video, roi, channel=None, crop_margin=None, stride=1, max_freq=None):
+    """ Builds the decoding options (constructor keyword arguments) of a Video that only decodes what measuring
+    the given ROI needs.
+
+    Args:
+        path_to_video (str): The path to the video.
+        roi (tuple): A 4-dimensional tuple holding each of the vertexes of a rectangular ROI.
+        channel (str): The only channel to keep, or None to keep all of them.
+        crop_margin (int): If not None, frames are cropped to the ROI plus this margin (in pixels) on every side.
+        stride (int): The stride, or AUTO_STRIDE to use the greatest stride preserving max_freq (see nyquist_stride).
+        max_freq (float): The max. frequency that must be preserved. Only used with AUTO_STRIDE.
+    Returns:
+        dict: The 'channel', 'crop' and 'stride' options.
+    Raises:
+        ValueError: If the crop margin is negative.
+        IOError: If the video must be probed and could not be opened.
+    """
+    if crop_margin is not None and (not isinstance(crop_margin, int) or crop_margin < 0):
+        _logger.debug("Wrong crop margin. Must be a non negative integer")
+        raise ValueError("The crop margin must be a non negative integer")
+    properties = probe(path_to_video) if crop_margin is not None or stride == AUTO_STRIDE else None
+
+    crop = None
+    if crop_margin is not None:
+        crop = (max(0, roi[0] - crop_margin), min(properties['height'], roi[1] + crop_margin),
+                max(0, roi[2] - crop_margin), min(properties['width'], roi[3] + crop_margin))
+    if stride == AUTO_STRIDE:
+        stride = nyquist_stride(properties['fps'], max_freq)
+        _logger.debug("Using a stride of {} frames".format(stride))
+    return {'channel': channel, 'crop': crop, 'stride': stride}
+
+
+def _validate_fps(fps):
+    """ Validates the given amount of frames per second.
+
+    Args:
+        fps (float): The amount of frames per second.
+    Raises:
+        ValueError: If the fps is not a positive number.
+    """
+    if fps is None or not isinstance(fps, (int, float)) or fps <= 0:
+        _logger.debug("Wrong fps. Must be a positive number")
+        raise ValueError("The fps must be a positive number")
+
+
+def _read_image(path):
+    """ Reads the given image as a BGR frame.
+
+    Args:
+        path (str): The path to the image.
+    Returns:
+        ndarray: The frame.
+    Raises:
+        IOError: If the image could not be read.
+    """
+    frame = cv2.imread(path, cv2.IMREAD_COLOR)
+    if frame is None:
+        _logger.debug("Could not read image")
+        raise IOError("Could not read '{}' image".format(path))
+    return frame
+
+
+def _write_atomically(path, write_function):
+    """ Writes a file by writing a temporary file in the same directory, and renaming it.
+
+    Args:
+        path (str): The path of the file to write.
+        write_function (function): A function that receives the opened file and writes it.
+    """
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'w') as temporary_file:
+            write_function(temporary_file)
+        os.rename(temporary_path, path)
+    except Exception:
+        os.remove(temporary_path)
+        raise
+
+
+def _open_capture(path_to_video):
+    """ Opens an OpenCV capture for the given video file.
+
+    Args:
+        path_to_video (str): The path to the video.
+    Returns:
+        VideoCapture: The opened capture.
+    Raises:
+        IOError: If the video could not be opened.
+    """
+    video_capture = cv2.VideoCapture(path_to_video)
+    if not video_capture.isOpened():
+        _logger.debug("Could not open video")
+        raise IOError("Could not open '{}' file".format(path_to_video))
+    return video_capture
+
+
+def _read_frames(video_capture, stride=1):
+    """ Reads all frames from the given capture, releasing it when finished (or when the generator is closed).
+
+    Args:
+        video_capture (VideoCapture): An opened capture.
+        stride (int): Only one of every stride frames is read. The rest are grabbed, but not decoded.
+    Returns:
+        generator: A generator of BGR frames.
+    """
+    try:
+        while video_capture.isOpened():
+            ret, frame = video_capture.read()
+            if not ret:
+                break
+            yield frame
+            if not all(video_capture.grab() for _ in range(stride - 1)):
+                break
+    finally:
+        _logger.debug("Closing CV2...")
+        video_capture.release()
+        _logger.debug("CV2 closes successfully...")
@@ -1,12 +1,58 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """
-    Dummy conftest.py for heart_rate.
+    conftest.py for heart_rate.
 
-    If you don't know what this is for, just leave it empty.
+    Provides synthetic frames and videos, so tests do not need any video file.
     Read more about conftest.py under:
     https://pytest.org/latest/plugins.html
 """
 from __future__ import print_function, absolute_import, division
 
+import cv2
+import numpy as np
 import pytest
+
+FPS = 30.0
+
+BPM = 72.0
+
+# The skin tone (B, G, R), and how much the pulse changes each channel (relative to its tone, like in skin)
+_TONE = np.array([90.0, 120.0, 160.0])
+_PULSE_DIRECTION = np.array([0.53, 0.77, 0.33])
+
+
+def _make_frames(length=256, bpm=BPM, fps=FPS, height=48, width=64, amplitude=0.03, seed=0):
+    """ Creates BGR frames of a skin colored scene whose color pulses at the given rate.
+
+    Returns:
+        ndarray: The frames, with shape (length, height, width, 3).
+    """
+    rng = np.random.RandomState(seed)
+    pulse = amplitude * np.sin(2 * np.pi * bpm / 60.0 * np.arange(length) / fps)
+    colors = _TONE * (1 + pulse[:, np.newaxis] * _PULSE_DIRECTION)  # (length, 3)
+    noise = rng.uniform(-2, 2, (length, height, width, 3))
+    return np.clip(np.round(colors[:, np.newaxis, np.newaxis, :] + noise), 0, 255).astype(np.uint8)
+
+
+@pytest.fixture
+def synthetic_frames():
+    """ A function that creates pulsing frames (see _make_frames).
+    """
+    return _make_frames
+
+
+@pytest.fixture
+def synthetic_video(tmpdir):
+    """ A function that writes pulsing frames (see _make_frames) into a video file, returning its path.
+    """
+    def write(name='video.avi', **kwargs):
+        frames = _make_frames(**kwargs)
+        path = str(tmpdir.join(name))
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), kwargs.get('fps', FPS),
+                                 (frames.shape[2], frames.shape[1]))
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+        return path
+    return write
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the cache_utils module: the persistent cache of extracted signals.
+"""
+from __future__ import print_function, absolute_import, division
+
+import os
+
+import numpy as np
+import pytest
+
+from heart_rate import cache_utils, heart_rate_utils, profiling_utils, video_utils
+
+from conftest import BPM
+
+_ROI = (0, 40, 0, 40)
+
+
+def _signal(length=100, seed=0):
+    return np.random.RandomState(seed).rand(3, length)
+
+
+@pytest.fixture
+def video_file(tmpdir):
+    path = tmpdir.join('video.avi')
+    path.write('not really a video')
+    return str(path)
+
+
+def test_cached_signal_is_got_back(tmpdir, video_file):
+    cache = cache_utils.SignalCache(str(tmpdir.join('cache')))
+    assert cache.get(video_file, _ROI) is None
+    cache.put(video_file, _ROI, _signal(), 30.0)
+    signal, fps = cache.get(video_file, _ROI)
+    np.testing.assert_array_equal(signal, _signal())
+    assert fps == 30.0
+
+
+def test_entries_are_keyed_by_roi_stride_and_video(tmpdir, video_file):
+    cache = cache_utils.SignalCache(str(tmpdir.join('cache')))
+    cache.put(video_file, _ROI, _signal(), 30.0)
+    assert cache.get(video_file, (0, 40, 0, 41)) is None
+    assert cache.get(video_file, _ROI, stride=2) is None
+    with open(video_file, 'a') as modified_video:
+        modified_video.write('!')
+    assert cache.get(video_file, _ROI) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmpdir, video_file):
+    cache = cache_utils.SignalCache(str(tmpdir.join('cache')), max_bytes=6000)  # Two signals of 2400 bytes
+    rois = [(0, 10, 0, 10), (0, 20, 0, 20), (0, 30, 0, 30)]
+    for index, roi in enumerate(rois[:2]):
+        cache.put(video_file, roi, _signal(seed=index), 30.0)
+    for index, roi in enumerate(rois[:2]):
+        for entry_path in cache._entry_paths(video_file, roi):
+            os.utime(entry_path, (1000 + index, 1000 + index))  # The first entry is the oldest one
+    assert cache.get(video_file, rois[0]) is not None  # Now the first entry is the most recently used
+    cache.put(video_file, rois[2], _signal(seed=2), 30.0)
+    assert cache.get(video_file, rois[0]) is not None
+    assert cache.get(video_file, rois[1]) is None
+    assert cache.get(video_file, rois[2]) is not None
+    assert len(os.listdir(cache.directory)) == 4  # No temporary files are left
+
+
+def test_measure_does_not_decode_a_cached_video(synthetic_video, tmpdir):
+    path = synthetic_video(length=128)
+    cache = cache_utils.SignalCache(str(tmpdir.join('cache')))
+    first = heart_rate_utils.measure(video_utils.Video(path, streaming=True), _ROI, 0.8, 3.0, cache=cache)
+    stats = profiling_utils.Stats()
+    second, stats = heart_rate_utils.measure(video_utils.Video(path, streaming=True, stats=stats), _ROI, 0.8, 3.0,
+                                             'R', cache=cache, stats=stats)
+    assert 'decode' not in stats.as_dict()['stages']
+    assert abs(first - BPM) <= 60 * 30.0 / 128
+    assert abs(second - BPM) <= 60 * 30.0 / 128
+
+
+@pytest.mark.parametrize('max_bytes', [0, -1, 1.5, None])
+def test_wrong_max_size_is_rejected(tmpdir, max_bytes):
+    with pytest.raises(ValueError):
+        cache_utils.SignalCache(str(tmpdir), max_bytes)
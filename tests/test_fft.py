@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the fft module, comparing its transforms against numpy's.
+"""
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+import pytest
+
+from heart_rate import fft
+
+LENGTHS = [1, 2, 8, 64, 256, 3, 5, 15, 127, 6, 100]
+
+DTYPES = [np.float32, np.float64, np.complex64, np.complex128]
+
+REAL_DTYPES = [np.float32, np.float64]
+
+
+def _series(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    x = rng.randn(*shape)
+    if np.dtype(dtype).kind == 'c':
+        x = x + 1j * rng.randn(*shape)
+    return x.astype(dtype)
+
+
+def _assert_close(actual, expected, precision=1e-9):
+    scale = max(1.0, np.abs(expected).max()) if expected.size else 1.0
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=precision * scale)
+
+
+@pytest.mark.parametrize('n', LENGTHS)
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_fft_matches_numpy(n, dtype):
+    x = _series((n,), dtype)
+    _assert_close(fft.fft(x), np.fft.fft(x))
+
+
+@pytest.mark.parametrize('n', LENGTHS)
+@pytest.mark.parametrize('dtype', REAL_DTYPES)
+def test_rfft_matches_numpy(n, dtype):
+    x = _series((n,), dtype)
+    _assert_close(fft.rfft(x), np.fft.rfft(x))
+
+
+@pytest.mark.parametrize('shape', [(4, 6, 8), (3, 5, 7)])
+@pytest.mark.parametrize('axis', [0, 1, 2, -1, -2, -3])
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_fft_along_every_axis(shape, axis, dtype):
+    x = _series(shape, dtype)
+    _assert_close(fft.fft(x, axis=axis), np.fft.fft(x, axis=axis))
+
+
+@pytest.mark.parametrize('shape', [(4, 6, 8), (3, 5, 7)])
+@pytest.mark.parametrize('axis', [0, 1, 2, -1, -2, -3])
+@pytest.mark.parametrize('dtype', REAL_DTYPES)
+def test_rfft_along_every_axis(shape, axis, dtype):
+    x = _series(shape, dtype)
+    _assert_close(fft.rfft(x, axis=axis), np.fft.rfft(x, axis=axis))
+
+
+@pytest.mark.parametrize('backend', fft.available_backends())
+def test_backends_match_numpy(backend):
+    x = _series((3, 100), np.float64)
+    _assert_close(fft.fft(x, backend=backend), np.fft.fft(x))
+    _assert_close(fft.rfft(x, backend=backend), np.fft.rfft(x))
+
+
+def test_fft_of_empty_series_returns_it():
+    result = fft.fft(np.array([]))
+    assert result.shape == (0,)
+    assert result.dtype == np.complex128
+
+
+def test_rfft_rejects_complex_series():
+    with pytest.raises(ValueError):
+        fft.rfft(_series((8,), np.complex128))
+
+
+def test_fft_rejects_wrong_axis():
+    with pytest.raises(ValueError):
+        fft.fft(_series((4, 8), np.float64), axis=2)
+
+
+@pytest.mark.parametrize('n', LENGTHS)
+@pytest.mark.parametrize('dtype', DTYPES)
+def test_plan_execute_into_output_array(n, dtype):
+    x = _series((3, n), dtype)
+    fft_plan = fft.plan(n, dtype)
+    expected = np.fft.rfft(x) if np.dtype(dtype).kind == 'f' else np.fft.fft(x)
+    out = np.empty((3, fft_plan.output_length), dtype=np.result_type(dtype, np.complex64))
+    result = fft_plan.execute(x, out=out)
+    assert result is out
+    precision = 1e-4 if np.dtype(dtype) in (np.float32, np.complex64) else 1e-9  # Single precision plans
+    _assert_close(out, expected, precision)
+    fft_plan.execute(x, out=out)  # Scratch buffers are reused
+    _assert_close(out, expected, precision)
+
+
+def test_plan_execute_into_non_contiguous_output_array():
+    x = _series((3, 64), np.float64)
+    out = np.empty((33, 3), dtype=np.complex128).T
+    fft.plan(64, np.float64).execute(x, out=out)
+    _assert_close(out, np.fft.rfft(x))
+
+
+def test_plan_execute_rejects_wrong_output_array():
+    fft_plan = fft.plan(16, np.complex128)
+    with pytest.raises(ValueError):
+        fft_plan.execute(_series((16,), np.complex128), out=np.empty(16, dtype=np.complex64))
+    with pytest.raises(ValueError):
+        fft_plan.execute(_series((8,), np.complex128))
+
+
+def test_plans_are_cached():
+    assert fft.plan(32, np.float64) is fft.plan(32, np.float64)
+    assert fft.plan(32, np.float64) is not fft.plan(32, np.complex128)
+
+
+@pytest.mark.parametrize('n', [64, 100, 127])
+@pytest.mark.parametrize('m', [1, 16, 33])
+@pytest.mark.parametrize('axis', [0, -1])
+def test_zoom_fft_matches_dft(n, m, axis):
+    fs = 30.0
+    x = _series((n, 2) if axis == 0 else (2, n), np.float64)
+    frequencies = fft.zoom_fftfreq(0.7, 4.0, m) if m > 1 else np.array([0.7])
+    dft = np.exp(-2j * np.pi * np.outer(frequencies, np.arange(n)) / fs)  # (m, n)
+    expected = np.dot(dft, x) if axis == 0 else np.dot(x, dft.T)
+    _assert_close(fft.zoom_fft(x, 0.7, 4.0 if m > 1 else 0.7, m, fs, axis=axis), expected)
+
+
+def test_zoom_fft_matches_fft_on_its_bins():
+    x = _series((128,), np.float64)
+    _assert_close(fft.zoom_fft(x, 0.0, 127.0, 128, fs=128.0), np.fft.fft(x))
+
+
+@pytest.mark.parametrize('n', LENGTHS)
+@pytest.mark.parametrize('d', [1.0, 1 / 30.0])
+def test_frequencies_match_numpy(n, d):
+    _assert_close(fft.fftfreq(n, d), np.fft.fftfreq(n, d))
+    _assert_close(fft.rfftfreq(n, d), np.fft.rfftfreq(n, d))
+
+
+@pytest.mark.parametrize('shape', [(4, 6, 8), (3, 5, 7)])
+@pytest.mark.parametrize('axis', [0, 1, 2, -1])
+def test_fftshift_matches_numpy(shape, axis):
+    x = _series(shape, np.float64)
+    np.testing.assert_array_equal(fft.fftshift(x, axis=axis), np.fft.fftshift(x, axes=axis))
+
+
+def test_zoom_tables_cache_is_bounded():
+    x = _series((64,), np.float64)
+    try:
+        fft.set_plan_cache_size(4)
+        for band in range(10):
+            fft.zoom_fft(x, 0.5 + band * 0.01, 4.0, 16, 30.0)
+        assert len(fft._zoom_cache) == 4
+        fft.zoom_fft(x, 0.5 + 6 * 0.01, 4.0, 16, 30.0)  # A hit marks it as recently used
+        fft.zoom_fft(x, 0.4, 4.0, 16, 30.0)
+        assert (0.5 + 6 * 0.01) / 30.0 in [key[2] for key in fft._zoom_cache]
+    finally:
+        fft.set_plan_cache_size(fft.PLANS_CACHE_SIZE)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the heart_rate_utils module: measuring the heart beat rate.
+"""
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+import pytest
+
+from heart_rate import heart_rate_utils, video_utils
+
+from conftest import BPM, FPS
+
+
+def test_grid_rois_cover_the_roi():
+    rois = heart_rate_utils.grid_rois((0, 40, 8, 56), 2, 3)
+    assert rois == [(0, 20, 8, 24), (0, 20, 24, 40), (0, 20, 40, 56),
+                    (20, 40, 8, 24), (20, 40, 24, 40), (20, 40, 40, 56)]
+
+
+def test_measure_rois_matches_measuring_each_roi(synthetic_frames):
+    frames = synthetic_frames(length=200)
+    rois = heart_rate_utils.grid_rois((0, 47, 0, 63), 2, 2)
+    for use_all_frames in (False, True):
+        results, qualities = heart_rate_utils.measure_rois(video_utils.ArraySource(frames, FPS), rois, 0.8, 3.0,
+                                                           use_all_frames=use_all_frames)
+        expected = [heart_rate_utils.measure(video_utils.ArraySource(frames, FPS), roi, 0.8, 3.0,
+                                             use_all_frames=use_all_frames) for roi in rois]
+        assert list(results) == pytest.approx(expected)
+        assert all(0 < quality <= 1 for quality in qualities)
+    assert list(results) == pytest.approx([BPM] * len(rois))
+
+
+def test_measure_rois_quality_is_higher_where_the_pulse_is(synthetic_frames):
+    frames = synthetic_frames(length=256).copy()
+    frames[:, :, 32:] = np.random.RandomState(1).randint(100, 140, frames[:, :, 32:].shape)  # No pulse on the right
+    results, qualities = heart_rate_utils.measure_rois(video_utils.ArraySource(frames, FPS),
+                                                       [(0, 47, 0, 32), (0, 47, 32, 63)], 0.8, 3.0)
+    assert abs(results[0] - BPM) <= 60 * FPS / 256
+    assert qualities[0] > qualities[1]
+
+
+@pytest.mark.parametrize('rois', [[], [(0, 10, 0, 10), (0, 100, 0, 10)], [(0, 10, 5, 5)]])
+def test_measure_rois_rejects_wrong_rois(synthetic_frames, rois):
+    with pytest.raises(ValueError):
+        heart_rate_utils.measure_rois(video_utils.ArraySource(synthetic_frames(length=8), FPS), rois, 0.8, 3.0)
+
+
+def _moving_skin_frames(length, motion_bpm=36.0, seed=0):
+    """ Creates frames of a pulsing skin whose intensity also changes (5 times more than the pulse) with motion.
+    """
+    rng = np.random.RandomState(seed)
+    time = np.arange(length) / FPS
+    pulse = 0.002 * np.sin(2 * np.pi * BPM / 60 * time)
+    motion = 0.01 * np.sin(2 * np.pi * motion_bpm / 60 * time + 0.3)
+    tone, direction = np.array([90.0, 120.0, 160.0]), np.array([0.53, 0.77, 0.33])
+    colors = tone * (1 + motion[:, np.newaxis]) * (1 + direction * pulse[:, np.newaxis])
+    frames = colors[:, np.newaxis, np.newaxis, :] + rng.uniform(-0.5, 0.5, (length, 40, 40, 3))
+    return np.clip(np.round(frames), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('projection', heart_rate_utils.PROJECTIONS)
+def test_projections_cancel_intensity_changes(projection):
+    source = video_utils.ArraySource(_moving_skin_frames(512), FPS)
+    result, channel_results = heart_rate_utils.measure_projection(source, (0, 39, 0, 39), 0.5, 4.0, projection)
+    assert abs(result - BPM) <= 60 * FPS / 512
+    assert all(abs(channel_result - 36.0) <= 60 * FPS / 512 for channel_result in channel_results.values())
+
+
+def test_pos_matches_its_definition():
+    means = 100 + np.random.RandomState(0).rand(3, 300) * 5
+    window = int(round(1.6 * FPS))
+    expected = np.zeros(300)
+    for start in range(300 - window + 1):  # Overlap-adds the projection of each window
+        b, g, r = means[:, start:start + window] / means[:, start:start + window].mean(axis=1, keepdims=True)
+        projected = g - b + (g - b).std() / (g + b - 2 * r).std() * (g + b - 2 * r)
+        expected[start:start + window] += projected - projected.mean()
+    np.testing.assert_allclose(heart_rate_utils._project_pos(means, FPS), expected, atol=1e-10)
+
+
+def test_projection_channel_results_match_measuring_each_channel(synthetic_frames):
+    frames = synthetic_frames(length=128)
+    _, channel_results = heart_rate_utils.measure_projection(video_utils.ArraySource(frames, FPS), (8, 40, 8, 56),
+                                                             0.8, 3.0, 'chrom')
+    for channel in ('R', 'G', 'B'):
+        assert channel_results[channel] == heart_rate_utils.measure(video_utils.ArraySource(frames, FPS),
+                                                                    (8, 40, 8, 56), 0.8, 3.0, channel)
+
+
+@pytest.mark.parametrize('projection', ['ica', None])
+def test_wrong_projection_is_rejected(synthetic_frames, projection):
+    with pytest.raises(ValueError):
+        heart_rate_utils.measure_projection(video_utils.ArraySource(synthetic_frames(length=8), FPS), (0, 10, 0, 10),
+                                            0.8, 3.0, projection)
+
+
+def test_projection_requires_all_channels(synthetic_video):
+    video = video_utils.Video(synthetic_video(length=8), channel='G')
+    with pytest.raises(ValueError):
+        heart_rate_utils.measure_projection(video, (0, 10, 0, 10), 0.8, 3.0)
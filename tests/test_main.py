@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the main module: command line arguments that can not be used together.
+"""
+from __future__ import print_function, absolute_import, division
+
+import pytest
+
+from heart_rate import main
+
+
+@pytest.mark.parametrize('mode', [['--grid', '2x2'], ['--window-size', '64']])
+@pytest.mark.parametrize('option', [['--cache-dir', 'cache'], ['-s', '--decode-workers', '2'],
+                                    ['--pipeline-depth', '4']])
+def test_options_of_the_average_rate_are_rejected(synthetic_video, tmpdir, mode, option, capsys):
+    path = synthetic_video(length=64)
+    option = [str(tmpdir.join(value)) if value == 'cache' else value for value in option]
+    with pytest.raises(SystemExit):
+        main.main(['-vp', path, '-rUL', '0', '-rLL', '40', '-rlL', '0', '-rrL', '40'] + mode + option)
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of decoding a video in parallel chunks (see heart_rate_utils.measure and its decode_workers param).
+"""
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+import pytest
+
+from heart_rate import heart_rate_utils, video_utils
+
+_ROI = (4, 40, 8, 56)
+
+
+def _serial_means(video, roi, channels):
+    if video.channel is not None:  # Frames are already single channel
+        return heart_rate_utils._reduce_roi_means(video.frames(), video.frame_roi(roi), video.length)[np.newaxis]
+    return heart_rate_utils._reduce_roi_means(video.frames(), video.frame_roi(roi), video.length, channels)
+
+
+@pytest.mark.parametrize('workers', [1, 3, 8])
+def test_parallel_means_match_serial_ones(synthetic_video, workers):
+    path = synthetic_video(length=50)
+    expected = _serial_means(video_utils.Video(path, streaming=True), _ROI, 'BGR')
+    means = heart_rate_utils._reduce_roi_means_parallel(video_utils.Video(path, streaming=True), _ROI, 50, 'BGR',
+                                                        workers)
+    np.testing.assert_allclose(means, expected)
+
+
+def test_parallel_means_keep_the_decoding_options(synthetic_video):
+    path = synthetic_video(length=50)
+    options = video_utils.decoding_options(path, _ROI, channel='G', crop_margin=2, stride=3)
+    video = video_utils.Video(path, streaming=True, **options)
+    expected = _serial_means(video_utils.Video(path, streaming=True, **options), _ROI, 'G')
+    means = heart_rate_utils._reduce_roi_means_parallel(video, _ROI, video.length, 'G', 4)
+    assert means.shape == (1, 17)
+    np.testing.assert_allclose(means, expected)
+
+
+def test_measure_with_decode_workers_matches_serial_measure(synthetic_video):
+    path = synthetic_video(length=128)
+    expected = heart_rate_utils.measure(video_utils.Video(path, streaming=True), _ROI, 0.8, 3.0)
+    assert heart_rate_utils.measure(video_utils.Video(path, streaming=True), _ROI, 0.8, 3.0,
+                                    decode_workers=4) == expected
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_decode_workers_require_a_streaming_video_file(synthetic_video, synthetic_frames, streaming):
+    source = video_utils.Video(synthetic_video(length=16), streaming=False) if not streaming \
+        else video_utils.ArraySource(synthetic_frames(length=16), 30.0)
+    with pytest.raises(ValueError):
+        heart_rate_utils.measure(source, _ROI, 0.8, 3.0, decode_workers=2)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the pipeline_utils module: prefetching items in a background thread.
+"""
+from __future__ import print_function, absolute_import, division
+
+import threading
+from concurrent.futures import CancelledError, TimeoutError
+from timeit import default_timer
+
+import pytest
+
+from heart_rate import heart_rate_utils, pipeline_utils, video_utils
+
+from conftest import FPS
+
+
+def _stalled(released, closed=None):
+    """ Yields one item, and then stalls until released (like a stream that stops sending frames).
+    """
+    try:
+        yield 1
+        released.wait(5)
+        yield 2
+    finally:
+        if closed is not None:
+            closed.set()
+
+
+def test_prefetch_keeps_the_items_and_their_order():
+    assert list(pipeline_utils.prefetch(iter(range(100)), 3, timeout=5)) == list(range(100))
+
+
+def test_prefetch_times_out_while_the_producer_is_stalled():
+    released = threading.Event()
+    items = pipeline_utils.prefetch(_stalled(released), 2, timeout=0.2)
+    start = default_timer()
+    assert next(items) == 1
+    with pytest.raises(TimeoutError):
+        next(items)
+    assert default_timer() - start < 2
+    released.set()
+
+
+def test_prefetch_is_cancelled_while_the_producer_is_stalled():
+    released, cancel_event = threading.Event(), threading.Event()
+    items = pipeline_utils.prefetch(_stalled(released), 2, cancel_event=cancel_event)
+    assert next(items) == 1
+    threading.Timer(0.1, cancel_event.set).start()
+    with pytest.raises(CancelledError):
+        next(items)
+    released.set()
+
+
+def test_closing_prefetch_early_releases_the_iterable():
+    released, closed = threading.Event(), threading.Event()
+    items = pipeline_utils.prefetch(_stalled(released, closed), 2)
+    assert next(items) == 1
+    items.close()
+    released.set()
+    assert closed.wait(2)
+
+
+def test_prefetch_reraises_errors_of_the_iterable():
+    def failing():
+        yield 1
+        raise IOError("Could not decode")
+    with pytest.raises(IOError):
+        list(pipeline_utils.prefetch(failing(), 2))
+
+
+@pytest.mark.parametrize('depth, timeout', [(0, None), (None, None), (2, 0), (2, -1)])
+def test_prefetch_rejects_wrong_params(depth, timeout):
+    with pytest.raises(ValueError):
+        pipeline_utils.prefetch(iter([]), depth, timeout)
+
+
+def test_measure_with_pipeline_matches_measure_without_it(synthetic_frames):
+    frames = synthetic_frames(length=128)
+    expected = heart_rate_utils.measure(video_utils.ArraySource(frames, FPS), (8, 40, 8, 56), 0.8, 3.0)
+    assert heart_rate_utils.measure(video_utils.ArraySource(frames, FPS), (8, 40, 8, 56), 0.8, 3.0,
+                                    pipeline_depth=4, timeout=30) == expected
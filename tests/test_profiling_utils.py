@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the profiling_utils module: per stage statistics.
+"""
+from __future__ import print_function, absolute_import, division
+
+import pytest
+
+from heart_rate import main, profiling_utils
+
+
+class _Clock:
+    """ A fake clock (and peak resident set size), which only move when told to.
+    """
+
+    def __init__(self):
+        self.time = 0.0
+        self.peak = 1000
+
+    def advance(self, seconds, peak_increase=0):
+        self.time += seconds
+        self.peak += peak_increase
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(profiling_utils, 'default_timer', lambda: clock.time)
+    monkeypatch.setattr(profiling_utils, '_peak_rss_bytes', lambda: clock.peak)
+    monkeypatch.setattr(profiling_utils, 'resource', object())  # As if peaks could be known
+    return clock
+
+
+def test_nested_stages_are_excluded_from_their_parents(clock):
+    stats = profiling_utils.Stats()
+    with stats.stage('outer', frames=10):
+        clock.advance(1.0, 100)
+        with stats.stage('middle'):
+            clock.advance(2.0, 20)
+            with stats.stage('inner', frames=5):
+                clock.advance(4.0, 3)
+        clock.advance(8.0)
+    stages = stats.as_dict()['stages']
+    names = ['outer', 'middle', 'inner']
+    assert [stages[name]['wall_time'] for name in names] == [9.0, 2.0, 4.0]
+    assert [stages[name]['peak_rss_increase_bytes'] for name in names] == [100, 20, 3]
+    assert stages['outer']['frames_per_second'] == pytest.approx(10 / 9.0)
+    assert stats.as_dict()['wall_time'] == 15.0
+
+
+def test_stage_runs_are_accumulated(clock):
+    stats = profiling_utils.Stats()
+    for _ in range(3):
+        with stats.stage('fft') as stage:
+            clock.advance(0.5)
+            stage.add_frames(2)
+    assert stats.as_dict()['stages']['fft'] == {'wall_time': 1.5, 'frames': 6, 'calls': 3,
+                                                'peak_rss_increase_bytes': 0, 'frames_per_second': 4.0}
+
+
+def test_timed_iter_only_records_producing_the_items(clock):
+    stats = profiling_utils.Stats()
+
+    def frames():
+        for frame in range(4):
+            clock.advance(1.0)
+            yield frame
+    with stats.stage('reduce'):
+        for _ in stats.timed_iter('decode', frames()):
+            clock.advance(10.0)
+    stages = stats.as_dict()['stages']
+    assert (stages['decode']['wall_time'], stages['decode']['frames'], stages['decode']['calls']) == (4.0, 4, 1)
+    assert stages['reduce']['wall_time'] == 40.0
+
+
+def test_timed_iter_is_recorded_when_closed_early(clock):
+    stats = profiling_utils.Stats()
+    items = stats.timed_iter('decode', iter(range(10)))
+    next(items)
+    items.close()
+    assert stats.as_dict()['stages']['decode']['calls'] == 1
+    assert stats.as_dict()['stages']['decode']['frames'] == 1
+
+
+@pytest.mark.parametrize('option', [['--grid', '2x2'], ['--window-size', '64']])
+def test_profiling_is_rejected_when_not_measuring_the_average_rate(synthetic_video, tmpdir, option):
+    path = synthetic_video(length=64)
+    with pytest.raises(SystemExit):
+        main.main(['--profile', str(tmpdir.join('stats.json')), '-vp', path,
+                   '-rUL', '0', '-rLL', '40', '-rlL', '0', '-rrL', '40'] + option)
+    assert not tmpdir.join('stats.json').check()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the realtime_utils module: the sliding DFT heart rate monitor.
+"""
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+import pytest
+
+from heart_rate import realtime_utils, video_utils
+
+from conftest import BPM, FPS
+
+
+@pytest.mark.parametrize('window_size, hop_size', [(64, 1), (100, 7)])
+def test_monitor_matches_full_fft_of_each_window(window_size, hop_size):
+    rng = np.random.RandomState(0)
+    samples = np.sin(2 * np.pi * 1.3 * np.arange(400) / FPS) + rng.randn(400)
+    monitor = realtime_utils.HeartRateMonitor((0, 1, 0, 1), FPS, 0.8, 3.0, window_size, hop_size)
+    frequencies = np.fft.rfftfreq(window_size, 1 / FPS)
+    band = (frequencies >= 0.8) & (frequencies <= 3.0)
+    readings = 0
+    for index, sample in enumerate(samples):
+        bpm = monitor.push_value(sample)
+        if bpm is None:
+            continue
+        readings += 1
+        power = np.abs(np.fft.rfft(samples[index + 1 - window_size:index + 1])) ** 2
+        assert bpm == pytest.approx(frequencies[band][np.argmax(power[band])] * 60)
+    assert readings == (len(samples) - window_size) // hop_size + 1
+
+
+def test_monitor_measures_pulsing_frames(synthetic_frames):
+    monitor = realtime_utils.HeartRateMonitor((8, 40, 8, 56), FPS, 0.8, 3.0, 128, 32)
+    readings = [monitor.push(frame) for frame in synthetic_frames(length=256)]
+    readings = [bpm for bpm in readings if bpm is not None]
+    assert len(readings) == 5
+    assert all(abs(bpm - BPM) <= 60 * FPS / 128 for bpm in readings)
+
+
+@pytest.mark.parametrize('roi', [(10, 10, 0, 5), (0, 5, 8, 2), (-1, 5, 0, 5)])
+def test_monitor_rejects_empty_or_negative_roi(roi):
+    with pytest.raises(ValueError):
+        realtime_utils.HeartRateMonitor(roi, FPS, 0.8, 3.0, 64)
+
+
+def test_monitor_rejects_roi_out_of_the_frames(synthetic_frames):
+    monitor = realtime_utils.HeartRateMonitor((5000, 6000, 0, 10), FPS, 0.8, 3.0, 64)
+    with pytest.raises(ValueError):
+        monitor.push(synthetic_frames(length=1)[0])
+
+
+def test_measure_series(synthetic_frames):
+    source = video_utils.ArraySource(synthetic_frames(length=256), FPS)
+    readings = list(realtime_utils.measure_series(source, (8, 40, 8, 56), 0.8, 3.0, 128, 64))
+    assert [time for time, _ in readings] == pytest.approx([128 / FPS, 192 / FPS, 256 / FPS])
+    assert all(abs(bpm - BPM) <= 60 * FPS / 128 for _, bpm in readings)
+
+
+def test_measure_series_rejects_roi_out_of_the_video(synthetic_frames):
+    source = video_utils.ArraySource(synthetic_frames(length=8), FPS)
+    with pytest.raises(ValueError):
+        realtime_utils.measure_series(source, (5000, 6000, 0, 10), 0.8, 3.0, 4)
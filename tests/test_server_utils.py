@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the server_utils module: measuring heart beat rates on request.
+"""
+from __future__ import print_function, absolute_import, division
+
+import base64
+import json
+from StringIO import StringIO
+
+import numpy as np
+import pytest
+
+from heart_rate import server_utils, video_utils
+
+from conftest import BPM, FPS
+
+_REQUEST = {'id': 1, 'roi': [8, 40, 8, 56], 'min_freq': 0.8, 'max_freq': 3.0}
+
+
+@pytest.fixture
+def server():
+    server = server_utils.Server(workers=2)
+    yield server
+    server.close()
+
+
+def _frames_request(frames, **options):
+    return dict(_REQUEST, frames=base64.b64encode(frames.tobytes()), shape=list(frames.shape), fps=FPS, **options)
+
+
+@pytest.mark.parametrize('options', [{}, {'use_all_frames': True}, {'fft_length': 1024}])
+def test_path_and_frames_requests_give_the_same_rate(server, synthetic_video, options):
+    path = synthetic_video(length=200)
+    frames = np.array(list(video_utils.Video(path).frames()))  # The decoded frames, as the video is compressed
+    path_response = server.handle(dict(_REQUEST, path=path, **options))
+    frames_response = server.handle(_frames_request(frames, **options))
+    assert path_response['error'] is None and frames_response['error'] is None
+    assert path_response['bpm'] == pytest.approx(frames_response['bpm'])
+    assert abs(path_response['bpm'] - BPM) <= 60 * FPS / 128
+    assert path_response['id'] == frames_response['id'] == 1
+
+
+def test_single_channel_frames_request(server, synthetic_frames):
+    frames = synthetic_frames(length=128)
+    expected = server.handle(_frames_request(frames))['bpm']
+    response = server.handle(_frames_request(np.ascontiguousarray(frames[:, :, :, 1])))
+    assert response['error'] is None
+    assert response['bpm'] == expected
+
+
+@pytest.mark.parametrize('request_', [
+    [],
+    dict(_REQUEST),
+    dict(_REQUEST, roi='8, 40, 8, 56', path='video.avi'),
+    dict(_REQUEST, path='missing.avi'),
+    dict(_REQUEST, frames=base64.b64encode(b'\0' * 10), shape=[2, 2, 2, 3], fps=FPS),
+    dict(_REQUEST, frames=base64.b64encode(b'\0' * 24), shape=[2, 2, 2, 3], fps=FPS, channel='X'),
+])
+def test_invalid_requests_are_reported_in_the_response(server, request_):
+    response = server.handle(request_)
+    assert response['bpm'] is None
+    assert response['error']
+
+
+def test_serve_stream_answers_every_request(server, synthetic_frames):
+    frames = synthetic_frames(length=128)
+    requests = [json.dumps(dict(_frames_request(frames), id=index)) for index in range(4)] + ['', 'not json']
+    output = StringIO()
+    server.serve_stream(StringIO('\n'.join(requests) + '\n'), output)
+    responses = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(response['id'] for response in responses if response['error'] is None) == [0, 1, 2, 3]
+    assert len(set(response['bpm'] for response in responses if response['error'] is None)) == 1
+    assert [response['error'] for response in responses if response['id'] is None] == ["Invalid JSON request"]
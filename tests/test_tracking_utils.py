@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the tracking_utils module: moving the ROI along with the subject.
+"""
+from __future__ import print_function, absolute_import, division
+
+import cv2
+import numpy as np
+import pytest
+
+from heart_rate import heart_rate_utils, tracking_utils, video_utils
+
+from conftest import BPM, FPS, _make_frames
+
+_HEIGHT, _WIDTH = 120, 160
+
+_PATCH_SIZE = 32
+
+
+def _moving_patch_frames(length, patch, background=(200, 60, 40)):
+    """ Creates frames of the given (length, height, width, 3) patches over a plain background, the patch moving
+    one pixel right and half a pixel down per frame.
+
+    Returns:
+        tuple: The frames, and the (upper, left) position of the patch in each of them.
+    """
+    frames = np.empty((length, _HEIGHT, _WIDTH, 3), dtype=np.uint8)
+    frames[:] = background
+    positions = []
+    for index in range(length):
+        upper, left = 10 + index // 2, 10 + index
+        frames[index, upper:upper + _PATCH_SIZE, left:left + _PATCH_SIZE] = patch[index]
+        positions.append((upper, left))
+    return frames, positions
+
+
+def _textured_patches(length):
+    texture = np.random.RandomState(0).randint(0, 256, (_PATCH_SIZE // 8, _PATCH_SIZE // 8, 3)).astype(np.uint8)
+    texture = cv2.resize(texture, (_PATCH_SIZE, _PATCH_SIZE), interpolation=cv2.INTER_CUBIC)  # A smooth texture
+    return texture[np.newaxis].repeat(length, axis=0)
+
+
+def _assert_follows(tracker, frames, positions, fractions=(0, 0), tolerance=1):
+    for frame, (upper, left) in zip(frames, positions):
+        roi = tracker.update(frame)
+        assert abs(roi[0] - (upper + fractions[0])) <= tolerance and abs(roi[2] - (left + fractions[1])) <= tolerance
+
+
+@pytest.mark.parametrize('downscale', [1, 2, 4])
+def test_tracker_follows_a_moving_patch(downscale):
+    frames, positions = _moving_patch_frames(80, _textured_patches(80))
+    tracker = tracking_utils.RoiTracker(keyframe_interval=1000, downscale=downscale)
+    tracker.start((10, 10 + _PATCH_SIZE, 10, 10 + _PATCH_SIZE))
+    _assert_follows(tracker, frames, positions)
+    roi = tracker.roi(_HEIGHT, _WIDTH)
+    assert roi[1] - roi[0] == roi[3] - roi[2] == _PATCH_SIZE
+
+
+def test_tracker_follows_a_moving_patch_in_keyframes():
+    frames, positions = _moving_patch_frames(80, _textured_patches(80))
+    tracker = tracking_utils.RoiTracker(keyframe_interval=5, downscale=1)  # Refreshing the template 16 times
+    tracker.start((10, 10 + _PATCH_SIZE, 10, 10 + _PATCH_SIZE))
+    _assert_follows(tracker, frames, positions)
+
+
+def test_tracked_roi_stays_inside_the_frames():
+    tracker = tracking_utils.RoiTracker()
+    tracker.start((-20, 20, _WIDTH - 10, _WIDTH + 30))
+    assert tracker.update(np.zeros((_HEIGHT, _WIDTH, 3), dtype=np.uint8)) == (0, 40, _WIDTH - 40, _WIDTH)
+
+
+def test_skin_detector_finds_the_target_without_initial_roi():
+    shades = np.random.RandomState(0).uniform(0.85, 1.15, (_PATCH_SIZE // 8, _PATCH_SIZE // 8))
+    shades = cv2.resize(shades, (_PATCH_SIZE, _PATCH_SIZE), interpolation=cv2.INTER_CUBIC)
+    skin = (shades[:, :, np.newaxis] * (90, 120, 160)).astype(np.uint8)  # Shades of the same skin tone
+    frames, positions = _moving_patch_frames(80, skin[np.newaxis].repeat(80, axis=0))
+    tracker = tracking_utils.RoiTracker(detector='skin', keyframe_interval=20, downscale=2)
+    tracker.start()
+    quarter = _PATCH_SIZE // 4  # The ROI is the center of the detected skin region
+    _assert_follows(tracker, frames, positions, (quarter, quarter))
+    assert tracker.detections == 4
+
+
+def test_skin_detector_without_target_nor_initial_roi_fails():
+    tracker = tracking_utils.RoiTracker(detector='skin')
+    with pytest.raises(ValueError):
+        tracker.update(np.full((_HEIGHT, _WIDTH, 3), (200, 60, 40), dtype=np.uint8))
+
+
+def test_measure_with_tracker_follows_a_moving_pulsing_patch():
+    pulsing = _make_frames(length=100, height=_PATCH_SIZE, width=_PATCH_SIZE)
+    frames, _ = _moving_patch_frames(100, pulsing)
+    roi = (14, 10 + _PATCH_SIZE - 4, 14, 10 + _PATCH_SIZE - 4)
+    tracker = tracking_utils.RoiTracker(detector='skin', keyframe_interval=10)
+    bpm = heart_rate_utils.measure(video_utils.ArraySource(frames, FPS), roi, 0.8, 3.0, tracker=tracker)
+    assert abs(bpm - BPM) <= 60 * FPS / 64
+
+
+@pytest.mark.parametrize('arguments', [{'detector': 'hand'}, {'keyframe_interval': 0}, {'downscale': 1.5},
+                                       {'search_margin': 0}])
+def test_tracker_rejects_wrong_arguments(arguments):
+    with pytest.raises(ValueError):
+        tracking_utils.RoiTracker(**arguments)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" Tests of the video_utils module: decoding stores and frame sources.
+"""
+from __future__ import print_function, absolute_import, division
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from heart_rate import profiling_utils, video_utils
+
+
+def _stages(stats):
+    return stats.as_dict()['stages']
+
+
+@pytest.mark.parametrize('store', [None, 'array', 'memmap'])
+def test_stores_keep_the_streamed_frames(synthetic_video, tmpdir, store):
+    path = synthetic_video(length=20)
+    expected = np.array(list(video_utils.Video(path, streaming=True).frames()))
+    store_path = str(tmpdir.join('store.npy')) if store == 'memmap' else None
+    video = video_utils.Video(path, store=store, store_path=store_path)
+    assert video.length == 20
+    np.testing.assert_array_equal(np.array(list(video.frames())), expected)
+    np.testing.assert_array_equal(np.array(list(video.g)), expected[:, :, :, 1])
+
+
+def test_memmap_store_is_reopened_without_decoding(synthetic_video, tmpdir):
+    path = synthetic_video(length=20)
+    store_path = str(tmpdir.join('store.npy'))
+    first = video_utils.Video(path, store='memmap', store_path=store_path)
+    stats = profiling_utils.Stats()
+    second = video_utils.Video(path, store='memmap', store_path=store_path, stats=stats)
+    assert 'decode' not in _stages(stats)
+    assert _stages(stats)['store_open']['frames'] == 20
+    np.testing.assert_array_equal(np.array(list(second.frames())), np.array(list(first.frames())))
+
+
+def test_memmap_store_is_rebuilt_for_other_decoding_options(synthetic_video, tmpdir):
+    path = synthetic_video(length=20)
+    store_path = str(tmpdir.join('store.npy'))
+    whole = video_utils.Video(path, store='memmap', store_path=store_path)
+    expected = np.array(list(whole.frames()))
+    stats = profiling_utils.Stats()
+    green = video_utils.Video(path, store='memmap', store_path=store_path, channel='G', stats=stats)
+    assert _stages(stats)['decode']['frames'] == 20
+    np.testing.assert_array_equal(np.array(list(green.frames())), expected[:, :, :, 1])
+
+
+def test_interrupted_memmap_store_rebuild_is_not_trusted(synthetic_video, tmpdir, monkeypatch):
+    path = synthetic_video(length=20)
+    store_path = str(tmpdir.join('store.npy'))
+    expected = np.array(list(video_utils.Video(path, store='memmap', store_path=store_path).frames()))
+
+    decode_frames = video_utils.Video._decode_frames
+
+    def interrupted_decode_frames(self, video_capture):
+        for index, frame in enumerate(decode_frames(self, video_capture)):
+            if index == 5:
+                raise RuntimeError("Interrupted")
+            yield frame
+    monkeypatch.setattr(video_utils.Video, '_decode_frames', interrupted_decode_frames)
+    with pytest.raises(RuntimeError):
+        video_utils.Video(path, store='memmap', store_path=store_path, channel='G')
+    monkeypatch.undo()
+
+    stats = profiling_utils.Stats()
+    video = video_utils.Video(path, store='memmap', store_path=store_path, stats=stats)
+    assert 'decode' in _stages(stats)
+    np.testing.assert_array_equal(np.array(list(video.frames())), expected)
+    assert [name for name in tmpdir.listdir() if name.ext == '.tmp'] == []
+
+
+def test_memmap_store_is_not_shared_by_other_videos(synthetic_video, tmpdir):
+    path = synthetic_video(length=20)
+    other_path = str(tmpdir.join('other.avi'))
+    shutil.copy(path, other_path)
+    for video_path in (path, other_path):
+        os.utime(video_path, (1500000000, 1500000000))  # Same size and modification time
+    store_path = str(tmpdir.join('store.npy'))
+    video_utils.Video(path, store='memmap', store_path=store_path)
+    stats = profiling_utils.Stats()
+    video_utils.Video(other_path, store='memmap', store_path=store_path, stats=stats)
+    assert 'decode' in _stages(stats)